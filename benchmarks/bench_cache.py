@@ -0,0 +1,85 @@
+"""
+measures cache backends write / read latency and size bound enforcement with cost explorer like payloads.
+the redis backend is exercised against an in process redis stand in (no server required)
+
+usage: python -m benchmarks.bench_cache [entries] [max_size_mb]
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from benchmarks.payloads import results_by_time
+from costreport.app_config import CacheConfig
+from costreport.utils.cache_backends import DiskCacheBackend, SqliteCacheBackend, RedisCacheBackend
+from costreport.utils.cache_manager import RawDateCacheManager
+
+
+class RedisStandIn:
+    """
+    minimal in process stand in of redis-py client (get, set with expiry in milliseconds, delete)
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, None))
+            if expires_at and expires_at < time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, px=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + px / 1000 if px else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+def _bench(label, backend, payloads):
+    cache = RawDateCacheManager(SimpleNamespace(use_cache=True, cache=CacheConfig()), 'bench', backend=backend)
+
+    start = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        cache.save(f'key_{i}', payload)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = sum(1 for i in range(len(payloads)) if cache.get(f'key_{i}') is not None)
+    read_time = time.perf_counter() - start
+
+    print(f'{label:<8} entries={len(payloads)} write={write_time / len(payloads) * 1000:.2f}ms/entry '
+          f'read={read_time / len(payloads) * 1000:.2f}ms/entry hits={hits}')
+
+
+def run(entries=200, max_size_mb=5):
+    payloads = [json.dumps(results_by_time(days=30, keys=100, fill_rate=0.8, seed=i)) for i in range(entries)]
+    print(f'payload size={sum(len(p) for p in payloads) / len(payloads) / 1024:.0f}KB (uncompressed)')
+    max_size_bytes = max_size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as directory:
+        _bench('disk', DiskCacheBackend(os.path.join(directory, 'disk'), max_size_bytes), payloads)
+        _bench('sqlite', SqliteCacheBackend(os.path.join(directory, 'sqlite', 'cache.sqlite'), max_size_bytes),
+               payloads)
+        _bench('redis', RedisCacheBackend(RedisStandIn()), payloads)
+
+    # ttl per key class
+    config = SimpleNamespace(use_cache=True, cache=CacheConfig(ttl_seconds={'short_lived': 1}))
+    with tempfile.TemporaryDirectory() as directory:
+        config.cache.directory = directory
+        cache = RawDateCacheManager(config, 'short_lived')
+        cache.save('key', payloads[0])
+        time.sleep(1.1)
+        print(f'expired entry returned: {cache.get("key") is not None}')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:3]])
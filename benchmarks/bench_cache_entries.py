@@ -0,0 +1,80 @@
+"""
+compares disk usage and read time of cached cost explorer responses stored as plain json files (previous format)
+and as compressed cache entries (gzip, and zstd when zstandard package is installed)
+
+usage: python -m benchmarks.bench_cache_entries [entries]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.payloads import results_by_time
+from costreport.utils.cache_backends import DiskCacheBackend
+from costreport.utils.cache_manager import encode_entry, decode_entry
+
+# (name, days, keys, fill rate): daily services breakdown and a high cardinality tag breakdown
+PAYLOADS = [('services_90d', 90, 150, 0.6), ('tag_owner_30d', 30, 2000, 0.2)]
+
+
+def _codecs():
+    codecs = ['gzip']
+    try:
+        import zstandard  # noqa: F401
+        codecs.append('zstd')
+    except ImportError:
+        pass
+    return codecs
+
+
+def _plain(directory, payloads):
+    os.makedirs(directory)
+    for i, payload in enumerate(payloads):
+        with open(os.path.join(directory, f'key_{i}'), 'w') as f:
+            f.write(payload)
+
+    start = time.perf_counter()
+    for i in range(len(payloads)):
+        with open(os.path.join(directory, f'key_{i}'), 'r') as f:
+            json.loads(f.read())
+    return time.perf_counter() - start
+
+
+def _entries(directory, payloads, codec):
+    backend = DiskCacheBackend(directory)
+    for i, payload in enumerate(payloads):
+        backend.set('bench', f'key_{i}', encode_entry(payload, codec))
+
+    start = time.perf_counter()
+    for i in range(len(payloads)):
+        json.loads(decode_entry(backend.get('bench', f'key_{i}')))
+    return time.perf_counter() - start
+
+
+def _size(directory):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+
+
+def run(entries=20):
+    for name, days, keys, fill_rate in PAYLOADS:
+        payloads = [json.dumps(results_by_time(days, keys, fill_rate, seed=i)) for i in range(entries)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            plain_dir = os.path.join(directory, 'plain')
+            plain_time = _plain(plain_dir, payloads)
+            plain_size = _size(plain_dir)
+            print(f'{name:<14} plain  size={plain_size / entries / 1024:8.0f}KB/entry '
+                  f'read={plain_time / entries * 1000:6.1f}ms/entry')
+
+            for codec in _codecs():
+                codec_dir = os.path.join(directory, codec)
+                codec_time = _entries(codec_dir, payloads, codec)
+                codec_size = _size(codec_dir)
+                print(f'{name:<14} {codec:<6} size={codec_size / entries / 1024:8.0f}KB/entry '
+                      f'read={codec_time / entries * 1000:6.1f}ms/entry '
+                      f'(disk x{plain_size / codec_size:.1f} smaller, read x{plain_time / codec_time:.2f})')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,184 @@
+"""
+compares forecast and available tags requests of AwsCostClient through the previous aws CLI subprocess code path
+and through the current in process client calls. both paths are served by the synthetic cost explorer stub
+(no AWS access required):
+- before: an 'aws' executable stand in is spawned per call (an interpreter serving the stub response, a lower
+  bound of the aws CLI startup cost), forecast costs filter is written to a temporary file
+- after: AwsCostClient calls the stub client in process
+
+and counts cost explorer calls (result pages) of consecutive report collections (monthly, daily, services and
+3 tag reports) without and with fetch.merge_dimensions (see CostQueryPlanner) per organization size and key pairing
+(number of accounts / services a tag value is used by). queries are paired by stats of previous runs, so first run
+requests are not paired, and pairs which may save calls are executed once on following run
+
+usage: python -m benchmarks.bench_ce_calls [iterations]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+from benchmarks.payloads import SyntheticCostExplorer, collector_config
+from costreport.collection.aws.aws_collector import AwsCollector
+from costreport.collection.aws.cost_client import AwsCostClient
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.consts import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, REGION_NAME
+from costreport.utils.date_utils import get_time
+
+FORECAST_PERIOD = ('2021-01-15', '2021-02-01')
+TAGS_PERIOD = ('2021-01-01', '2021-02-01')
+
+# serves stub responses of 'aws ce get-cost-forecast' and 'aws ce get-tags' commands
+AWS_CLI_STAND_IN = """#!{python}
+import json
+import sys
+
+sys.path.insert(0, {root!r})
+from benchmarks.payloads import SyntheticCostExplorer
+
+args = sys.argv[1:]
+start, end = [p.split('=')[1] for p in args[args.index('--time-period') + 1].split(',')]
+stub = SyntheticCostExplorer()
+if args[1] == 'get-cost-forecast':
+    response = stub.get_cost_forecast(TimePeriod={{'Start': start, 'End': end}}, Metric='UNBLENDED_COST',
+                                      Granularity='MONTHLY')
+else:
+    response = stub.get_tags(TimePeriod={{'Start': start, 'End': end}})
+print(json.dumps(response))
+"""
+
+
+class LegacyAwsCostClient(AwsCostClient):
+    """
+    forecast and available tags requests through aws CLI subprocesses (previous implementation)
+    """
+
+    @staticmethod
+    def get_enriched_env():
+        p_env = os.environ.copy()
+        p_env['AWS_ACCESS_KEY_ID'] = AWS_ACCESS_KEY_ID or ''
+        p_env['AWS_SECRET_ACCESS_KEY'] = AWS_SECRET_ACCESS_KEY or ''
+        p_env['AWS_DEFAULT_REGION'] = REGION_NAME or ''
+
+        return p_env
+
+    def get_monthly_cost_forecast(self, start_date, end_date):
+        if self.config.filtered_costs:
+            costs_filter = {"Not": {"Dimensions": {"Key": "RECORD_TYPE", "Values": self.config.filtered_costs}}}
+            cost_filter_file = 'cost_filter.json'
+
+            with open(cost_filter_file, 'w') as f:
+                json.dump(costs_filter, f)
+
+        params = ['aws', 'ce', 'get-cost-forecast',
+                  '--metric', 'UNBLENDED_COST',
+                  '--time-period', f'Start={start_date},End={end_date}',
+                  '--granularity=MONTHLY']
+
+        if self.config.filtered_costs:
+            params.extend(['--filter', f'file://{cost_filter_file}'])
+
+        result = subprocess.Popen(params, env=self.get_enriched_env(), stdout=subprocess.PIPE).communicate()[0]
+        res_data = json.loads(result)
+
+        if self.config.filtered_costs:
+            os.remove(cost_filter_file)
+
+        return int(float(res_data['Total']['Amount']))
+
+    def get_available_tags(self, start_date, end_date):
+        params = ['aws', 'ce', 'get-tags', '--time-period', f'Start={start_date},End={end_date}']
+        result = subprocess.Popen(params, env=self.get_enriched_env(), stdout=subprocess.PIPE).communicate()[0]
+        return json.loads(result)['Tags']
+
+
+def _time_requests(client: AwsCostClient, iterations: int):
+    """
+    returns (forecast, tags, time) of forecast and available tags requests
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        forecast = client.get_monthly_cost_forecast(*FORECAST_PERIOD)
+        tags = client.get_available_tags(*TAGS_PERIOD)
+    return forecast, tags, time.perf_counter() - start
+
+
+def bench_requests(iterations):
+    with tempfile.TemporaryDirectory() as directory:
+        config = collector_config(directory)
+        config.filtered_costs = ['Credit', 'Refund']
+        cache = RawDateCacheManager(config, 'aws')
+
+        cli_path = os.path.join(directory, 'aws')
+        with open(cli_path, 'w') as f:
+            f.write(AWS_CLI_STAND_IN.format(python=sys.executable,
+                                            root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        os.chmod(cli_path, 0o755)
+
+        path, cwd = os.environ.get('PATH', ''), os.getcwd()
+        os.environ['PATH'] = f'{directory}{os.pathsep}{path}'
+        # previous implementation writes costs filter file to working directory
+        os.chdir(directory)
+        try:
+            before = _time_requests(LegacyAwsCostClient(config, cache, client=SyntheticCostExplorer()), iterations)
+        finally:
+            os.environ['PATH'] = path
+            os.chdir(cwd)
+
+        stub = SyntheticCostExplorer()
+        after = _time_requests(AwsCostClient(config, cache, client=stub), iterations)
+
+    if before[:2] != after[:2]:
+        raise Exception(f'forecast and tags differ between code paths: {before[:2]} != {after[:2]}')
+
+    calls = 2 * iterations
+    print(f'aws CLI subprocess  calls={calls} total={before[2]:.3f}s per_call={before[2] / calls * 1000:.1f}ms')
+    print(f'in process client   calls={calls} total={after[2]:.3f}s per_call={after[2] / calls * 1000:.2f}ms '
+          f'(stub calls={stub.calls})')
+    print(f'speedup x{before[2] / after[2]:.1f}')
+
+
+# (name, accounts, services, values per tag, key pairing)
+PLANNER_SCENARIOS = [('small organization', 5, 30, 10, 1),
+                     ('tag values of a single account', 10, 100, 100, 1),
+                     ('tag values of 3 accounts', 10, 100, 100, 3)]
+
+
+def count_report_calls(merge_dimensions: bool, accounts, services, tag_values, pair_keys, days=30, tags=3,
+                       runs=4) -> List[int]:
+    """
+    returns number of cost explorer calls of all cost and usage reports of consecutive runs
+    """
+    tag_names = [f'tag{t}' for t in range(tags)]
+    calls = []
+    with tempfile.TemporaryDirectory() as cache_directory:
+        for _ in range(runs):
+            stub = SyntheticCostExplorer(accounts=accounts, services=services, tag_values=tag_values, tags=tag_names,
+                                         pair_keys=pair_keys)
+            config = collector_config(cache_directory, tags=tag_names, days=days, merge_dimensions=merge_dimensions)
+            collector = AwsCollector(config, get_time(), RawDateCacheManager(config, 'aws'), ce_client=stub)
+            collector.plan_requests()
+            for name, query in collector._get_queries().items():
+                collector._request(name, query)
+            calls.append(stub.calls)
+
+    return calls
+
+
+def run(iterations=20):
+    bench_requests(iterations)
+
+    print('cost and usage calls of consecutive runs')
+    for name, *scenario in PLANNER_SCENARIOS:
+        separate = count_report_calls(False, *scenario)
+        merged = count_report_calls(True, *scenario)
+        print(f'    {name:<32} merge_dimensions=false {separate}  merge_dimensions=true {merged}')
+        if sum(merged) > sum(separate) + max(separate):
+            raise Exception(f'{name}: paired queries increase number of calls')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,63 @@
+"""
+generates a synthetic gzip csv cost and usage report (CUR) file and measures CurCollector
+aggregation time and peak memory (tracemalloc). no network access is required
+
+usage: python -m benchmarks.bench_cur [rows] [chunk_rows]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from costreport.collection.cur.cur_collector import CurCollector
+from costreport.utils.date_utils import get_days_back, get_time
+
+
+def write_cur_file(path, rows, days=60, accounts=20, services=150, tag_values=1000):
+    rnd = np.random.default_rng(0)
+    dates = [get_days_back(d).isoformat() + 'T00:00:00Z' for d in range(1, days + 1)]
+    pd.DataFrame({
+        'identity/LineItemId': np.arange(rows).astype(str),
+        'lineItem/UsageStartDate': rnd.choice(dates, rows),
+        'lineItem/UsageAccountId': rnd.choice([f'{100000000000 + a}' for a in range(accounts)], rows),
+        'lineItem/LineItemType': rnd.choice(['Usage', 'Usage', 'Usage', 'Credit'], rows),
+        'product/ProductName': rnd.choice([f'Service {s}' for s in range(services)], rows),
+        'lineItem/UnblendedCost': rnd.uniform(0, 2, rows).round(6),
+        'resourceTags/user:env': rnd.choice(['prod', 'staging', 'dev', None], rows),
+        'resourceTags/user:owner': rnd.choice([f'owner-{t}' for t in range(tag_values)], rows),
+    }).to_csv(path, index=False, compression='gzip')
+
+
+def run(rows=2000000, chunk_rows=200000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cur-00001.csv.gz')
+        write_cur_file(path, rows)
+
+        config = SimpleNamespace(
+            accounts={}, tag_report=None, filtered_costs=['Credit'], resource_tags=['env', 'owner'],
+            cur=SimpleNamespace(directory=directory, chunk_rows=chunk_rows),
+            periods=SimpleNamespace(monthly_report_months_back=2, daily_report_days_back=30,
+                                    services_report_days_back=30, tags_report_days_back=30))
+        collector = CurCollector(config, get_time(), None)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        collector.plan_requests()
+        frames = [collector.get_daily_report(), collector.get_monthly_report(), collector.get_services_report(),
+                  collector.get_tag_report('env'), collector.get_tag_report('owner')]
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'rows={rows} file_size={os.path.getsize(path) / 2 ** 20:.1f}MB chunk_rows={chunk_rows}')
+        print(f'aggregation time={elapsed:.2f}s peak_memory={peak / 2 ** 20:.1f}MB '
+              f'frames={[f.shape for f in frames]}')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:3]])
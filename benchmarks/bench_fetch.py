@@ -0,0 +1,66 @@
+"""
+compares serial and concurrent DataProvider fetch wall clock time using a stubbed collector
+with artificial per request latency (no AWS access required)
+
+usage: python -m benchmarks.bench_fetch [latency_seconds] [number_of_tags]
+"""
+import sys
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+
+from costreport.collection.collector import Collector
+from costreport.data_provider import DataProvider
+from costreport.utils.date_utils import get_time
+
+
+class SlowCollector(Collector):
+    def __init__(self, latency):
+        super().__init__(None, get_time(), None)
+        self.latency = latency
+
+    def _frame(self):
+        time.sleep(self.latency)
+        return pd.DataFrame.from_dict({'dates': ['2021-01-01', '2021-01-02'], 'acc': [1.0, 2.0]})
+
+    def get_current_month_forecast(self):
+        time.sleep(self.latency)
+        return pd.DataFrame.from_dict({'values': [100]})
+
+    def get_daily_report(self):
+        return self._frame()
+
+    def get_monthly_report(self):
+        return self._frame()
+
+    def get_services_report(self):
+        return self._frame()
+
+    def get_available_tags(self):
+        time.sleep(self.latency)
+        return []
+
+    def get_tag_report(self, tag_name):
+        return self._frame()
+
+
+def _config(max_workers, tags):
+    return SimpleNamespace(resource_tags=tags,
+                           fetch=SimpleNamespace(max_workers=max_workers, timeout_seconds=60))
+
+
+def run(latency=0.2, tags_count=20):
+    tags = [f'tag{i}' for i in range(tags_count)]
+
+    for label, workers in [('serial', 1), ('concurrent', 8), ('concurrent', 16)]:
+        provider = DataProvider(get_time(), _config(workers, tags), SlowCollector(latency))
+        start = time.perf_counter()
+        provider.generate()
+        print(f'{label:<12} workers={workers:<3} requests={5 + tags_count:<4} '
+              f'wall={time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    run(latency=float(sys.argv[1]) if len(sys.argv) > 1 else 0.2,
+        tags_count=int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,82 @@
+"""
+compares chart divs rendering through plotly figure objects (validated, plotly json encoder) against figure json
+generated directly from series arrays (orjson when installed, json otherwise). charts are rendered serially.
+fails if figures (Plotly.newPlot data and layout arguments) differ between the paths
+
+usage: python -m benchmarks.bench_figures [charts] [series] [days]
+"""
+import json
+import re
+import sys
+import time
+
+import numpy as np
+
+from costreport.model import DataSeries, ItemDefinition
+from costreport.report_generators import figure_json
+from costreport.report_generators.html_generator import ChartPlotter
+from costreport.utils.consts import ItemType
+
+NEW_PLOT_ARGS = re.compile(r'Plotly\.newPlot\(\s*"[^"]+",\s*(.*),\s*\{"responsive": true\}\s*\)', re.S)
+
+
+def item_defs(charts, series, days):
+    rnd = np.random.default_rng(0)
+    dates = np.array([f'2021-01-{d % 28 + 1:02d}' for d in range(days)], dtype=object)
+    chart_types = [ItemType.LINE, ItemType.BAR, ItemType.STACK]
+    defs = []
+    for c in range(charts):
+        values = rnd.uniform(0, 100, (series, days)).round(1)
+        # missing values are serialized as null
+        values[0, 0] = np.nan
+        defs.append(ItemDefinition(f'chart {c}', chart_types[c % len(chart_types)], dates,
+                                   [DataSeries(f'series {s}', values[s]) for s in range(series)]))
+
+    defs.append(ItemDefinition('pie', ItemType.PIE, [f'service {s}' for s in range(7)],
+                               [DataSeries('values', rnd.uniform(0, 1000, 7).round())]))
+    return defs
+
+
+def figure(div: str):
+    """
+    returns (data, layout) passed to Plotly.newPlot
+    """
+    data, layout = json.loads(f'[{NEW_PLOT_ARGS.search(div).group(1)}]')
+    return data, layout
+
+
+def render(plotter: ChartPlotter, defs):
+    start = time.perf_counter()
+    divs = [plotter.get_div(d) for d in defs]
+    return divs, time.perf_counter() - start
+
+
+def run(charts=20, series=100, days=90):
+    defs = item_defs(charts, series, days)
+    # template serialization and plotly imports are not measured
+    figure_json.template_json('plotly_dark')
+    ChartPlotter(validate_figures=True).get_div(defs[-1])
+
+    validated, validated_time = render(ChartPlotter(validate_figures=True), defs)
+    fast, fast_time = render(ChartPlotter(), defs)
+
+    encoder, figure_json.orjson = figure_json.orjson, None
+    try:
+        fast_json, fast_json_time = render(ChartPlotter(), defs)
+    finally:
+        figure_json.orjson = encoder
+
+    print(f'charts={charts} series={series} days={days}')
+    for name, divs, elapsed in [('plotly figures (validated)', validated, validated_time),
+                                (f'figure json ({"orjson" if encoder else "orjson not installed"})', fast, fast_time),
+                                ('figure json (json)', fast_json, fast_json_time)]:
+        print(f'{name:<36} time={elapsed:.2f}s size={sum(map(len, divs)) / 2 ** 20:.1f}MB')
+
+    for d, expected, *divs in zip(defs, validated, fast, fast_json):
+        for div in divs:
+            if figure(div) != figure(expected):
+                raise Exception(f'{d.item_name} figure differs from plotly figure')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:4]])
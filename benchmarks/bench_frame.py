@@ -0,0 +1,70 @@
+"""
+compares the previous list based AwsCollector.create_data_frame_from_results implementation
+with the vectorized one on synthetic payloads
+
+usage: python -m benchmarks.bench_frame [days] [keys]
+"""
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.payloads import results_by_time, collector_config, SyntheticCostExplorer
+from costreport.collection.aws.aws_collector import AwsCollector
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.date_utils import get_time
+
+
+def legacy_create_data_frame_from_results(config, cost_results):
+    columns = ['dates']
+    data_set = {'dates': []}
+
+    for i, v in enumerate(cost_results):
+        start = v['TimePeriod']['Start']
+        data_set['dates'].append(start)
+        current_date_columns = ['dates']
+
+        if v['Groups']:
+            for g in v['Groups']:
+                key = g['Keys'][0]
+                if config.accounts and key in config.accounts:
+                    key = config.accounts[key]
+
+                if not data_set.get(key):
+                    columns.append(key)
+                    data_set[key] = [] if i == 0 else [0] * i
+
+                current_date_columns.append(key)
+                amount = float(g['Metrics']['UnblendedCost']['Amount'])
+                data_set[key].append(round(amount, 1))
+
+        missing = [c for c in columns if c not in current_date_columns]
+        for m in missing:
+            data_set[m].append(0)
+
+    return pd.DataFrame.from_dict(data_set)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(days=365, keys=500):
+    config = collector_config(tempfile.gettempdir(), accounts={'key-0': 'Production', 'key-1': 'Development'})
+    collector = AwsCollector(config, get_time(), RawDateCacheManager(config, 'aws'), ce_client=SyntheticCostExplorer())
+
+    for fill_rate in [1.0, 0.3]:
+        results = results_by_time(days, keys, fill_rate)
+        legacy, legacy_time = _timed(legacy_create_data_frame_from_results, config, results)
+        vectorized, vectorized_time = _timed(collector.create_data_frame_from_results, results)
+        pd.testing.assert_frame_equal(legacy, vectorized, check_dtype=False)
+        print(f'days={days} keys={keys} fill={fill_rate} legacy={legacy_time:.3f}s '
+              f'vectorized={vectorized_time:.3f}s speedup=x{legacy_time / vectorized_time:.1f}')
+
+
+if __name__ == '__main__':
+    run(days=int(sys.argv[1]) if len(sys.argv) > 1 else 365,
+        keys=int(sys.argv[2]) if len(sys.argv) > 2 else 500)
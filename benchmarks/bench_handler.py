@@ -0,0 +1,141 @@
+"""
+invokes the serverless handler locally with stubbed cost explorer and s3 clients (no AWS access required):
+    cold     - first invocation (container state created by init)
+    warm     - following invocation, not bounded by remaining time
+    deadline - invocation whose remaining time runs out while optional reports (services, tags) are fetched
+    expired  - invocation whose remaining time is shorter than serverless reserve_seconds
+
+fails if a report is not uploaded, if the deadline invocation does not skip optional reports, if skipped
+requests keep requesting pages after the invocation returned or if the expired invocation is not reported
+as deadline exceeded
+
+usage: python -m benchmarks.bench_handler [fetch_seconds] [latency_ms]
+"""
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.payloads import SyntheticCostExplorer
+from costreport import handler
+from costreport.app_config import AppConfig, CacheConfig, Report, S3Destination, ServerlessConfig, ReportType, \
+    ReportDestination
+
+BUCKET_NAME = 'cost-reports'
+
+
+class S3Stub:
+    """
+    minimal in process stand in of boto3 s3 client (buckets, put and multipart uploads)
+    """
+
+    def __init__(self):
+        self.buckets = set()
+        self.objects = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': name} for name in self.buckets]}
+
+    def create_bucket(self, Bucket):
+        self.buckets.add(Bucket)
+
+    def put_object(self, Bucket, Key, Body):
+        with self._lock:
+            self.objects[(Bucket, Key)] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        with self._lock:
+            upload_id = str(len(self._uploads))
+            self._uploads[upload_id] = []
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        with self._lock:
+            self._uploads[UploadId].append(Body)
+        return {'ETag': f'{UploadId}-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self._lock:
+            self.objects[(Bucket, Key)] = b''.join(self._uploads.pop(UploadId))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+
+
+class InvocationContext:
+    """
+    function invocation context stand in
+    """
+
+    def __init__(self, remaining_seconds: float):
+        self.deadline = time.monotonic() + remaining_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(max(0.0, self.deadline - time.monotonic()) * 1000)
+
+
+def _get_config(cache_directory: str, reserve_seconds: float) -> AppConfig:
+    config = AppConfig()
+    config.resource_tags = ['tag0', 'tag1', 'tag2']
+    config.use_cache = False
+    config.incremental_fetch = False
+    config.cost_store = None
+    config.metrics_file = None
+    config.metrics_prometheus_file = None
+    config.variants = []
+    config.cache = CacheConfig(directory=cache_directory)
+    config.serverless = ServerlessConfig(reserve_seconds=reserve_seconds)
+    # pages are bound by stub latency only, so required requests do not queue behind tag pages
+    config.fetch.requests_per_second = 1000
+    config.destinations = {ReportDestination.S3.value: S3Destination(BUCKET_NAME, 'reports')}
+    config.reports = [Report(ReportType.HTML.value, {'template_name': 'default.html', 'render_cache_mb': 0})]
+    return config
+
+
+def _invoke(name: str, s3_stub: S3Stub, context=None, uploads=1):
+    uploaded = len(s3_stub.objects)
+    result = handler.handler({}, context)
+    if len(s3_stub.objects) != uploaded + uploads:
+        raise Exception(f'{name} invocation uploaded {len(s3_stub.objects) - uploaded} reports, expected {uploads}')
+
+    print(f'{name:<9} duration={result["duration_seconds"]:.2f}s cold_start={result["cold_start"]} '
+          f'deadline_exceeded={result["deadline_exceeded"]} skipped_reports={result["skipped_reports"]}')
+    return result
+
+
+def run(fetch_seconds=1.0, latency_ms=50):
+    reserve_seconds = 1.0
+    # tag reports are paginated (tag values x days groups), so they are not fetched within fetch_seconds
+    ce_stub = SyntheticCostExplorer(accounts=10, services=100, tag_values=2000, tags=['tag0', 'tag1', 'tag2'],
+                                    latency_seconds=latency_ms / 1000)
+    s3_stub = S3Stub()
+
+    with tempfile.TemporaryDirectory() as directory:
+        handler.init(_get_config(directory, reserve_seconds), ce_client=ce_stub, s3_client=s3_stub)
+
+        for name in ['cold', 'warm']:
+            result = _invoke(name, s3_stub)
+            if result['skipped_reports']:
+                raise Exception(f'{name} invocation skipped reports')
+
+        result = _invoke('deadline', s3_stub, InvocationContext(reserve_seconds + fetch_seconds))
+        if not result['skipped_reports']:
+            raise Exception('deadline invocation did not skip optional reports')
+
+        # pages requested by skipped requests which were in flight when the invocation returned
+        calls = ce_stub.calls
+        time.sleep(10 * latency_ms / 1000)
+        print(f'cost explorer calls after deadline invocation returned: {ce_stub.calls - calls}')
+        if ce_stub.calls - calls > len(result['skipped_reports']):
+            raise Exception('skipped requests keep requesting pages')
+
+        result = _invoke('expired', s3_stub, InvocationContext(reserve_seconds / 2), uploads=0)
+        if not result['deadline_exceeded'] or result['executed']:
+            raise Exception('expired invocation is not reported as deadline exceeded')
+
+
+if __name__ == '__main__':
+    run(*[float(a) for a in sys.argv[1:3]])
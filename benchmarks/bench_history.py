@@ -0,0 +1,48 @@
+"""
+measures report data load time from cost store as accumulated daily history grows (1 to 5 years).
+reports time windows are fixed, so load time should stay flat as history grows
+
+usage: python -m benchmarks.bench_history [keys] [report_days]
+"""
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.payloads import results_by_time, collector_config, SyntheticCostExplorer
+from costreport.collection.aws.aws_collector import AwsCollector
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.cost_store import ColumnarCostStore
+from costreport.utils.date_utils import get_time
+
+
+def run(keys=100, report_days=90):
+    config = collector_config(tempfile.gettempdir())
+    collector = AwsCollector(config, get_time(), RawDateCacheManager(config, 'aws'), ce_client=SyntheticCostExplorer())
+    start_date = date(2020, 1, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ColumnarCostStore(directory, 'DAILY', [])
+        stored_days = 0
+
+        for years in range(1, 6):
+            days = years * 365
+            # append newly closed days (as scheduled runs do)
+            results = results_by_time(days, keys, seed=years)[stored_days:]
+            store.write('SERVICE', start_date + timedelta(days=stored_days), start_date + timedelta(days=days),
+                        collector.results_to_long(results, 'SERVICE'))
+            stored_days = days
+
+            end_date = start_date + timedelta(days=days)
+            report_start = end_date - timedelta(days=report_days)
+            dates = [(report_start + timedelta(days=d)).isoformat() for d in range(report_days)]
+
+            start = time.perf_counter()
+            collector.long_to_frame(dates, [store.read('SERVICE', report_start, end_date)])
+            elapsed = time.perf_counter() - start
+
+            print(f'history={years}y ({days} days x {keys} keys) report_days={report_days} load={elapsed * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:3]])
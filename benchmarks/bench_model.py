@@ -0,0 +1,116 @@
+"""
+compares memory and time of report chart items built with the previous representation (dict backed
+DataSeries / ItemDefinition, dates major report frame, per value rounding) against the compact one
+(slotted classes, series stored as contiguous views of the report frame cost block, shared date index).
+
+measured per representation (tracemalloc):
+    build    - long format records to report frame and chart item definition
+    retained - memory held by report frame and item definition after build
+    hand-off - memory copied to pass series as contiguous arrays to the chart serializer
+
+usage: python -m benchmarks.bench_model [days] [series]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from costreport.collection.collector import Collector, AMOUNT_DECIMALS
+from costreport.report_generators.html_generator import HTMLReportGenerator
+from costreport.utils.consts import ItemType
+
+
+class LegacyDataSeries:
+    def __init__(self, name, values):
+        self.name = name
+        self.values = values
+
+
+class LegacyItemDefinition:
+    def __init__(self, item_name, item_type, x, y=None, group=None):
+        self.item_name = item_name
+        self.chart_type = item_type
+        self.x = x
+        self.y = y
+        self.group = group
+
+
+def legacy_pivot_long_format(dates, date_indices, keys, amounts):
+    amounts = [round(a, AMOUNT_DECIMALS) for a in amounts]
+    key_codes, columns = pd.factorize(pd.Series(keys, dtype=object))
+    values = np.zeros((len(dates), len(columns)))
+    np.add.at(values, (np.asarray(date_indices, dtype=np.intp), key_codes), np.asarray(amounts, dtype=float))
+
+    dataframe = pd.DataFrame(values, columns=columns)
+    dataframe.insert(0, 'dates', dates)
+    return dataframe
+
+
+def legacy_build(records):
+    dataframe = legacy_pivot_long_format(*records)
+    columns = [c for c in dataframe.columns if c != 'dates']
+    item_def = LegacyItemDefinition('tag', ItemType.LINE, dataframe['dates'],
+                                    [LegacyDataSeries(c, dataframe[c].values) for c in columns])
+    return dataframe, item_def
+
+
+def compact_build(records):
+    dataframe = Collector.pivot_long_format(*records, decimals=AMOUNT_DECIMALS)
+    generator = HTMLReportGenerator.__new__(HTMLReportGenerator)
+    return dataframe, generator.create_item_definition_from_df(dataframe, 'tag', ItemType.LINE)
+
+
+def hand_off(item_def):
+    return [np.ascontiguousarray(series.values) for series in item_def.y]
+
+
+def _measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+
+def _objects_size(item_def) -> int:
+    objects = [item_def] + list(item_def.y)
+    return sum(sys.getsizeof(o) + (sys.getsizeof(o.__dict__) if hasattr(o, '__dict__') else 0) for o in objects)
+
+
+def records(days, series, seed=0):
+    rnd = np.random.default_rng(seed)
+    dates = pd.date_range('2021-01-01', periods=days).strftime('%Y-%m-%d').tolist()
+    date_indices = np.repeat(np.arange(days), series).tolist()
+    keys = [f'value-{s}' for s in range(series)] * days
+    amounts = rnd.uniform(0, 100, days * series).tolist()
+    return dates, date_indices, keys, amounts
+
+
+def run(days=365, series=1000):
+    data = records(days, series)
+    print(f'days={days} series={series}')
+
+    frames = {}
+    for name, build in [('legacy', legacy_build), ('compact', compact_build)]:
+        (dataframe, item_def), build_time, retained, build_peak = _measure(build, data)
+        arrays, _, hand_off_bytes, _ = _measure(hand_off, item_def)
+        copies = sum(not np.shares_memory(a, s.values) for a, s in zip(arrays, item_def.y))
+        frames[name] = dataframe
+
+        print(f'{name:<8} build={build_time * 1000:7.1f}ms peak={build_peak / 2 ** 20:6.1f}MB '
+              f'retained={retained / 2 ** 20:6.1f}MB objects={_objects_size(item_def) / 1024:6.1f}KB '
+              f'hand-off={hand_off_bytes / 2 ** 20:6.1f}MB ({copies} series copied)')
+        del dataframe, item_def, arrays
+
+    pd.testing.assert_frame_equal(frames['legacy'], frames['compact'])
+
+
+if __name__ == '__main__':
+    run(days=int(sys.argv[1]) if len(sys.argv) > 1 else 365,
+        series=int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,86 @@
+"""
+measures peak memory (tracemalloc) of writing a large report to local and S3 destinations:
+- previous behavior: report rendered to a single string, written locally and to a temporary file for S3 upload
+- streaming: report chunks are written to the local file and to S3 multipart upload as rendered
+S3 is replaced by an in memory stub which only counts received bytes (no AWS access required)
+
+usage: python -m benchmarks.bench_output [charts] [chart_kb]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from jinja2 import Environment
+
+from costreport.app_config import LocalDestination, S3Destination
+from costreport.output_manager import OutputManager
+from costreport.s3_client import S3ObjectWriter
+
+TEMPLATE = '<html><body>{% for k, v in items.items() %}<div id="{{ k }}">{{ v }}</div>{% endfor %}</body></html>'
+
+
+class StubS3Client:
+    def __init__(self):
+        self.received = 0
+
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'stub'}
+
+    def upload_part(self, Body, **kwargs):
+        self.received += len(Body)
+        return {'ETag': 'stub'}
+
+    def put_object(self, Body, **kwargs):
+        self.received += len(Body)
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def upload_file(self, file_name, bucket_name, object_name):
+        with open(file_name, 'rb') as f:
+            self.received += len(f.read())
+
+    def open_writer(self, bucket_name, object_name):
+        return S3ObjectWriter(self, bucket_name, object_name)
+
+
+def _measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(charts=30, chart_kb=1024):
+    template = Environment().from_string(TEMPLATE)
+    items = {f'chart{i}': 'x' * chart_kb * 1024 for i in range(charts)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        destinations = {'local': LocalDestination(directory), 's3': S3Destination('bucket', None)}
+
+        def legacy():
+            report = template.render(items=items)
+            for name in ['local.html', 's3_tmp.html']:
+                with open(os.path.join(directory, name), 'w') as f:
+                    f.write(report)
+            StubS3Client().upload_file(os.path.join(directory, 's3_tmp.html'), 'bucket', 'key')
+
+        def streaming():
+            stream = template.stream(items=items)
+            stream.enable_buffering(size=64)
+            OutputManager(datetime.now(), destinations, StubS3Client()).output(iter(stream))
+
+        for label, func in [('single string', legacy), ('streaming', streaming)]:
+            elapsed, peak = _measure(func)
+            print(f'{label:<14} report={charts * chart_kb / 1024:.0f}MB time={elapsed:.2f}s '
+                  f'peak_memory={peak / 2 ** 20:.1f}MB')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,45 @@
+"""
+compares serial chart rendering with plotly.js embedded in every chart (previous behavior)
+against process pool rendering with plotly.js included once per report
+
+usage: python -m benchmarks.bench_render [charts] [series] [days]
+"""
+import sys
+import time
+
+import numpy as np
+
+from costreport.model import DataSeries, ItemDefinition
+from costreport.report_generators.html_generator import ChartPlotter, LayoutManager, get_plotlyjs_script
+from costreport.utils.consts import ItemType
+
+
+def item_defs(charts, series, days):
+    rnd = np.random.default_rng(0)
+    dates = [f'2021-01-{d % 28 + 1:02d}' for d in range(days)]
+    return [ItemDefinition(f'chart {c}', ItemType.LINE, dates,
+                           [DataSeries(f'series {s}', rnd.uniform(0, 100, days).round(1)) for s in range(series)],
+                           group='tags')
+            for c in range(charts)]
+
+
+def run(charts=30, series=20, days=30):
+    defs = item_defs(charts, series, days)
+
+    plotter = ChartPlotter(include_plotlyjs=True)
+    start = time.perf_counter()
+    legacy_size = sum(len(plotter.get_div(d)) for d in defs)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    layout = LayoutManager(defs, {'template_name': 'default.html', 'render_cache_mb': 0})
+    size = sum(len(div) for div in layout._render_divs()) + len(get_plotlyjs_script('inline'))
+    render_time = time.perf_counter() - start
+
+    print(f'charts={charts} series={series} days={days}')
+    print(f'serial, plotly.js per chart  time={legacy_time:.2f}s size={legacy_size / 2 ** 20:.1f}MB')
+    print(f'process pool, plotly.js once time={render_time:.2f}s size={size / 2 ** 20:.1f}MB')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:4]])
@@ -0,0 +1,46 @@
+"""
+measures charts rendering (figure json and validated figures) with the render cache (see RenderCache)
+of consecutive runs:
+    cold     - empty cache, all charts are rendered
+    warm     - same charts data, all charts are served from cache
+    changed  - data of some of the charts changed (e.g. last day cost of current month charts)
+
+usage: python -m benchmarks.bench_render_cache [charts] [series] [days] [changed]
+"""
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_figures import item_defs
+from costreport.report_generators.html_generator import LayoutManager
+
+
+def render(defs, directory, validate_figures):
+    layout = LayoutManager(defs, {'template_name': 'default.html', 'render_cache_dir': directory,
+                                  'render_workers': 1, 'validate_figures': validate_figures})
+    start = time.perf_counter()
+    divs = layout._render_divs()
+    return divs, time.perf_counter() - start, layout.render_cache
+
+
+def run(charts=30, series=50, days=90, changed=3):
+    print(f'charts={charts} series={series} days={days} changed={changed}')
+    for validate_figures in [False, True]:
+        defs = item_defs(charts, series, days)
+        print(f'validate_figures={validate_figures}')
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ['cold', 'warm', 'changed']:
+                if name == 'changed':
+                    for item_def in defs[:changed]:
+                        item_def.y[0].values[-1] += 1
+
+                divs, elapsed, cache = render(defs, directory, validate_figures)
+                print(f'    {name:<8} time={elapsed * 1000:8.1f}ms hits={cache.hits} misses={cache.misses}')
+
+            # divs served from cache get unique ids
+            if len(set(divs)) != len(divs):
+                raise Exception('duplicate divs')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:5]])
@@ -0,0 +1,123 @@
+"""
+cold start (startup) benchmark. every scenario is executed in a new interpreter with 'python -X importtime'
+and fails if:
+- a module which should be imported lazily (only by the stage requiring it) is imported
+- total import time exceeds the scenario budget (best of repeats. scale budgets with --budget-factor
+  on slower machines)
+
+scenarios:
+    validate        - 'run.py --validate' (environment and configuration validation only)
+    executors       - executors import (report pipeline modules, before any stage is executed)
+    html_generator  - html report generator import (before report is rendered)
+
+usage: python -m benchmarks.bench_startup [--repeat 5] [--budget-factor 1.0] [--top 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, interpreter arguments, modules which should not be imported, import time budget in milliseconds).
+# pyarrow is not checked once pandas is imported (pandas imports it when installed)
+SCENARIOS = [
+    ('validate', ['run.py', '--validate'],
+     ['boto3', 'botocore', 'pandas', 'numpy', 'pyarrow', 'plotly', 'jinja2', 'croniter'], 150),
+    ('executors', ['-c', 'import costreport.executors'],
+     ['boto3', 'plotly', 'jinja2', 'croniter'], 1500),
+    ('html_generator', ['-c', 'import costreport.report_generators.html_generator'],
+     ['boto3', 'botocore', 'plotly', 'jinja2', 'croniter'], 1200),
+]
+
+# dummy credentials, validation does not access AWS
+VALIDATE_ENV = {'AWS_ACCESS_KEY_ID': 'benchmark', 'AWS_SECRET_ACCESS_KEY': 'benchmark', 'REGION_NAME': 'us-east-1'}
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """
+    returns (module, self us, cumulative us) of top level imports in 'python -X importtime' output
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # nested imports are indented
+        if not name[1:].startswith(' '):
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    return imports
+
+
+def run_scenario(args: List[str]) -> Tuple[List[Tuple[str, int, int]], List[str]]:
+    """
+    returns top level imports and names of all imported modules
+    """
+    env = dict(os.environ, **VALIDATE_ENV)
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f'{" ".join(args)} failed: {result.stderr.strip().splitlines()[-1]}')
+
+    modules = [line.split('|')[2].strip() for line in result.stderr.splitlines()
+               if line.startswith('import time:') and 'imported package' not in line]
+    return parse_importtime(result.stderr), modules
+
+
+def check_scenario(name: str, args: List[str], lazy_modules: List[str], budget_ms: float, repeat: int,
+                   top: int) -> List[str]:
+    """
+    returns scenario failures
+    """
+    best_ms = None
+    best_imports = []
+    modules = []
+    for _ in range(repeat):
+        try:
+            imports, modules = run_scenario(args)
+        except Exception as e:
+            print(f'{name:<16} FAILED')
+            return [f'{name}: {str(e)}']
+
+        total_ms = sum(cumulative for _, _, cumulative in imports) / 1000
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_imports = total_ms, imports
+
+    failures = []
+    loaded = sorted(set(modules) & set(lazy_modules))
+    if loaded:
+        failures.append(f'{name}: lazily loaded modules were imported: {", ".join(loaded)}')
+
+    if best_ms > budget_ms:
+        failures.append(f'{name}: import time {best_ms:.0f}ms exceeds budget of {budget_ms:.0f}ms')
+
+    print(f'{name:<16} {best_ms:8.1f}ms (budget {budget_ms:.0f}ms){"  FAILED" if failures else ""}')
+    for module, _, cumulative in sorted(best_imports, key=lambda i: i[2], reverse=True)[:top]:
+        print(f'    {module:<50} {cumulative / 1000:8.1f}ms')
+
+    return failures
+
+
+def run(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='cold start import time benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-factor', type=float, default=1.0, help='multiplies scenarios budgets')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest top level imports printed')
+    args = parser.parse_args(argv)
+
+    failures = []
+    for name, scenario_args, lazy_modules, budget_ms in SCENARIOS:
+        failures += check_scenario(name, scenario_args, lazy_modules, budget_ms * args.budget_factor,
+                                   args.repeat, args.top)
+
+    for failure in failures:
+        print(failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,47 @@
+"""
+compares loading cost history from cached raw json results with loading it from the columnar cost store
+
+usage: python -m benchmarks.bench_store [days] [keys]
+"""
+import json
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.payloads import results_by_time, collector_config, SyntheticCostExplorer
+from costreport.collection.aws.aws_collector import AwsCollector
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.cost_store import ColumnarCostStore
+from costreport.utils.date_utils import get_time
+
+
+def run(days=3 * 365, keys=200):
+    config = collector_config(tempfile.gettempdir())
+    collector = AwsCollector(config, get_time(), RawDateCacheManager(config, 'aws'), ce_client=SyntheticCostExplorer())
+    results = results_by_time(days, keys)
+    raw = json.dumps(results)
+    start_date = date(2020, 1, 1)
+    end_date = start_date + timedelta(days=days)
+
+    start = time.perf_counter()
+    collector.create_data_frame_from_results(json.loads(raw))
+    json_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ColumnarCostStore(directory, 'DAILY', [])
+        store.write('SERVICE', start_date, end_date, collector.results_to_long(results, 'SERVICE'))
+
+        start = time.perf_counter()
+        rows = store.read('SERVICE', start_date, end_date)
+        dates = [(start_date + timedelta(days=d)).isoformat() for d in range(days)]
+        collector.long_to_frame(dates, [rows])
+        store_time = time.perf_counter() - start
+
+    print(f'days={days} keys={keys} json_size={len(raw) / 2 ** 20:.1f}MB')
+    print(f'json results      load={json_time:.3f}s')
+    print(f'columnar store    load={store_time:.3f}s')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:3]])
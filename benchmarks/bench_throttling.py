@@ -0,0 +1,135 @@
+"""
+compares paginated cost and usage fetches under API contention with and without the request executor.
+a local cost explorer stub serves pages at a limited rate (server side token bucket) and raises
+ThrottlingException above it (no AWS access required):
+- before: requests are sent as fast as possible and throttled pages are retried with botocore like
+  backoff. a request whose retries are exhausted restarts from its first page
+- after: AwsCostClient requests through the shared rate limited request executor, pages are checkpointed
+  and an interrupted request resumes from its last page
+
+usage: python -m benchmarks.bench_throttling [concurrent_requests] [pages] [server_rate]
+"""
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from botocore.exceptions import ClientError
+
+from benchmarks.payloads import collector_config
+from costreport.collection.aws.cost_client import AwsCostClient
+from costreport.collection.aws.request_executor import is_throttling_error
+from costreport.utils.cache_manager import RawDateCacheManager
+
+LATENCY_SECONDS = 0.01
+# botocore legacy retry mode: up to 4 retries with random * 2 ** attempt backoff (scaled down here)
+BASELINE_RETRIES = 4
+BASELINE_BACKOFF_SECONDS = 0.05
+
+
+class ThrottlingCostExplorerStub:
+    def __init__(self, rate, pages):
+        self.pages = pages
+        self.rate = rate
+        self._lock = threading.Lock()
+        # server side token bucket. requests above rate are rejected (rather than delayed)
+        self._tokens = max(1.0, rate)
+        self._updated = time.monotonic()
+        self.calls = 0
+        self.throttled = 0
+
+    def _take(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def get_cost_and_usage(self, **kwargs):
+        time.sleep(LATENCY_SECONDS)
+        with self._lock:
+            self.calls += 1
+            throttled = not self._take()
+            self.throttled += throttled
+
+        if throttled:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                              'GetCostAndUsage')
+
+        page = int(kwargs.get('NextPageToken', 0))
+        data = {'ResultsByTime': [{'TimePeriod': {'Start': f'2021-01-{page + 1:02d}', 'End': ''},
+                                   'Groups': [], 'Estimated': False}]}
+        if page + 1 < self.pages:
+            data['NextPageToken'] = str(page + 1)
+        return data
+
+
+def _baseline_request(stub):
+    results = []
+    token = None
+    while True:
+        kwargs = {'NextPageToken': token} if token else {}
+        for attempt in range(BASELINE_RETRIES + 1):
+            try:
+                data = stub.get_cost_and_usage(**kwargs)
+                break
+            except ClientError as e:
+                if not is_throttling_error(e) or attempt == BASELINE_RETRIES:
+                    data = None
+                    break
+                time.sleep(random.random() * BASELINE_BACKOFF_SECONDS * 2 ** attempt)
+
+        if data is None:
+            # request failed, pages are lost
+            results = []
+            token = None
+            continue
+
+        results += data['ResultsByTime']
+        token = data.get('NextPageToken')
+        if not token:
+            return results
+
+
+def _executor_request(client: AwsCostClient, index):
+    start = date(2021, 1, 1)
+    end = date(2021, 2, 1)
+    while True:
+        try:
+            return client._request(start, end, 'DAILY', [{'Type': 'TAG', 'Key': f'tag{index}'}])
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise
+
+
+def _run(requests, fn):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        for f in [pool.submit(fn, i) for i in range(requests)]:
+            f.result()
+    return time.perf_counter() - start
+
+
+def run(requests=8, pages=10, server_rate=20):
+    stub = ThrottlingCostExplorerStub(server_rate, pages)
+    before = _run(requests, lambda i: _baseline_request(stub))
+    print(f'before  requests={requests} pages={pages} time={before:.2f}s '
+          f'api_calls={stub.calls} throttled={stub.throttled}')
+
+    stub = ThrottlingCostExplorerStub(server_rate, pages)
+    with tempfile.TemporaryDirectory() as directory:
+        config = collector_config(directory, requests_per_second=server_rate, max_retries=3)
+        client = AwsCostClient(config, RawDateCacheManager(config, 'aws'), client=stub)
+        after = _run(requests, lambda i: _executor_request(client, i))
+    print(f'after   requests={requests} pages={pages} time={after:.2f}s '
+          f'api_calls={stub.calls} throttled={stub.throttled}')
+    print(f'speedup x{before / after:.1f}')
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:4]])
@@ -0,0 +1,173 @@
+"""
+synthetic cost explorer payloads for benchmarks
+"""
+import random
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from typing import List, Dict
+
+from costreport.app_config import CacheConfig
+from costreport.utils.date_utils import split_time_period
+
+
+def results_by_time(days: int, keys: int, fill_rate: float = 1.0, seed: int = 0) -> List[Dict]:
+    """
+    returns daily 'ResultsByTime' list with up to 'keys' groups per day
+    :param days: number of days
+    :param keys: number of distinct group keys
+    :param fill_rate: probability of a key to have a cost in a given day
+    :param seed: random seed
+    :return:
+    """
+    rnd = random.Random(seed)
+    start = date(2020, 1, 1)
+    results = []
+
+    for d in range(days):
+        period_start = start + timedelta(days=d)
+        groups = [{'Keys': [f'key-{k}'],
+                   'Metrics': {'UnblendedCost': {'Amount': str(rnd.uniform(0, 100)), 'Unit': 'USD'}}}
+                  for k in range(keys) if rnd.random() < fill_rate]
+        results.append({'TimePeriod': {'Start': period_start.isoformat(),
+                                       'End': (period_start + timedelta(days=1)).isoformat()},
+                        'Total': {},
+                        'Groups': groups,
+                        'Estimated': False})
+
+    return results
+
+
+def collector_config(cache_directory: str, tags: List[str] = None, days: int = 30, accounts: Dict[str, str] = None,
+                     checkpoints: bool = True, **fetch) -> SimpleNamespace:
+    """
+    returns collector configuration of benchmarks. results are not cached and fetch is not rate limited
+    (unless overridden by fetch settings)
+    :param cache_directory: cache (checkpoints) directory
+    :param tags: report tags
+    :param days: daily reports days back
+    :param accounts: account id to name mapping
+    :param checkpoints: checkpoint pages of paginated requests (enabled by default, as in report runs)
+    :param fetch: fetch settings overrides (e.g. merge_dimensions)
+    """
+    tags = tags or []
+    fetch_settings = {'max_workers': 1, 'timeout_seconds': 3600, 'merge_dimensions': False,
+                      'requests_per_second': 1000000, 'max_retries': 0}
+    fetch_settings.update(fetch)
+
+    return SimpleNamespace(accounts=accounts or {},
+                           filtered_costs=[],
+                           filtered_services=[],
+                           resource_tags=tags,
+                           use_cache=False,
+                           incremental_fetch=False,
+                           cost_store=None,
+                           tag_report=None,
+                           cache=CacheConfig(directory=cache_directory, checkpoints=checkpoints),
+                           fetch=SimpleNamespace(**fetch_settings),
+                           periods=SimpleNamespace(monthly_report_months_back=6,
+                                                   daily_report_days_back=days,
+                                                   services_report_days_back=days,
+                                                   tags_report_days_back=days))
+
+
+class SyntheticCostExplorer:
+    """
+    local stand in of the cost explorer client (get_cost_and_usage, get_cost_forecast, get_tags) serving
+    synthetic costs for any requested time period. groups are paginated by page size, so groups of
+    a time period may be split between pages (as cost explorer does)
+    """
+
+    def __init__(self, accounts: int = 10, services: int = 100, tag_values: int = 100, page_size: int = 1000,
+                 fill_rate: float = 0.8, tags: List[str] = None, seed: int = 0, pair_keys: int = 3,
+                 latency_seconds: float = 0.0):
+        """
+        :param accounts: number of linked accounts
+        :param services: number of services
+        :param tag_values: number of distinct values per tag
+        :param page_size: maximal number of groups per page
+        :param fill_rate: probability of a key to have a cost in a given period
+        :param tags: available tags
+        :param seed: random seed
+        :param pair_keys: number of keys of the other group every key is paired with in two keys group by results
+        :param latency_seconds: response time of every call
+        """
+        self.keys = {'LINKED_ACCOUNT': [f'{100000000000 + a}' for a in range(accounts)],
+                     'SERVICE': [f'Amazon Service {s}' for s in range(services)]}
+        self.tag_values = tag_values
+        self.page_size = page_size
+        self.fill_rate = fill_rate
+        self.tags = tags if tags is not None else ['env', 'owner', 'team']
+        self.seed = seed
+        self.pair_keys = pair_keys
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def _get_keys(self, group) -> List[str]:
+        if group['Type'] == 'TAG':
+            return [f"{group['Key']}${group['Key']}-{v}" for v in range(self.tag_values)]
+
+        return self.keys[group['Key']]
+
+    def _generate(self, start: str, end: str, granularity: str, groups: List[Dict]) -> List[Dict]:
+        rnd = random.Random(f'{self.seed}{start}{end}{granularity}{groups}')
+        first_keys = self._get_keys(groups[0])
+        keys = [[k] for k in first_keys]
+        if len(groups) > 1:
+            # two keys group by - every key of the larger group is paired with a few keys of the other group
+            # (e.g. a tag value is used by resources of a few accounts). every key of the smaller group is paired with
+            # at least one key as every key reported by a single key group by has some cost
+            second_keys = self._get_keys(groups[1])
+            swap = len(second_keys) > len(first_keys)
+            larger, smaller = (second_keys, first_keys) if swap else (first_keys, second_keys)
+            pairs = [(k, s) for k in larger for s in rnd.sample(smaller, min(self.pair_keys, len(smaller)))]
+            paired = {s for _, s in pairs}
+            pairs += [(rnd.choice(larger), s) for s in smaller if s not in paired]
+            keys = [[s, k] if swap else [k, s] for k, s in pairs]
+
+        records = []
+        for period_start, period_end in split_time_period(date.fromisoformat(start), date.fromisoformat(end),
+                                                          granularity):
+            for k in keys:
+                if rnd.random() < self.fill_rate:
+                    records.append((period_start.isoformat(), period_end.isoformat(), k, rnd.uniform(0, 100)))
+
+        return records
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def get_cost_and_usage(self, TimePeriod, Granularity, Metrics, GroupBy, NextPageToken=None, Filter=None):
+        self._call()
+        request_key = (TimePeriod['Start'], TimePeriod['End'], Granularity, repr(GroupBy))
+        if request_key not in self._results:
+            self._results[request_key] = self._generate(TimePeriod['Start'], TimePeriod['End'], Granularity, GroupBy)
+
+        records = self._results[request_key]
+        offset = int(NextPageToken or 0)
+        results = []
+        for period_start, period_end, keys, amount in records[offset:offset + self.page_size]:
+            if not results or results[-1]['TimePeriod']['Start'] != period_start:
+                results.append({'TimePeriod': {'Start': period_start, 'End': period_end},
+                                'Total': {}, 'Groups': [], 'Estimated': False})
+            results[-1]['Groups'].append({'Keys': keys,
+                                          'Metrics': {'UnblendedCost': {'Amount': str(amount), 'Unit': 'USD'}}})
+
+        page = {'ResultsByTime': results}
+        if offset + self.page_size < len(records):
+            page['NextPageToken'] = str(offset + self.page_size)
+        return page
+
+    def get_cost_forecast(self, TimePeriod, Metric, Granularity, Filter=None):
+        self._call()
+        return {'Total': {'Amount': '12345.6', 'Unit': 'USD'}, 'ForecastResultsByTime': []}
+
+    def get_tags(self, TimePeriod, NextPageToken=None):
+        self._call()
+        return {'Tags': list(self.tags), 'ReturnSize': len(self.tags), 'TotalSize': len(self.tags)}
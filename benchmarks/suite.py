@@ -0,0 +1,260 @@
+"""
+report pipeline benchmark suite. every pipeline stage is measured on synthetic cost explorer data
+(served by a local stub, no AWS access required):
+    collect  - planned cost and usage requests, pagination and pages merge
+    frame    - report dataframes creation from collected results
+    provide  - DataProvider.generate (collect, frame and totals of all report items)
+    analyze  - DataAnalyzer.analyze
+    items    - HTMLReportGenerator items definitions creation
+    render   - charts rendering and template streaming
+    output   - report writing to a local destination
+
+stage times (best of repeats) are appended to a json history file and compared with a baseline run
+of the same parameters (latest run by default), so regressions are tracked over time.
+
+usage: python -m benchmarks.suite [--days 90] [--accounts 20] [--services 150] [--tag-values 500] ...
+       python -m benchmarks.suite --baseline <git commit> --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from benchmarks.payloads import SyntheticCostExplorer
+from costreport.analysis.analyzers import DataAnalyzer
+from costreport.app_config import CacheConfig, LocalDestination, TagReportConfig
+from costreport.collection.aws.aws_collector import AwsCollector
+from costreport.data_provider import DataProvider
+from costreport.output_manager import OutputManager
+from costreport.report_generators.html_generator import HTMLReportGenerator, LayoutManager
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.consts import ReportItemName
+from costreport.utils.date_utils import get_time
+
+HISTORY_FILE_DEFAULT = '.benchmarks/history.json'
+REGRESSION_THRESHOLD_DEFAULT = 0.1
+
+# charts are rendered by every repeat (render cache disabled, see bench_render_cache)
+REPORT_CONFIG = {'template_name': 'default.html', 'render_cache_mb': 0}
+
+
+def _get_config(args, cache_directory: str):
+    tags = [f'tag{t}' for t in range(args.tags)]
+    return SimpleNamespace(accounts={},
+                           filtered_costs=[],
+                           filtered_services=[],
+                           resource_tags=tags,
+                           use_cache=False,
+                           incremental_fetch=False,
+                           cost_store=None,
+                           tag_report=TagReportConfig(args.top_n) if args.top_n else None,
+                           cache=CacheConfig(directory=cache_directory),
+                           fetch=SimpleNamespace(max_workers=args.workers,
+                                                 timeout_seconds=3600,
+                                                 merge_dimensions=False,
+                                                 requests_per_second=1000000,
+                                                 max_retries=0),
+                           periods=SimpleNamespace(monthly_report_months_back=args.months,
+                                                   daily_report_days_back=args.days,
+                                                   services_report_days_back=args.days,
+                                                   tags_report_days_back=args.days))
+
+
+def _new_collector(ctx) -> AwsCollector:
+    return AwsCollector(ctx.config, get_time(), RawDateCacheManager(ctx.config, 'aws'), ce_client=ctx.stub)
+
+
+def bench_collect(ctx) -> float:
+    collector = _new_collector(ctx)
+    start = time.perf_counter()
+    collector.plan_requests()
+    ctx.results = {name: collector._request(name, query) for name, query in collector._get_queries().items()}
+    return time.perf_counter() - start
+
+
+def bench_frame(ctx) -> float:
+    collector = _new_collector(ctx)
+    tag_items = [f"'{tag}' Resources Cost" for tag in ctx.config.resource_tags]
+    start = time.perf_counter()
+    for name, results in ctx.results.items():
+        collector.create_data_frame_from_results(results, collector.get_tag_top_keys() if name in tag_items else None)
+    return time.perf_counter() - start
+
+
+def bench_provide(ctx) -> float:
+    provider = DataProvider(get_time(), ctx.config, _new_collector(ctx))
+    start = time.perf_counter()
+    ctx.container = provider.generate()
+    return time.perf_counter() - start
+
+
+def bench_analyze(ctx) -> float:
+    start = time.perf_counter()
+    DataAnalyzer(ctx.container).analyze()
+    return time.perf_counter() - start
+
+
+def bench_items(ctx) -> float:
+    generator = HTMLReportGenerator(ctx.container, REPORT_CONFIG, ctx.config.filtered_services)
+    start = time.perf_counter()
+    ctx.items_defs = generator._data_to_items_defs()
+    return time.perf_counter() - start
+
+
+def bench_render(ctx) -> float:
+    start = time.perf_counter()
+    layout = LayoutManager(ctx.items_defs, REPORT_CONFIG)
+    ctx.chunks = list(layout.layout({ReportItemName.REPORT_TITLE.value: 'Benchmark Report'}))
+    return time.perf_counter() - start
+
+
+def bench_output(ctx) -> float:
+    output_manager = OutputManager(get_time(), {'local': LocalDestination(ctx.directory)})
+    start = time.perf_counter()
+    output_manager.output(ctx.chunks)
+    return time.perf_counter() - start
+
+
+STAGES = [('collect', bench_collect),
+          ('frame', bench_frame),
+          ('provide', bench_provide),
+          ('analyze', bench_analyze),
+          ('items', bench_items),
+          ('render', bench_render),
+          ('output', bench_output)]
+
+
+def run_stages(args) -> Dict[str, float]:
+    """
+    returns best (minimal) time of every stage
+    """
+    stage_times = {}
+    with tempfile.TemporaryDirectory() as directory:
+        stub = SyntheticCostExplorer(accounts=args.accounts, services=args.services, tag_values=args.tag_values,
+                                     page_size=args.page_size, fill_rate=args.fill_rate)
+        ctx = SimpleNamespace(config=_get_config(args, os.path.join(directory, 'cache')), stub=stub,
+                              directory=directory)
+
+        for name, bench in STAGES:
+            stage_times[name] = min(bench(ctx) for _ in range(args.repeat))
+            print(f'{name:<8} {stage_times[name] * 1000:10.1f}ms')
+
+        print(f'cost explorer stub calls={stub.calls}')
+
+    return stage_times
+
+
+def _get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def load_history(file_name: str) -> List[Dict]:
+    try:
+        with open(file_name, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save_history(file_name: str, history: List[Dict]):
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    with open(f'{file_name}.tmp', 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(f'{file_name}.tmp', file_name)
+
+
+def find_baseline(history: List[Dict], params: Dict, commit: str = None) -> Optional[Dict]:
+    """
+    returns latest run of the same parameters (and of given commit if specified)
+    """
+    for record in reversed(history):
+        if record['params'] == params and (commit is None or record['commit'] == commit):
+            return record
+
+    return None
+
+
+def compare(stage_times: Dict[str, float], baseline: Dict, threshold: float) -> List[str]:
+    """
+    prints stage times change relative to baseline. returns regressed stages
+    """
+    print(f"\ncompared with baseline {baseline['commit']} ({baseline['time']}):")
+    regressions = []
+    for name, seconds in stage_times.items():
+        baseline_seconds = baseline['stages'].get(name)
+        if not baseline_seconds:
+            continue
+
+        change = seconds / baseline_seconds - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+
+        print(f'{name:<8} {baseline_seconds * 1000:10.1f}ms -> {seconds * 1000:10.1f}ms '
+              f'{change:+7.1%}{"  REGRESSION" if regressed else ""}')
+
+    return regressions
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='report pipeline benchmark suite')
+    parser.add_argument('--days', type=int, default=90, help='daily, services and tags reports days')
+    parser.add_argument('--months', type=int, default=6, help='monthly report months')
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--services', type=int, default=150)
+    parser.add_argument('--tags', type=int, default=3, help='number of tag reports')
+    parser.add_argument('--tag-values', type=int, default=500, help='distinct values per tag')
+    parser.add_argument('--page-size', type=int, default=1000, help='groups per cost explorer page')
+    parser.add_argument('--fill-rate', type=float, default=0.8, help='probability of a key cost in a period')
+    parser.add_argument('--top-n', type=int, default=0, help='tag reports top N reduction (0 - disabled)')
+    parser.add_argument('--workers', type=int, default=8, help='fetch workers')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=HISTORY_FILE_DEFAULT, help='history json file')
+    parser.add_argument('--baseline', default=None, help='baseline git commit (defaults to latest run)')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD_DEFAULT,
+                        help='relative slowdown reported as regression')
+    parser.add_argument('--no-save', action='store_true', help='do not append run to history')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with error code on regression')
+    return parser.parse_args(argv)
+
+
+def run(argv=None) -> int:
+    args = _parse_args(argv)
+    params = {k: getattr(args, k) for k in ['days', 'months', 'accounts', 'services', 'tags', 'tag_values',
+                                            'page_size', 'fill_rate', 'top_n', 'workers']}
+    print(f'benchmark parameters: {params}')
+
+    stage_times = run_stages(args)
+    history = load_history(args.history)
+    baseline = find_baseline(history, params, args.baseline)
+    regressions = compare(stage_times, baseline, args.threshold) if baseline else []
+    if not baseline:
+        print('\nno baseline run with the same parameters')
+
+    if not args.no_save:
+        history.append({'time': datetime.now().isoformat(timespec='seconds'),
+                        'commit': _get_git_commit(),
+                        'python': platform.python_version(),
+                        'params': params,
+                        'stages': stage_times})
+        save_history(args.history, history)
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
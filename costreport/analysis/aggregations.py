@@ -0,0 +1,99 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+def value_columns(dataframe: pd.DataFrame) -> List[str]:
+    """
+    returns dataframe cost columns (all columns but 'dates')
+    :param dataframe:
+    :return:
+    """
+    return [c for c in dataframe.columns if c != 'dates']
+
+
+def row_totals(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    returns dataframe with 'dates' and 'values' (sum of all cost columns per date) columns
+    :param dataframe:
+    :return:
+    """
+    values = dataframe[value_columns(dataframe)].to_numpy(dtype=float)
+    return pd.DataFrame.from_dict({
+        'dates': dataframe['dates'].tolist(),
+        'values': values.sum(axis=1)})
+
+
+def summary(values: np.ndarray) -> Dict[str, float]:
+    """
+    returns min, max, mean and total of values, rounded to one decimal place
+    :param values:
+    :return:
+    """
+    return {'min': round(values.min(), 1),
+            'max': round(values.max(), 1),
+            'mean': round(values.mean(), 1),
+            'total': round(values.sum(), 1)}
+
+
+class FrameAggregates:
+    """
+    aggregates of a cost dataframe ('dates' column and a cost column per key).
+    each aggregate is computed once (on first access) and reused by all consumers
+    """
+
+    def __init__(self, dataframe: pd.DataFrame):
+        self.dataframe = dataframe
+        self._cache = {}
+
+    def _get(self, name, func):
+        if name not in self._cache:
+            self._cache[name] = func()
+
+        return self._cache[name]
+
+    def totals(self) -> pd.DataFrame:
+        """ per date total of all columns """
+        return self._get('totals', lambda: row_totals(self.dataframe))
+
+    def summary(self) -> Dict[str, float]:
+        """ min, max, mean and total of per date totals """
+        return self._get('summary', lambda: summary(self.totals()['values'].values))
+
+    def column_totals(self) -> pd.Series:
+        """ total cost per column """
+        return self._get('column_totals', lambda: self.dataframe[value_columns(self.dataframe)].sum())
+
+    def cumulative(self) -> pd.DataFrame:
+        """ cumulative cost per column """
+        def _cumulative():
+            dataframe = self.dataframe[value_columns(self.dataframe)].cumsum()
+            dataframe.insert(0, 'dates', self.dataframe['dates'].values)
+            return dataframe
+
+        return self._get('cumulative', _cumulative)
+
+    def rolling_mean(self, window: int) -> pd.DataFrame:
+        """ rolling mean of 'window' dates per column """
+        def _rolling():
+            dataframe = self.dataframe[value_columns(self.dataframe)].rolling(window, min_periods=1).mean()
+            dataframe.insert(0, 'dates', self.dataframe['dates'].values)
+            return dataframe
+
+        return self._get(f'rolling_mean_{window}', _rolling)
+
+    def group_totals(self, groups: Dict[str, str]) -> pd.DataFrame:
+        """
+        per date cost of column groups
+        :param groups: column name to group name mapping. unmapped columns are grouped under their own name
+        :return:
+        """
+        def _group_totals():
+            columns = value_columns(self.dataframe)
+            dataframe = self.dataframe[columns].groupby([groups.get(c, c) for c in columns], axis=1, sort=False).sum()
+            dataframe.insert(0, 'dates', self.dataframe['dates'].values)
+            return dataframe
+
+        key = 'group_totals_' + ','.join(f'{k}={v}' for k, v in sorted(groups.items()))
+        return self._get(key, _group_totals)
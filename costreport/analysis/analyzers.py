@@ -6,6 +6,7 @@ from pandas import DataFrame
 from costreport.data_container import DataContainer
 from costreport.utils import data_utils
 from costreport.utils.consts import ReportItemName
+from costreport.utils.instrumentation import instrumented
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +26,10 @@ class DataAnalyzerBase(ABC):
 
 class ForecastChangeAnalyzer(DataAnalyzerBase):
     def analyze_internal(self):
+        # forecast is not included in reports limited to accounts (see derive_data_container)
+        if not self.data_container.has(ReportItemName.FORECAST.value):
+            return
+
         month_totals: DataFrame = self.data_container.get(ReportItemName.MONTHLY_TOTAL_COST.value).value
         last_closed_month = month_totals['values'].values[-2]
         forecast = self.data_container.get(ReportItemName.FORECAST.value).value
@@ -34,23 +39,21 @@ class ForecastChangeAnalyzer(DataAnalyzerBase):
 
 class MonthlyReportStats(DataAnalyzerBase):
     def analyze_internal(self):
-        month_totals: DataFrame = self.data_container.get(ReportItemName.MONTHLY_TOTAL_COST.value).value
-        values = month_totals['values'].values
-        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_MIN.value, round(values.min(), 1))
-        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_MAX.value, round(values.max(), 1))
-        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_MEAN.value, round(values.mean(), 1))
-        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_TOTAL.value, round(values.sum(), 1))
+        stats = self.data_container.aggregates(ReportItemName.MONTHLY_COST.value).summary()
+        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_MIN.value, stats['min'])
+        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_MAX.value, stats['max'])
+        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_MEAN.value, stats['mean'])
+        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST_TOTAL.value, stats['total'])
 
 
 class DailyReportStats(DataAnalyzerBase):
     def analyze_internal(self):
-        daily_totals: DataFrame = self.data_container.get(ReportItemName.DAILY_TOTAL_COST.value).value
-        values = daily_totals['values'].values
+        stats = self.data_container.aggregates(ReportItemName.DAILY_COST.value).summary()
 
-        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_MIN.value, round(values.min(), 1))
-        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_MAX.value, round(values.max(), 1))
-        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_MEAN.value, round(values.mean(), 1))
-        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_TOTAL.value, round(values.sum(), 1))
+        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_MIN.value, stats['min'])
+        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_MAX.value, stats['max'])
+        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_MEAN.value, stats['mean'])
+        self.data_container.add(ReportItemName.DAILY_TOTAL_COST_TOTAL.value, stats['total'])
 
 
 data_analyzers = [ForecastChangeAnalyzer, MonthlyReportStats, DailyReportStats]
@@ -60,6 +63,7 @@ class DataAnalyzer:
     def __init__(self, data_container: DataContainer):
         self.data_container = data_container
 
+    @instrumented('analyze')
     def analyze(self):
         logger.info('executing data analyzers')
         for analyzer in data_analyzers:
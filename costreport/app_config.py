@@ -1,16 +1,32 @@
+import copy
 import json
 import logging
 from abc import ABC
 from enum import Enum, unique
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from costreport.utils.consts import CONFIGURATION_FILE
+from costreport.utils.consts import CONFIGURATION_FILE, CACHE_RESULTS_DIR
 
 MONTHLY_REPORT_MONTHS_BACK_DEFAULT = 6
 SERVICES_REPORT_DAYS_BACK_DEFAULT = 30
 DAILY_REPORT_DAYS_BACK_DEFAULT = 30
 TAGS_REPORT_DAYS_BACK_DEFAULT = 30
 
+FETCH_MAX_WORKERS_DEFAULT = 8
+FETCH_TIMEOUT_SECONDS_DEFAULT = 300
+FETCH_REQUESTS_PER_SECOND_DEFAULT = 5
+FETCH_MAX_RETRIES_DEFAULT = 5
+
+CUR_CHUNK_ROWS_DEFAULT = 500000
+
+TAG_REPORT_TOP_N_DEFAULT = 10
+TAG_REPORT_MIN_SHARE_DEFAULT = 0.0
+
+SERVERLESS_RESERVE_SECONDS_DEFAULT = 30
+
+# cost explorer serves about a year of history (12 months + current month)
+COST_STORE_API_MONTHS_BACK_DEFAULT = 12
+
 TEMPLATE_NAME_DEFAULT = "default.html"
 REPORT_TITLE_DEFAULT = "AWS Costs Report"
 
@@ -61,6 +77,101 @@ class _PeriodsConfig:
         self._tags_report_days_back = val
 
 
+class _FetchConfig:
+    def __init__(self):
+        self._max_workers = FETCH_MAX_WORKERS_DEFAULT
+        self._timeout_seconds = FETCH_TIMEOUT_SECONDS_DEFAULT
+        self._merge_dimensions = True
+        self._requests_per_second = FETCH_REQUESTS_PER_SECOND_DEFAULT
+        self._max_retries = FETCH_MAX_RETRIES_DEFAULT
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @max_workers.setter
+    def max_workers(self, val):
+        if val < 1:
+            raise ConfigurationException('fetch max_workers should be a positive number')
+        self._max_workers = val
+
+    @property
+    def timeout_seconds(self):
+        return self._timeout_seconds
+
+    @timeout_seconds.setter
+    def timeout_seconds(self, val):
+        self._timeout_seconds = val
+
+    @property
+    def merge_dimensions(self):
+        return self._merge_dimensions
+
+    @merge_dimensions.setter
+    def merge_dimensions(self, val):
+        self._merge_dimensions = val
+
+    @property
+    def requests_per_second(self):
+        return self._requests_per_second
+
+    @requests_per_second.setter
+    def requests_per_second(self, val):
+        if val <= 0:
+            raise ConfigurationException('fetch requests_per_second should be a positive number')
+        self._requests_per_second = val
+
+    @property
+    def max_retries(self):
+        return self._max_retries
+
+    @max_retries.setter
+    def max_retries(self, val):
+        if val < 0:
+            raise ConfigurationException('fetch max_retries should not be negative')
+        self._max_retries = val
+
+
+class CostStoreConfig:
+    def __init__(self, directory, api_months_back=COST_STORE_API_MONTHS_BACK_DEFAULT):
+        """
+        :param directory: store directory
+        :param api_months_back: number of months back available from cost explorer.
+        older data is served from the store only
+        """
+        self.directory = directory
+        self.api_months_back = api_months_back
+
+
+class TagReportConfig:
+    def __init__(self, top_n=TAG_REPORT_TOP_N_DEFAULT, min_share=TAG_REPORT_MIN_SHARE_DEFAULT):
+        """
+        :param top_n: number of tag values reported. costs of other tag values are reported as '(other values)'
+        :param min_share: minimal tag value share (0-1) of tag total cost. smaller tag values are reported
+        as '(other values)'
+        """
+        if top_n < 1:
+            raise ConfigurationException('tag report top_n should be a positive number')
+
+        if not 0 <= min_share < 1:
+            raise ConfigurationException('tag report min_share should be between 0 and 1')
+
+        self.top_n = top_n
+        self.min_share = min_share
+
+
+class ServerlessConfig:
+    def __init__(self, reserve_seconds=SERVERLESS_RESERVE_SECONDS_DEFAULT):
+        """
+        :param reserve_seconds: invocation time reserved for analysis, rendering and output. data fetch is bounded
+        by invocation remaining time minus reserved time
+        """
+        if reserve_seconds < 0:
+            raise ConfigurationException('serverless reserve_seconds should not be negative')
+
+        self.reserve_seconds = reserve_seconds
+
+
 class ReportDestination(Enum):
     LOCAL = 'local'
     S3 = 's3'
@@ -89,6 +200,67 @@ class ReportType(Enum):
     HTML = "html"
 
 
+@unique
+class CollectorType(Enum):
+    AWS = "aws"
+    CUR = "cur"
+
+
+@unique
+class CacheBackendType(Enum):
+    DISK = "disk"
+    SQLITE = "sqlite"
+    REDIS = "redis"
+
+
+@unique
+class CacheCompression(Enum):
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+class CacheConfig:
+    def __init__(self, backend=CacheBackendType.DISK.value, directory=CACHE_RESULTS_DIR, url=None, max_size_mb=None,
+                 ttl_seconds: Dict[str, int] = None, compression=CacheCompression.GZIP.value, checkpoints=True):
+        """
+        :param backend: disk, sqlite or redis
+        :param directory: disk and sqlite backends directory
+        :param url: redis backend url
+        :param max_size_mb: disk and sqlite backends size bound. least recently used entries are evicted
+        :param ttl_seconds: entries time to live by key class (cache name, e.g. 'aws_partitions')
+        :param compression: entries compression (none, gzip or zstd)
+        :param checkpoints: checkpoint pages of paginated requests so interrupted requests resume from their last page.
+        enabled by default
+        """
+        if compression not in [i.value for i in CacheCompression]:
+            raise ConfigurationException(f'unknown cache compression:{compression}')
+
+        if backend not in [i.value for i in CacheBackendType]:
+            raise ConfigurationException(f'unknown cache backend:{backend}')
+
+        if backend == CacheBackendType.REDIS.value and not url:
+            raise ConfigurationException('redis cache backend requires url property')
+
+        self.backend = backend
+        self.directory = directory
+        self.url = url
+        self.max_size_mb = max_size_mb
+        self.ttl_seconds = ttl_seconds or {}
+        self.compression = compression
+        self.checkpoints = checkpoints
+
+
+class CurConfig:
+    def __init__(self, directory, chunk_rows=CUR_CHUNK_ROWS_DEFAULT):
+        """
+        :param directory: directory of cost and usage report files (gzip csv, csv or parquet)
+        :param chunk_rows: number of rows read and aggregated at once
+        """
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+
+
 class Report:
     def __init__(self, name, report_config: Dict):
         self.name = name
@@ -100,11 +272,43 @@ class Reports:
         self.reports = reports
 
 
+class ReportVariant:
+    """
+    report derived from the shared collected data
+    """
+
+    def __init__(self,
+                 name: str,
+                 report_title: str,
+                 accounts: Optional[List[str]],
+                 resource_tags: List[str],
+                 periods: _PeriodsConfig,
+                 reports: List[Report]):
+        """
+        :param name: variant name (used in report file name)
+        :param report_title:
+        :param accounts: account ids (or names) included in accounts reports. None for all accounts
+        :param resource_tags: tags to create cost report for
+        :param periods: variant time frames (should not exceed collected time frames)
+        :param reports: report implementations
+        """
+        self.name = name
+        self.report_title = report_title
+        self.accounts = accounts
+        self.resource_tags = resource_tags
+        self.periods = periods
+        self.reports = reports
+
+
 class AppConfig:
-    periods = _PeriodsConfig()
-    destinations = {}
 
     def __init__(self):
+        # per instance settings, so configurations loaded by the same process (e.g. warm serverless containers,
+        # run.py --validate) do not share state
+        self.periods = _PeriodsConfig()
+        self.fetch = _FetchConfig()
+        self.destinations = {}
+
         cfg = self._load_config()
         logger.info(f'Loaded config:{cfg}')
         self.report_title = REPORT_TITLE_DEFAULT if not cfg.get('report_title') else cfg['report_title']
@@ -113,19 +317,44 @@ class AppConfig:
         self.filtered_costs = [] if not cfg.get('filtered_costs') else cfg['filtered_costs']
         self.resource_tags = [] if not cfg.get('resource_tags') else cfg['resource_tags']
         self.use_cache = False if not cfg.get('use_cache') else cfg['use_cache']
+        self.incremental_fetch = False if not cfg.get('incremental_fetch') else cfg['incremental_fetch']
         # self.template_name = TEMPLATE_NAME_DEFAULT if not cfg.get('template_name') else cfg['template_name']
         self.schedule = None if not cfg.get('schedule') else cfg['schedule']
+        self.metrics_file = None if not cfg.get('metrics_file') else cfg['metrics_file']
+        self.metrics_prometheus_file = None if not cfg.get('metrics_prometheus_file') \
+            else cfg['metrics_prometheus_file']
+        self.cost_store = self._load_cost_store_config(cfg.get('cost_store'))
+        self.collector = cfg.get('collector', CollectorType.AWS.value)
+        self.cur = self._load_cur_config(cfg.get('cur'))
+        self.tag_report = self._load_tag_report_config(cfg.get('tag_report'))
+        self.cache = self._load_cache_config(cfg.get('cache'))
+        self.serverless = self._load_serverless_config(cfg.get('serverless'))
+
+        if self.collector not in [i.value for i in CollectorType]:
+            raise ConfigurationException(f'unknown collector type:{self.collector}')
+
+        if self.collector == CollectorType.CUR.value and not self.cur:
+            raise ConfigurationException('cur collector requires cur configuration')
 
         self.reports = self._load_reports_config(cfg.get('reports'))
 
         if cfg.get('periods'):
-            self._load_periods_config(cfg['periods'])
+            self._load_periods_config(cfg['periods'], self.periods)
+
+        if cfg.get('fetch'):
+            self._load_fetch_config(cfg['fetch'])
 
         if cfg.get('destinations'):
             self._load_destinations(cfg['destinations'])
         else:
             raise ConfigurationException('at least one report destination should be configured')
 
+        self.variants: List[ReportVariant] = self._load_variants(cfg.get('report_variants'))
+
+        if self.periods.monthly_report_months_back > COST_STORE_API_MONTHS_BACK_DEFAULT and not self.cost_store:
+            logger.warning(f'monthly_report_months_back ({self.periods.monthly_report_months_back}) exceeds cost '
+                           f'explorer history. configure cost_store to accumulate longer history')
+
     @staticmethod
     def _load_reports_config(reports_cfg):
         if not reports_cfg:
@@ -141,18 +370,132 @@ class AppConfig:
 
         return reports
 
-    def _load_periods_config(self, periods_cfg):
+    @staticmethod
+    def _load_cost_store_config(cost_store_cfg) -> Optional[CostStoreConfig]:
+        if not cost_store_cfg:
+            return None
+
+        directory = cost_store_cfg.get('directory')
+        if not directory:
+            raise ConfigurationException('cost store is missing directory property')
+
+        return CostStoreConfig(directory,
+                               cost_store_cfg.get('api_months_back', COST_STORE_API_MONTHS_BACK_DEFAULT))
+
+    @staticmethod
+    def _load_cur_config(cur_cfg) -> Optional[CurConfig]:
+        if not cur_cfg:
+            return None
+
+        directory = cur_cfg.get('directory')
+        if not directory:
+            raise ConfigurationException('cur configuration is missing directory property')
+
+        return CurConfig(directory, cur_cfg.get('chunk_rows', CUR_CHUNK_ROWS_DEFAULT))
+
+    @staticmethod
+    def _load_cache_config(cache_cfg) -> CacheConfig:
+        if not cache_cfg:
+            return CacheConfig()
+
+        return CacheConfig(backend=cache_cfg.get('backend', CacheBackendType.DISK.value),
+                           directory=cache_cfg.get('directory', CACHE_RESULTS_DIR),
+                           url=cache_cfg.get('url'),
+                           max_size_mb=cache_cfg.get('max_size_mb'),
+                           ttl_seconds=cache_cfg.get('ttl_seconds'),
+                           compression=cache_cfg.get('compression', CacheCompression.GZIP.value),
+                           checkpoints=cache_cfg.get('checkpoints', True))
+
+    @staticmethod
+    def _load_serverless_config(serverless_cfg) -> ServerlessConfig:
+        if not serverless_cfg:
+            return ServerlessConfig()
+
+        return ServerlessConfig(serverless_cfg.get('reserve_seconds', SERVERLESS_RESERVE_SECONDS_DEFAULT))
+
+    @staticmethod
+    def _load_tag_report_config(tag_report_cfg) -> Optional[TagReportConfig]:
+        if not tag_report_cfg:
+            return None
+
+        return TagReportConfig(tag_report_cfg.get('top_n', TAG_REPORT_TOP_N_DEFAULT),
+                               tag_report_cfg.get('min_share', TAG_REPORT_MIN_SHARE_DEFAULT))
+
+    @staticmethod
+    def _load_periods_config(periods_cfg, periods: _PeriodsConfig):
         if periods_cfg.get('monthly_report_months_back'):
-            self.periods.monthly_report_months_back = periods_cfg['monthly_report_months_back']
+            periods.monthly_report_months_back = periods_cfg['monthly_report_months_back']
 
         if periods_cfg.get('services_report_days_back'):
-            self.periods.services_report_days_back = periods_cfg['services_report_days_back']
+            periods.services_report_days_back = periods_cfg['services_report_days_back']
 
         if periods_cfg.get('daily_report_days_back'):
-            self.periods.daily_report_days_back = periods_cfg['daily_report_days_back']
+            periods.daily_report_days_back = periods_cfg['daily_report_days_back']
 
         if periods_cfg.get('tags_report_days_back'):
-            self.periods.tags_report_days_back = periods_cfg['tags_report_days_back']
+            periods.tags_report_days_back = periods_cfg['tags_report_days_back']
+
+    def _load_variants(self, variants_cfg) -> List[ReportVariant]:
+        """
+        loads report variants. report variants default to top level configuration properties.
+        collected periods and tags are extended to cover all variants
+        :param variants_cfg:
+        :return:
+        """
+        if not variants_cfg:
+            return []
+
+        variants: List[ReportVariant] = []
+        for v in variants_cfg:
+            name = v.get('name')
+            if not name:
+                raise ConfigurationException('report variant is missing name property')
+
+            if name in [variant.name for variant in variants]:
+                raise ConfigurationException(f'duplicate report variant name:{name}')
+
+            periods = copy.copy(self.periods)
+            if v.get('periods'):
+                self._load_periods_config(v['periods'], periods)
+
+            variants.append(ReportVariant(
+                name=name,
+                report_title=v.get('report_title') or self.report_title,
+                accounts=v.get('accounts'),
+                resource_tags=list(self.resource_tags) if v.get('resource_tags') is None else v['resource_tags'],
+                periods=periods,
+                reports=self._load_reports_config(v['reports']) if v.get('reports') else self.reports))
+
+        # data is collected once for all variants
+        resource_tags = list(self.resource_tags)
+        for variant in variants:
+            for tag in variant.resource_tags:
+                if tag not in resource_tags:
+                    resource_tags.append(tag)
+        self.resource_tags = resource_tags
+
+        for period in ['monthly_report_months_back', 'services_report_days_back',
+                       'daily_report_days_back', 'tags_report_days_back']:
+            setattr(self.periods, period, max(getattr(p, period) for p in [self.periods] +
+                                              [variant.periods for variant in variants]))
+
+        return variants
+
+    def _load_fetch_config(self, fetch_cfg):
+        if fetch_cfg.get('max_workers'):
+            self.fetch.max_workers = fetch_cfg['max_workers']
+
+        if fetch_cfg.get('timeout_seconds'):
+            self.fetch.timeout_seconds = fetch_cfg['timeout_seconds']
+
+        if fetch_cfg.get('merge_dimensions') is not None:
+            self.fetch.merge_dimensions = fetch_cfg['merge_dimensions']
+
+        if fetch_cfg.get('requests_per_second'):
+            self.fetch.requests_per_second = fetch_cfg['requests_per_second']
+
+        if fetch_cfg.get('max_retries') is not None:
+            self.fetch.max_retries = fetch_cfg['max_retries']
 
     def _load_destinations(self, dest_cfg):
         for k, v in dest_cfg.items():
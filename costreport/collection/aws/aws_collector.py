@@ -1,15 +1,21 @@
 import logging
-from datetime import datetime
-from typing import List
+from datetime import datetime, date
+from itertools import chain
+from typing import List, Optional
 
 import pandas as pd
 
 from costreport.app_config import AppConfig
-from costreport.collection.aws.cost_client import AwsCostClient
-from costreport.collection.collector import Collector
+from costreport.collection.aws.cost_client import AwsCostClient, RESTATED_DAYS
+from costreport.collection.aws.query_planner import CostQueryPlanner
+from costreport.collection.collector import Collector, AMOUNT_DECIMALS
+from costreport.collection.top_keys import TopKeys
 from costreport.utils import consts
 from costreport.utils.cache_manager import RawDateCacheManager
-from costreport.utils.date_utils import get_today, get_months_back, get_days_back, get_first_day_next_month
+from costreport.utils.cost_store import ColumnarCostStore, empty_long_format
+from costreport.utils.date_utils import get_today, get_months_back, get_days_back, get_first_day_next_month, \
+    split_time_period
+from costreport.utils.deadline import Deadline
 
 logger = logging.getLogger(__name__)
 
@@ -19,81 +25,209 @@ class AwsCollector(Collector):
     collector implementation interface
     """
 
-    def __init__(self, config: AppConfig, exec_time: datetime, cache: RawDateCacheManager):
+    def __init__(self, config: AppConfig, exec_time: datetime, cache: RawDateCacheManager, ce_client=None):
+        """
+        :param config:
+        :param exec_time:
+        :param cache:
+        :param ce_client: optional cost explorer client (e.g. a stub). defaults to boto3 client
+        """
         super().__init__(config, exec_time, cache)
-        self.cost_client = AwsCostClient(config, cache)
+        self.cost_client = AwsCostClient(config, cache, ce_client)
+        self.planner = CostQueryPlanner(self.cost_client, merge_dimensions=config.fetch.merge_dimensions,
+                                        stats_cache=RawDateCacheManager(config, 'aws_planner',
+                                                                        enabled=config.fetch.merge_dimensions))
+        self.stores = {}
+        self._live_starts = {}
+
+        if config.cost_store:
+            self.stores = {
+                granularity: ColumnarCostStore(config.cost_store.directory, granularity, config.filtered_costs)
+                for granularity in ['DAILY', 'MONTHLY']}
+
+    def _get_queries(self):
+        """
+        returns cost and usage queries (request name and request arguments) of all reports
+        """
+        queries = {
+            consts.ReportItemName.MONTHLY_COST.value: dict(
+                start=get_months_back(self.config.periods.monthly_report_months_back),
+                end=get_today(),
+                group_by_dimensions=['LINKED_ACCOUNT']),
+            consts.ReportItemName.DAILY_COST.value: dict(
+                start=get_days_back(self.config.periods.daily_report_days_back),
+                end=get_today(),
+                group_by_dimensions=['LINKED_ACCOUNT'],
+                granularity='DAILY'),
+            consts.ReportItemName.SERVICES_COST.value: dict(
+                start=get_days_back(self.config.periods.services_report_days_back),
+                end=get_today(),
+                granularity='DAILY',
+                group_by_dimensions=['SERVICE'])
+        }
+
+        for tag_name in self.config.resource_tags:
+            queries[f"'{tag_name}' Resources Cost"] = dict(
+                start=get_days_back(self.config.periods.tags_report_days_back),
+                end=get_today(),
+                granularity='DAILY',
+                group_by_tags=[tag_name])
+
+        return queries
+
+    @staticmethod
+    def _get_dimension(query) -> str:
+        if query.get('group_by_tags'):
+            return f"TAG:{query['group_by_tags'][0]}"
+
+        return query['group_by_dimensions'][0]
+
+    @staticmethod
+    def _get_closed_until(granularity) -> date:
+        """
+        returns first date of periods which may still be restated by AWS
+        """
+        closed_until = get_days_back(RESTATED_DAYS)
+        return closed_until if granularity == 'DAILY' else closed_until.replace(day=1)
 
-    def create_data_frame_from_results(self, cost_results):
+    def _get_live_start(self, query) -> date:
+        """
+        returns start date of query time window which should be requested from AWS.
+        time window older than live start is served from cost store. windows which exceed cost explorer
+        history are served from cost store history accumulated by previous runs
         """
-        returns list of identifiers and dict of values by key
+        granularity = query.get('granularity', 'MONTHLY')
+        coverage = self.stores[granularity].get_coverage(self._get_dimension(query))
+        api_start = max(query['start'], get_months_back(self.config.cost_store.api_months_back))
+
+        if coverage and coverage[0] <= api_start < coverage[1]:
+            return min(coverage[1], query['end'])
+
+        return min(api_start, query['end'])
+
+    def set_deadline(self, deadline: Optional[Deadline]):
+        super().set_deadline(deadline)
+        self.cost_client.deadline = deadline
+
+    def plan_requests(self):
+        self._live_starts = {}
+
+        for item_name, query in self._get_queries().items():
+            if self.stores:
+                # only the time window not available in cost store is requested
+                self._live_starts[item_name] = self._get_live_start(query)
+                query = dict(query, start=self._live_starts[item_name])
+
+            if query['start'] < query['end']:
+                self.planner.register(**query)
+
+        self.planner.plan()
+
+    def _request(self, item_name, query):
+        return self.planner.request_cost_and_usage(request_name=item_name, **query)
+
+    def _iter_request(self, item_name, query):
+        return self.planner.iter_cost_and_usage(request_name=item_name, **query)
+
+    def _get_report(self, item_name, top_keys: TopKeys = None) -> pd.DataFrame:
+        query = self._get_queries()[item_name]
+        granularity = query.get('granularity', 'MONTHLY')
+        dimension = self._get_dimension(query)
+        start = query['start']
+        end = query['end']
+        dates = [period_start.isoformat() for period_start, _ in split_time_period(start, end, granularity)]
+
+        if not self.stores:
+            if not top_keys:
+                return self.create_data_frame_from_results(self._request(item_name, query))
+
+            # pages are reduced as they are fetched
+            pages = self._iter_request(item_name, query)
+            return self.long_to_frame(dates, (self.results_to_long(page, dimension) for page in pages), top_keys)
+
+        store = self.stores[granularity]
+        live_start = self._live_starts.get(item_name) or self._get_live_start(query)
+
+        stored_rows = store.read(dimension, start, live_start) if start < live_start else empty_long_format()
+        live_rows = empty_long_format()
+
+        if live_start < end:
+            pages = self._iter_request(item_name, dict(query, start=live_start))
+            live_rows = self.results_to_long(chain.from_iterable(pages), dimension)
+            store.write(dimension, live_start, min(self._get_closed_until(granularity), end), live_rows)
+
+        logger.info(f'{item_name}: {len(stored_rows)} rows loaded from cost store. '
+                    f'{len(live_rows)} rows requested from {live_start}')
+
+        return self.long_to_frame(dates, [stored_rows, live_rows], top_keys)
+
+    @staticmethod
+    def results_to_long(cost_results, dimension: str) -> pd.DataFrame:
+        """
+        returns long format (date, dimension, key, amount) rows of cost results
         :param cost_results:
+        :param dimension: group by dimension of results
         :return:
         """
-        columns = ['dates']
-        data_set = {'dates': []}
+        dates = []
+        keys = []
+        amounts = []
 
-        for i, v in enumerate(cost_results):
+        for v in cost_results:
             start = v['TimePeriod']['Start']
-            data_set['dates'].append(start)
-            current_date_columns = ['dates']
+            for g in v['Groups']:
+                dates.append(start)
+                keys.append(g['Keys'][0])
+                amounts.append(float(g['Metrics']['UnblendedCost']['Amount']))
 
-            if v['Groups']:
-                for g in v['Groups']:
-                    key = g['Keys'][0]
-                    # map account id to name:
-                    if self.config.accounts and key in self.config.accounts:
-                        key = self.config.accounts[key]
+        if not dates:
+            return empty_long_format()
 
-                    if not data_set.get(key):
-                        # add new column to column list
-                        columns.append(key)
-                        # initialize array and pad with values if needed
-                        data_set[key] = [] if i == 0 else [0] * i
+        return pd.DataFrame({'date': dates, 'dimension': dimension, 'key': keys, 'amount': amounts})
 
-                    current_date_columns.append(key)
-                    amount = float(g['Metrics']['UnblendedCost']['Amount'])
-                    data_set[key].append(round(amount, 1))
+    def create_data_frame_from_results(self, cost_results, top_keys: TopKeys = None):
+        """
+        returns dataframe with 'dates' column and a cost column per group key.
+        results are flattened to long format (date index, key, amount) in a single pass and pivoted
+        :param cost_results:
+        :param top_keys: optional top keys reduction applied while results are flattened
+        :return:
+        """
+        accounts = self.config.accounts or {}
+        dates = []
+        date_indices = []
+        keys = []
+        amounts = []
 
-            # get columns in columns list that were not handled in this date and put '0'
-            missing = [c for c in columns if c not in current_date_columns]
-            for m in missing:
-                data_set[m].append(0)
+        for i, v in enumerate(cost_results):
+            dates.append(v['TimePeriod']['Start'])
 
-        return pd.DataFrame.from_dict(data_set)
+            for g in v['Groups']:
+                key = g['Keys'][0]
+                # map account id to name:
+                key = accounts.get(key, key)
+                amount = float(g['Metrics']['UnblendedCost']['Amount'])
 
-    def get_monthly_report(self) -> pd.DataFrame:
-        item_name = consts.ReportItemName.MONTHLY_COST.value
-        results = self.cost_client.request_cost_and_usage(
-            start=get_months_back(self.config.periods.monthly_report_months_back),
-            end=get_today(),
-            request_name=item_name,
-            group_by_dimensions=['LINKED_ACCOUNT'])
+                if top_keys:
+                    top_keys.add(i, key, amount)
+                else:
+                    date_indices.append(i)
+                    keys.append(key)
+                    amounts.append(amount)
 
-        dataframe = self.create_data_frame_from_results(results)
-        return dataframe
+        if top_keys:
+            date_indices, keys, amounts = top_keys.result()
 
-    def get_daily_report(self) -> pd.DataFrame:
-        item_name = consts.ReportItemName.DAILY_COST.value
+        return self.pivot_long_format(dates, date_indices, keys, amounts, AMOUNT_DECIMALS)
 
-        results = self.cost_client.request_cost_and_usage(
-            start=get_days_back(self.config.periods.daily_report_days_back),
-            end=get_today(),
-            request_name=item_name,
-            group_by_dimensions=['LINKED_ACCOUNT'],
-            granularity='DAILY')
+    def get_monthly_report(self) -> pd.DataFrame:
+        return self._get_report(consts.ReportItemName.MONTHLY_COST.value)
 
-        return self.create_data_frame_from_results(results)
+    def get_daily_report(self) -> pd.DataFrame:
+        return self._get_report(consts.ReportItemName.DAILY_COST.value)
 
     def get_services_report(self) -> pd.DataFrame:
-        item_name = consts.ReportItemName.SERVICES_COST.value
-        results = self.cost_client.request_cost_and_usage(
-            start=get_days_back(self.config.periods.services_report_days_back),
-            end=get_today(),
-            request_name=item_name,
-            granularity='DAILY',
-            group_by_dimensions=['SERVICE'])
-
-        return self.create_data_frame_from_results(results)
+        return self._get_report(consts.ReportItemName.SERVICES_COST.value)
 
     def get_available_tags(self) -> List[str]:
         return self.cost_client.get_available_tags(
@@ -101,14 +235,7 @@ class AwsCollector(Collector):
             end_date=get_today())
 
     def get_tag_report(self, tag_name) -> pd.DataFrame:
-        item_name = f"'{tag_name}' Resources Cost"
-        results = self.cost_client.request_cost_and_usage(
-            start=get_days_back(self.config.periods.tags_report_days_back),
-            end=get_today(),
-            request_name=item_name,
-            granularity='DAILY',
-            group_by_tags=[tag_name])
-        return self.create_data_frame_from_results(results)
+        return self._get_report(f"'{tag_name}' Resources Cost", self.get_tag_top_keys())
 
     def get_current_month_forecast(self) -> pd.DataFrame:
         forecast = self.cost_client.get_monthly_cost_forecast(get_today().isoformat(),
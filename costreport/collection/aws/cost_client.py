@@ -1,27 +1,72 @@
+import hashlib
 import json
 import logging
-import os
-import subprocess
 from datetime import date
+from typing import List, Dict, Optional, Iterator
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 from costreport.app_config import AppConfig
+from costreport.collection.aws.request_executor import RequestExecutor, is_throttling_error
 from costreport.utils.cache_manager import RawDateCacheManager
 from costreport.utils.consts import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, REGION_NAME
+from costreport.utils.date_utils import get_days_back, split_time_period
+from costreport.utils.deadline import Deadline, DeadlineExceeded
+from costreport.utils.instrumentation import record_api_call
+
+# AWS may restate costs of the last days so they are not considered final
+RESTATED_DAYS = 3
+
+# checkpoints of older interrupted requests are discarded (page tokens and recent costs may be outdated)
+CHECKPOINT_MAX_AGE_SECONDS = 3600
 
 logger = logging.getLogger(__name__)
 
 
 class AwsCostClient:
 
-    def __init__(self, config: AppConfig, cache: RawDateCacheManager):
+    def __init__(self, config: AppConfig, cache: RawDateCacheManager, client=None):
+        """
+        :param config:
+        :param cache:
+        :param client: optional cost explorer client (e.g. a stub). defaults to boto3 client
+        """
         self.config = config
         self.cache = cache
-        self.client = boto3.client('ce',
-                                   aws_access_key_id=AWS_ACCESS_KEY_ID,
-                                   aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-                                   region_name=REGION_NAME)
+        self.partitions = RawDateCacheManager(config, 'aws_partitions', enabled=config.incremental_fetch)
+        # pages fetched by interrupted paginated requests
+        self.checkpoints = RawDateCacheManager(config, 'aws_checkpoints', enabled=config.cache.checkpoints,
+                                               ttl_seconds=CHECKPOINT_MAX_AGE_SECONDS)
+        # single client (and connection pool) shared by all concurrent fetch requests.
+        # throttled requests are retried by the request executor (rather than by botocore)
+        self.client = client or boto3.client('ce',
+                                             aws_access_key_id=AWS_ACCESS_KEY_ID,
+                                             aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                                             region_name=REGION_NAME,
+                                             config=Config(max_pool_connections=config.fetch.max_workers,
+                                                           retries={'max_attempts': 1}))
+        self.executor = RequestExecutor(config.fetch.requests_per_second, config.fetch.max_retries)
+        # run deadline. pagination stops when it is reached (see _check_deadline)
+        self.deadline: Optional[Deadline] = None
+        # largest number of result groups of a fetched page (cost explorer page size lower bound)
+        self.page_groups = 0
+
+        if not client:
+            self.client.meta.events.register('after-call', self._on_after_call)
+
+    @staticmethod
+    def _on_after_call(http_response, **kwargs):
+        record_api_call(bytes_downloaded=len(http_response.content or b''), api_calls=0)
+
+    def _check_deadline(self, pages: int):
+        """
+        raises if run deadline was reached. requests still executing by deadline are abandoned
+        (skipped optional reports or a failed run), so their remaining pages are not requested
+        """
+        if self.deadline and self.deadline.expired():
+            raise DeadlineExceeded(f'run deadline reached. request stopped after {pages} pages')
 
     def load_previous_result(self, key):
         previous_result = None
@@ -32,64 +77,69 @@ class AwsCostClient:
 
         return previous_result
 
-    @staticmethod
-    def get_enriched_env():
-        p_env = os.environ.copy()
-        p_env['AWS_ACCESS_KEY_ID'] = AWS_ACCESS_KEY_ID
-        p_env['AWS_SECRET_ACCESS_KEY'] = AWS_SECRET_ACCESS_KEY
-        p_env['AWS_DEFAULT_REGION'] = REGION_NAME
+    def _get_costs_filter(self):
+        if not self.config.filtered_costs:
+            return None
+
+        return {"Not": {"Dimensions": {"Key": "RECORD_TYPE", "Values": self.config.filtered_costs}}}
 
-        return p_env
+    def _get_request_key(self, request_name: str, **params) -> str:
+        """
+        returns cache key of request. key is derived from all request parameters (including costs filter),
+        so results of different time windows or group by are never mixed
+        """
+        params = dict(params, filter=self._get_costs_filter())
+        params_hash = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+        return f'{request_name}_{params_hash}'
 
     def get_monthly_cost_forecast(self, start_date, end_date):
-        res_data = self.load_previous_result('monthly_forecast')
+        cache_key = self._get_request_key('monthly_forecast', start=start_date, end=end_date)
+        res_data = self.load_previous_result(cache_key)
 
         if not res_data:
             logger.info("getting cost forecast from AWS")
 
-            if self.config.filtered_costs:
-                costs_filter = {"Not": {"Dimensions": {"Key": "RECORD_TYPE", "Values": self.config.filtered_costs}}}
-                cost_filter_file = 'cost_filter.json'
-
-                with open(cost_filter_file, 'w') as f:
-                    json.dump(costs_filter, f)
-
-            p_env = self.get_enriched_env()
-
-            params = ['aws', 'ce', 'get-cost-forecast',
-                      '--metric', 'UNBLENDED_COST',
-                      '--time-period', f'Start={start_date},End={end_date}',
-                      '--granularity=MONTHLY']
-
-            if self.config.filtered_costs:
-                params.extend(['--filter', f'file://{cost_filter_file}'])
+            kwargs = {}
+            costs_filter = self._get_costs_filter()
+            if costs_filter:
+                kwargs['Filter'] = costs_filter
 
-            result = subprocess.Popen(params,
-                                      env=p_env,
-                                      stdout=subprocess.PIPE).communicate()[0]
-            self.cache.save('monthly_forecast', result.decode("utf-8"))
-            res_data = json.loads(result)
-
-            if self.config.filtered_costs:
-                os.remove(cost_filter_file)
+            data = self.executor.call(self.client.get_cost_forecast,
+                                      TimePeriod={'Start': start_date, 'End': end_date},
+                                      Metric='UNBLENDED_COST',
+                                      Granularity='MONTHLY',
+                                      **kwargs)
+            res_data = {'Total': data['Total']}
+            self.cache.save(cache_key, json.dumps(res_data))
 
         return int(float(res_data['Total']['Amount']))
 
     def get_available_tags(self, start_date, end_date):
-        res_data = self.load_previous_result('available_tags')
+        cache_key = self._get_request_key('available_tags', start=start_date, end=end_date)
+        res_data = self.load_previous_result(cache_key)
 
         if not res_data:
             logger.info("getting available tags from AWS")
 
-            p_env = self.get_enriched_env()
+            tags = []
+            token = None
+            pages = 0
+            while True:
+                self._check_deadline(pages)
+                kwargs = {'NextPageToken': token} if token else {}
+                data = self.executor.call(self.client.get_tags,
+                                          TimePeriod={'Start': str(start_date), 'End': str(end_date)},
+                                          **kwargs)
+                tags += data['Tags']
+                record_api_call(pages=1, api_calls=0)
+                token = data.get('NextPageToken')
+                pages += 1
 
-            params = ['aws', 'ce', 'get-tags', '--time-period', f'Start={start_date},End={end_date}']
+                if not token:
+                    break
 
-            result = subprocess.Popen(params,
-                                      env=p_env,
-                                      stdout=subprocess.PIPE).communicate()[0]
-            self.cache.save('available_tags', result.decode("utf-8"))
-            res_data = json.loads(result)
+            res_data = {'Tags': tags}
+            self.cache.save(cache_key, json.dumps(res_data))
 
         return res_data['Tags']
 
@@ -111,64 +161,241 @@ class AwsCostClient:
         :return:
         """
         request_name = request_name.lower().replace(' ', '_')
-        results = self.load_previous_result(request_name)
+        groups = self._get_groups(group_by_dimensions, group_by_tags)
+
+        cache_key = self._get_request_key(request_name, start=start, end=end, granularity=granularity, group_by=groups)
+        results = self.load_previous_result(cache_key)
 
         if not results:
             logger.info(f'getting {request_name} data from AWS')
-            groups = []
 
-            if group_by_dimensions:
-                groups = list(map(lambda d: {"Type": "DIMENSION", "Key": d}, group_by_dimensions))
+            if self.partitions.enabled:
+                results = self._request_incremental(start, end, granularity, groups)
+            else:
+                results = self._request(start, end, granularity, groups)
 
-            if group_by_tags:
-                groups.extend(list(map(lambda d: {"Type": "TAG", "Key": d}, group_by_tags)))
+            self.cache.save(cache_key, json.dumps(results))
 
-            results = []
+        return results
+
+    def iter_cost_and_usage(self,
+                            start: date,
+                            end: date,
+                            request_name: str,
+                            granularity='MONTHLY',
+                            group_by_dimensions=None,
+                            group_by_tags=None) -> Iterator[List[Dict]]:
+        """
+        same as request_cost_and_usage, yields results page by page as pages are fetched, so pages are not retained.
+        results of the same time period may be split between pages.
+        when results are cached (use_cache) or partitioned (incremental_fetch) they are requested and yielded at once
+        """
+        if self.cache.enabled or self.partitions.enabled:
+            yield self.request_cost_and_usage(start=start,
+                                              end=end,
+                                              request_name=request_name,
+                                              granularity=granularity,
+                                              group_by_dimensions=group_by_dimensions,
+                                              group_by_tags=group_by_tags)
+            return
+
+        logger.info(f"getting {request_name.lower().replace(' ', '_')} data from AWS")
+        yield from self._iter_pages(start, end, granularity, self._get_groups(group_by_dimensions, group_by_tags))
+
+    @staticmethod
+    def _get_groups(group_by_dimensions=None, group_by_tags=None) -> List[Dict]:
+        groups = []
+
+        if group_by_dimensions:
+            groups = list(map(lambda d: {"Type": "DIMENSION", "Key": d}, group_by_dimensions))
+
+        if group_by_tags:
+            groups.extend(list(map(lambda d: {"Type": "TAG", "Key": d}, group_by_tags)))
 
+        return groups
+
+    def _get_checkpoint_key(self, start: date, end: date, granularity, groups):
+        return self._get_request_key('checkpoint', start=start, end=end, granularity=granularity, group_by=groups)
+
+    @staticmethod
+    def _get_page_key(checkpoint_key: str, page: int):
+        return f'{checkpoint_key}:{page}'
+
+    def _load_checkpoint(self, checkpoint_key: str) -> Optional[Dict]:
+        """
+        returns checkpoint of an interrupted request (fetched pages results and next page token)
+        or None when there is no (complete) checkpoint
+        """
+        if not self.checkpoints.enabled:
+            return None
+
+        checkpoint = self.checkpoints.get(checkpoint_key)
+        if not checkpoint:
+            return None
+
+        checkpoint = json.loads(checkpoint)
+        results = []
+        for page in range(checkpoint['pages']):
+            page_results = self.checkpoints.get(self._get_page_key(checkpoint_key, page))
+            if page_results is None:
+                logger.warning(f'checkpoint page {page} is missing. restarting request')
+                self._delete_checkpoint(checkpoint_key, checkpoint['pages'])
+                return None
+            results += json.loads(page_results)
+
+        checkpoint['results'] = results
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint_key: str, page: int, page_results: List[Dict], token: str):
+        """
+        checkpoints a fetched page. checkpoints are best effort: when they can not be written (e.g. read only
+        cache directory) checkpoints are disabled and the request continues without them
+        """
+        if not self.checkpoints.enabled:
+            return
+
+        try:
+            # page is saved before the checkpoint referencing it
+            self.checkpoints.save(self._get_page_key(checkpoint_key, page), json.dumps(page_results))
+            self.checkpoints.save(checkpoint_key, json.dumps({'pages': page + 1, 'token': token}))
+        except Exception as e:
+            logger.warning(f'could not save request checkpoint: {str(e)}. disabling checkpoints')
+            self.checkpoints.enabled = False
+
+    def _delete_checkpoint(self, checkpoint_key: str, pages: int):
+        self.checkpoints.delete(checkpoint_key)
+        for page in range(pages):
+            self.checkpoints.delete(self._get_page_key(checkpoint_key, page))
+
+    def _request(self, start: date, end: date, granularity, groups) -> List[Dict]:
+        """
+        requests all result pages. returns a single result per time period
+        """
+        return self._merge_pages([result for page in self._iter_pages(start, end, granularity, groups)
+                                  for result in page])
+
+    def _iter_pages(self, start: date, end: date, granularity, groups) -> Iterator[List[Dict]]:
+        """
+        requests and yields results of every page. when checkpoints are enabled, every fetched page is checkpointed
+        (under its own key, along with the fetched pages count and next page token) so a request interrupted
+        (e.g. by throttling retries exhaustion) resumes from its last page
+        """
+        checkpoint_key = self._get_checkpoint_key(start, end, granularity, groups)
+        checkpoint = self._load_checkpoint(checkpoint_key)
+        if checkpoint:
+            # checkpointed pages are yielded along with the first fetched page (checkpoint may be discarded)
+            results = checkpoint['results']
+            token = checkpoint['token']
+            pages = checkpoint['pages']
+            logger.info(f'resuming request from checkpoint after {pages} pages')
+        else:
+            results = []
             token = None
-            while True:
-                if token:
-                    kwargs = {'NextPageToken': token}
-                else:
-                    kwargs = {}
-
-                if self.config.filtered_costs:
-                    data = self.client.get_cost_and_usage(
-                        TimePeriod={
-                            'Start': start.isoformat(),
-                            'End': end.isoformat()
-                        },
-                        Granularity=granularity,
-                        Metrics=[
-                            'UnblendedCost',
-                        ],
-                        GroupBy=groups,
-                        Filter={
-                            "Not": {
-                                "Dimensions": {
-                                    "Key": "RECORD_TYPE",
-                                    "Values": self.config.filtered_costs
-                                }
-                            }},
-                        **kwargs)
+            pages = 0
+
+        while True:
+            self._check_deadline(pages)
+            if token:
+                kwargs = {'NextPageToken': token}
+            else:
+                kwargs = {}
+
+            costs_filter = self._get_costs_filter()
+            if costs_filter:
+                kwargs['Filter'] = costs_filter
+
+            try:
+                data = self.executor.call(self.client.get_cost_and_usage,
+                                          TimePeriod={
+                                              'Start': start.isoformat(),
+                                              'End': end.isoformat()
+                                          },
+                                          Granularity=granularity,
+                                          Metrics=[
+                                              'UnblendedCost',
+                                          ],
+                                          GroupBy=groups,
+                                          **kwargs)
+            except ClientError as e:
+                if checkpoint and not is_throttling_error(e):
+                    # checkpointed page token may have expired
+                    logger.warning(f'could not resume request from checkpoint: {str(e)}. restarting request')
+                    self._delete_checkpoint(checkpoint_key, checkpoint['pages'])
+                    yield from self._iter_pages(start, end, granularity, groups)
+                    return
+                raise
+
+            checkpoint = None
+            record_api_call(pages=1, api_calls=0)
+            self.page_groups = max(self.page_groups, sum(len(r['Groups']) for r in data['ResultsByTime']))
+            yield results + data['ResultsByTime']
+            results = []
+            token = data.get('NextPageToken')
+
+            if not token:
+                break
+
+            self._save_checkpoint(checkpoint_key, pages, data['ResultsByTime'], token)
+            pages += 1
+
+        if pages and self.checkpoints.enabled:
+            self._delete_checkpoint(checkpoint_key, pages)
+
+    @staticmethod
+    def _merge_pages(results: List[Dict]) -> List[Dict]:
+        """
+        groups of the same time period may be split between result pages.
+        returns a single result per time period
+        """
+        merged = {}
+        for result in results:
+            period_start = result['TimePeriod']['Start']
+            if period_start in merged:
+                merged[period_start]['Groups'] += result['Groups']
+            else:
+                merged[period_start] = result
+
+        return list(merged.values())
+
+    def _get_partition_key(self, granularity, groups, period_start: date):
+        shape = json.dumps({'group_by': groups, 'filter': self._get_costs_filter()}, sort_keys=True)
+        shape_hash = hashlib.sha1(shape.encode('utf-8')).hexdigest()[:16]
+        return f'{granularity.lower()}_{shape_hash}_{period_start.isoformat()}'
+
+    def _request_incremental(self, start: date, end: date, granularity, groups) -> List[Dict]:
+        """
+        returns closed periods results from partitions cache and requests only the remaining
+        (open or not yet cached) periods from AWS. closed periods results are cached forever
+        """
+        closed_until = get_days_back(RESTATED_DAYS)
+        cacheable = {}
+        results = []
+        fetch_start = None
+
+        for period_start, period_end in split_time_period(start, end, granularity):
+            aligned = granularity == 'DAILY' or period_start.day == 1
+            closed = aligned and period_end <= end and period_end <= closed_until
+            key = self._get_partition_key(granularity, groups, period_start)
+            if closed:
+                cacheable[period_start.isoformat()] = key
+
+            if fetch_start is None:
+                raw_result = self.partitions.get(key) if closed else None
+                if raw_result:
+                    results.append(json.loads(raw_result))
                 else:
-                    data = self.client.get_cost_and_usage(
-                        TimePeriod={
-                            'Start': start.isoformat(),
-                            'End': end.isoformat()
-                        },
-                        Granularity=granularity,
-                        Metrics=[
-                            'UnblendedCost',
-                        ],
-                        GroupBy=groups,
-                        **kwargs)
-
-                results += data['ResultsByTime']
-                token = data.get('NextPageToken')
+                    fetch_start = period_start
 
-                if not token:
-                    self.cache.save(request_name, json.dumps(results))
-                    break
+        if fetch_start is None:
+            logger.info(f'all {len(results)} periods were loaded from partitions cache')
+            return results
 
-        return results
+        logger.info(f'{len(results)} periods loaded from partitions cache. requesting periods from {fetch_start}')
+        fetched = self._request(fetch_start, end, granularity, groups)
+
+        for result in fetched:
+            key = cacheable.get(result['TimePeriod']['Start'])
+            if key and not result.get('Estimated'):
+                self.partitions.save(key, json.dumps(result))
+
+        return results + fetched
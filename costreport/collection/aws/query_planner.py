@@ -0,0 +1,397 @@
+import json
+import logging
+import math
+import threading
+import time
+from datetime import date
+from itertools import combinations
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from costreport.collection.aws.cost_client import AwsCostClient
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.date_utils import split_time_period
+
+logger = logging.getLogger(__name__)
+
+QUERY_STATS_KEY = 'query_stats'
+# statistics of query shapes which were not executed since are discarded, so paired queries which did not lower
+# number of calls are reconsidered
+QUERY_STATS_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+class _Query:
+    """
+    cost and usage query shape (granularity and group by) and time window
+    """
+
+    def __init__(self, start: date, end: date, granularity: str, group_by_dimensions=None, group_by_tags=None):
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.group_by_dimensions = list(group_by_dimensions or [])
+        self.group_by_tags = list(group_by_tags or [])
+
+    @property
+    def shape(self) -> Tuple:
+        return self.granularity, tuple(self.group_by_dimensions), tuple(self.group_by_tags)
+
+    @property
+    def name(self) -> str:
+        return '_'.join(['planned', self.granularity] + self.group_by_dimensions + self.group_by_tags)
+
+    @property
+    def stats_key(self) -> str:
+        return ':'.join([self.granularity, ','.join(self.group_by_dimensions), ','.join(self.group_by_tags)])
+
+    @property
+    def periods(self) -> int:
+        return len(split_time_period(self.start, self.end, self.granularity))
+
+    def extend(self, other: '_Query'):
+        self.start = min(self.start, other.start)
+        self.end = max(self.end, other.end)
+
+
+class QueryStats:
+    """
+    result groups per period of executed query shapes and result groups per page, recorded by previous runs
+    and kept in cache (best effort). used to estimate number of result pages (cost explorer calls) of queries
+    """
+
+    def __init__(self, cache: Optional[RawDateCacheManager] = None):
+        """
+        :param cache: stats cache. stats are not kept between runs if not provided
+        """
+        self.cache = cache
+        self.page_groups = 0
+        # stats key -> (groups per period, recording time)
+        self.groups: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        stats = self.cache.get(QUERY_STATS_KEY) if self.cache else None
+        stats = json.loads(stats) if stats else {}
+        min_time = time.time() - QUERY_STATS_MAX_AGE_SECONDS
+        with self._lock:
+            self.page_groups = stats.get('page_groups', 0)
+            self.groups = {k: tuple(v) for k, v in stats.get('groups', {}).items() if v[1] >= min_time}
+
+    def record(self, query: _Query, groups: int, page_groups: int):
+        """
+        :param query: executed query (or query rolled up from executed query results)
+        :param groups: number of result groups of query time window
+        :param page_groups: largest number of result groups of a page fetched so far
+        """
+        with self._lock:
+            self.groups[query.stats_key] = (groups / max(1, query.periods), time.time())
+            self.page_groups = max(self.page_groups, page_groups)
+            stats = json.dumps({'page_groups': self.page_groups, 'groups': self.groups})
+
+        if not self.cache:
+            return
+
+        try:
+            self.cache.save(QUERY_STATS_KEY, stats)
+        except Exception as e:
+            logger.warning(f'could not save query stats: {str(e)}')
+
+    def get_groups(self, query: _Query) -> Optional[float]:
+        """
+        returns recorded result groups per period of query shape. None if shape was not executed recently
+        """
+        stats = self.groups.get(query.stats_key)
+        return stats[0] if stats else None
+
+    def estimate_pages(self, query: _Query, groups: Optional[float] = None) -> Optional[int]:
+        """
+        returns estimated number of result pages of query. None if there are no stats to estimate by
+        :param query:
+        :param groups: result groups per period. defaults to recorded groups per period of query shape
+        """
+        groups = self.get_groups(query) if groups is None else groups
+        if groups is None or not self.page_groups:
+            return None
+
+        return max(1, math.ceil(groups * query.periods / self.page_groups))
+
+
+class _PlannedQuery(_Query):
+    """
+    query executed once (on first request) on behalf of all requests it covers
+    """
+
+    def __init__(self, query: _Query, requests: int = 1):
+        """
+        :param query:
+        :param requests: number of registered requests served by query
+        """
+        super().__init__(query.start, query.end, query.granularity, query.group_by_dimensions, query.group_by_tags)
+        self.requests = requests
+        self._lock = threading.Lock()
+        self._results = None
+
+    def get_results(self, cost_client: AwsCostClient, stats: QueryStats) -> List[Dict]:
+        with self._lock:
+            if self._results is None:
+                logger.info(f'executing planned query {self.name} from {self.start} to {self.end}')
+                self._results = cost_client.request_cost_and_usage(start=self.start,
+                                                                   end=self.end,
+                                                                   request_name=self.name,
+                                                                   granularity=self.granularity,
+                                                                   group_by_dimensions=self.group_by_dimensions,
+                                                                   group_by_tags=self.group_by_tags)
+                stats.record(self, _count_groups(self._results), cost_client.page_groups)
+
+        return self._results
+
+
+def _count_groups(results: List[Dict]) -> int:
+    return sum(len(result['Groups']) for result in results)
+
+
+class CostQueryPlanner:
+    """
+    merges cost and usage requests of a run:
+    - requests of the same shape (granularity, group by) are fetched once for their widest time window
+      and narrower windows are sliced locally
+    - single key (dimension or tag) requests of the same granularity are paired and fetched as a single two keys
+      group by request (e.g. LINKED_ACCOUNT and a tag) for the widest time window of the pair. results are rolled
+      up locally per key and sliced per request. requests are paired only when the pair is estimated to require
+      fewer calls (result pages) than the separate requests, by stats of previous runs (see QueryStats)
+    requests are expected to be registered before results are requested. unregistered requests are
+    passed to cost client as is
+    """
+
+    def __init__(self, cost_client: AwsCostClient, merge_dimensions=True, stats_cache: RawDateCacheManager = None):
+        """
+        :param cost_client:
+        :param merge_dimensions: whether single key requests are paired
+        :param stats_cache: cache of query stats kept between runs
+        """
+        self.cost_client = cost_client
+        self.merge_dimensions = merge_dimensions
+        self.stats = QueryStats(stats_cache)
+        self._registered: List[_Query] = []
+        # requested shape -> (planned query, group keys index for roll up or None)
+        self._plans: Dict[Tuple, Tuple[_PlannedQuery, Optional[int]]] = {}
+
+    def register(self, start: date, end: date, granularity='MONTHLY', group_by_dimensions=None, group_by_tags=None):
+        self._registered.append(_Query(start, end, granularity, group_by_dimensions, group_by_tags))
+
+    def plan(self):
+        """
+        creates planned queries for registered requests
+        :return:
+        """
+        queries: Dict[Tuple, _Query] = {}
+        requests: Dict[Tuple, int] = {}
+        for query in self._registered:
+            requests[query.shape] = requests.get(query.shape, 0) + 1
+            if query.shape in queries:
+                queries[query.shape].extend(query)
+            else:
+                queries[query.shape] = _Query(query.start, query.end, query.granularity,
+                                              query.group_by_dimensions, query.group_by_tags)
+
+        self._plans = {}
+        if self.merge_dimensions:
+            self.stats.load()
+            self._plan_merged_dimensions(queries)
+
+        for shape, query in queries.items():
+            if shape not in self._plans:
+                self._plans[shape] = (_PlannedQuery(query, requests[shape]), None)
+
+        self._registered = []
+        logger.info(f'planned {len(set(id(p) for p, _ in self._plans.values()))} queries '
+                    f'for {len(self._plans)} requested query shapes')
+
+    def _plan_merged_dimensions(self, queries: Dict[Tuple, _Query]):
+        """
+        pairs single key queries of the same granularity. pairs are chosen by estimated number of saved calls
+        (largest first). pairs which were not executed yet are estimated by groups of their larger key times
+        the lowest ratio of pair groups to larger key groups recorded (see _get_pairing_ratio).
+        a single such pair is tried per run, and is estimated by its recorded stats afterwards
+        """
+        single_key: Dict[str, List[_Query]] = {}
+        for query in queries.values():
+            if len(query.group_by_dimensions) + len(query.group_by_tags) == 1:
+                single_key.setdefault(query.granularity, []).append(query)
+
+        pairs = [pair for granularity_queries in single_key.values()
+                 for pair in combinations(granularity_queries, 2)]
+        ratio = self._get_pairing_ratio(pairs)
+
+        candidates = []
+        for pair in pairs:
+            saved_calls, executed = self._get_saved_calls(pair, ratio)
+            if saved_calls > 0:
+                candidates.append((saved_calls, executed, pair))
+
+        paired = set()
+        tried = False
+        for saved_calls, executed, pair in sorted(candidates, key=lambda c: (not c[1], -c[0])):
+            if any(query.shape in paired for query in pair) or (not executed and tried):
+                continue
+
+            tried = tried or not executed
+            merged = self._merge(pair)
+            logger.info(f'pairing {pair[0].name} and {pair[1].name} queries '
+                        f'(estimated saved calls: {saved_calls})')
+            # group keys of results are ordered as cost explorer group by (dimensions, then tags)
+            keys = [('d', d) for d in merged.group_by_dimensions] + [('t', t) for t in merged.group_by_tags]
+
+            planned = _PlannedQuery(merged, requests=len(pair))
+            for query in pair:
+                key = ('d', query.group_by_dimensions[0]) if query.group_by_dimensions \
+                    else ('t', query.group_by_tags[0])
+                self._plans[query.shape] = (planned, keys.index(key))
+                paired.add(query.shape)
+
+    @staticmethod
+    def _merge(pair: Tuple[_Query, _Query]) -> _Query:
+        merged = _Query(pair[0].start, pair[0].end, pair[0].granularity,
+                        group_by_dimensions=[d for q in pair for d in q.group_by_dimensions],
+                        group_by_tags=[t for q in pair for t in q.group_by_tags])
+        merged.extend(pair[1])
+        return merged
+
+    def _get_pairing_ratio(self, pairs: List[Tuple[_Query, _Query]]) -> float:
+        """
+        returns lowest recorded ratio of pair result groups to its larger key result groups (1 if no pair was
+        executed). two keys results have at least the groups of their larger key, more when keys combine
+        (e.g. a tag value used by resources of several accounts)
+        """
+        ratios = []
+        for pair in pairs:
+            groups = [self.stats.get_groups(query) for query in pair]
+            merged_groups = self.stats.get_groups(self._merge(pair))
+            if merged_groups is not None and None not in groups and max(groups):
+                ratios.append(merged_groups / max(groups))
+
+        return max(1.0, min(ratios)) if ratios else 1.0
+
+    def _get_saved_calls(self, pair: Tuple[_Query, _Query], ratio: float) -> Tuple[int, bool]:
+        """
+        returns estimated number of calls saved by pairing queries (0 if there are no stats to estimate by)
+        and whether the estimate is based on stats of the paired query
+        :param pair:
+        :param ratio: ratio of pair result groups to larger key result groups of pairs which were not executed
+        """
+        separate = [self.stats.estimate_pages(query) for query in pair]
+        if None in separate:
+            return 0, False
+
+        merged = self._merge(pair)
+        merged_pages = self.stats.estimate_pages(merged)
+        if merged_pages is not None:
+            return sum(separate) - merged_pages, True
+
+        groups = ratio * max(self.stats.get_groups(query) for query in pair)
+        return sum(separate) - self.stats.estimate_pages(merged, groups), False
+
+    def request_cost_and_usage(self,
+                               start: date,
+                               end: date,
+                               request_name: str,
+                               granularity='MONTHLY',
+                               group_by_dimensions=None,
+                               group_by_tags=None) -> List[Dict]:
+        """
+        same as AwsCostClient.request_cost_and_usage. planned requests are served from planned query results
+        """
+        plan = self._get_plan(start, end, granularity, group_by_dimensions, group_by_tags)
+
+        if not plan:
+            return self.cost_client.request_cost_and_usage(start=start,
+                                                           end=end,
+                                                           request_name=request_name,
+                                                           granularity=granularity,
+                                                           group_by_dimensions=group_by_dimensions,
+                                                           group_by_tags=group_by_tags)
+
+        planned, rollup_index = plan
+        results = self._slice(planned.get_results(self.cost_client, self.stats), start, end)
+
+        if rollup_index is not None:
+            results = self._rollup(results, rollup_index)
+            # stats of paired queries are kept up to date by their roll ups
+            self.stats.record(_Query(start, end, granularity, group_by_dimensions, group_by_tags),
+                              _count_groups(results), self.cost_client.page_groups)
+
+        return results
+
+    def iter_cost_and_usage(self,
+                            start: date,
+                            end: date,
+                            request_name: str,
+                            granularity='MONTHLY',
+                            group_by_dimensions=None,
+                            group_by_tags=None) -> Iterator[List[Dict]]:
+        """
+        same as AwsCostClient.iter_cost_and_usage. planned queries which serve a single request are streamed page by
+        page (and not retained). results of planned queries shared by several requests are yielded at once
+        """
+        plan = self._get_plan(start, end, granularity, group_by_dimensions, group_by_tags)
+
+        if plan and plan[0].requests > 1:
+            yield self.request_cost_and_usage(start=start,
+                                              end=end,
+                                              request_name=request_name,
+                                              granularity=granularity,
+                                              group_by_dimensions=group_by_dimensions,
+                                              group_by_tags=group_by_tags)
+            return
+
+        query = plan[0] if plan else _Query(start, end, granularity, group_by_dimensions, group_by_tags)
+        groups = 0
+        for page in self.cost_client.iter_cost_and_usage(start=query.start,
+                                                         end=query.end,
+                                                         request_name=query.name if plan else request_name,
+                                                         granularity=granularity,
+                                                         group_by_dimensions=group_by_dimensions,
+                                                         group_by_tags=group_by_tags):
+            groups += _count_groups(page)
+            yield self._slice(page, start, end)
+
+        if plan:
+            self.stats.record(query, groups, self.cost_client.page_groups)
+
+    def _get_plan(self, start: date, end: date, granularity, group_by_dimensions, group_by_tags) \
+            -> Optional[Tuple[_PlannedQuery, Optional[int]]]:
+        """
+        returns (planned query, group keys index for roll up or None) covering request. None if request is not planned
+        """
+        query = _Query(start, end, granularity, group_by_dimensions, group_by_tags)
+        plan = self._plans.get(query.shape)
+
+        if not plan or plan[0].start > start or plan[0].end < end:
+            return None
+
+        return plan
+
+    @staticmethod
+    def _slice(results: List[Dict], start: date, end: date) -> List[Dict]:
+        start_str = start.isoformat()
+        end_str = end.isoformat()
+        return [r for r in results if start_str <= r['TimePeriod']['Start'] < end_str]
+
+    @staticmethod
+    def _rollup(results: List[Dict], index: int) -> List[Dict]:
+        """
+        returns results grouped by a single group key (keys index) of two keys group by results
+        """
+        rolled_up = []
+        for result in results:
+            amounts = {}
+            for group in result['Groups']:
+                key = group['Keys'][index]
+                amounts[key] = amounts.get(key, 0.0) + float(group['Metrics']['UnblendedCost']['Amount'])
+
+            rolled_up.append({'TimePeriod': result['TimePeriod'],
+                              'Total': result.get('Total', {}),
+                              'Estimated': result.get('Estimated', False),
+                              'Groups': [{'Keys': [k], 'Metrics': {'UnblendedCost': {'Amount': str(v), 'Unit': 'USD'}}}
+                                         for k, v in amounts.items()]})
+
+        return rolled_up
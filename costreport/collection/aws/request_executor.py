@@ -0,0 +1,137 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable
+
+from botocore.exceptions import ClientError
+
+from costreport.utils.instrumentation import record_api_call
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'Throttling', 'LimitExceededException',
+                          'RequestLimitExceeded', 'TooManyRequestsException'}
+
+# rate is never lowered below this fraction of the configured rate
+MIN_RATE_FACTOR = 0.1
+# rate recovery (tokens per second) added per successful request after throttling
+RATE_RECOVERY_STEP = 0.1
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20
+
+
+def is_throttling_error(e: Exception) -> bool:
+    return isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+class TokenBucket:
+    """
+    thread safe token bucket. tokens are added at 'rate' tokens per second up to 'capacity'
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        takes a token, waiting for it if the bucket is empty
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+
+class RequestExecutor:
+    """
+    executes API requests of all concurrent callers through a shared token bucket.
+    throttled requests are retried with jittered exponential backoff and the request rate is adapted:
+    lowered (halved) on throttling and gradually restored to the configured rate on success
+    """
+
+    def __init__(self, requests_per_second: float, max_retries: int,
+                 backoff_base_seconds=BACKOFF_BASE_SECONDS, backoff_max_seconds=BACKOFF_MAX_SECONDS):
+        """
+        :param requests_per_second: maximal request rate
+        :param max_retries: number of retries of a throttled request before failing
+        :param backoff_base_seconds:
+        :param backoff_max_seconds:
+        """
+        self.max_rate = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.bucket = TokenBucket(requests_per_second)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def _on_success(self):
+        with self._lock:
+            self.requests += 1
+            if self.bucket.rate < self.max_rate:
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + RATE_RECOVERY_STEP))
+
+    def _on_throttled(self):
+        with self._lock:
+            self.requests += 1
+            self.throttled += 1
+            self.bucket.set_rate(max(self.max_rate * MIN_RATE_FACTOR, self.bucket.rate / 2))
+
+    def _get_backoff(self, attempt: int) -> float:
+        # full jitter
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+
+    def call(self, operation: Callable, **kwargs):
+        """
+        calls operation with kwargs
+        :param operation: API client method
+        :param kwargs: request parameters
+        :return: operation result
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            record_api_call()
+            try:
+                result = operation(**kwargs)
+            except ClientError as e:
+                if not is_throttling_error(e):
+                    raise
+
+                self._on_throttled()
+                if attempt >= self.max_retries:
+                    logger.error(f'request was throttled {attempt + 1} times. giving up')
+                    raise
+
+                backoff = self._get_backoff(attempt)
+                logger.warning(f'request was throttled ({e.response["Error"]["Code"]}). '
+                               f'retrying in {backoff:.2f} seconds')
+                time.sleep(backoff)
+                attempt += 1
+                continue
+
+            self._on_success()
+            return result
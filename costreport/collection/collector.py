@@ -1,11 +1,17 @@
 from abc import ABC
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Iterable
 
+import numpy as np
 import pandas as pd
 
 from costreport.app_config import AppConfig
+from costreport.collection.top_keys import TopKeys
 from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.deadline import Deadline
+
+# report amounts are rounded to one decimal place
+AMOUNT_DECIMALS = 1
 
 
 class Collector(ABC):
@@ -17,6 +23,96 @@ class Collector(ABC):
         self.config = config
         self.exec_time = exec_time
         self.cache = cache
+        self.deadline: Optional[Deadline] = None
+
+    @staticmethod
+    def pivot_long_format(dates: List[str], date_indices: List[int], keys: List[str], amounts: List[float],
+                          decimals: Optional[int] = None):
+        """
+        returns wide dataframe ('dates' column and a column per key, in keys first appearance order)
+        from long format arrays. missing (date, key) values are filled with 0.
+        cost columns are stored as a single (keys x dates) block, so every column is a contiguous array
+        :param dates: dataframe dates
+        :param date_indices: date index (in dates) of each long format record
+        :param keys: key of each long format record
+        :param amounts: amount of each long format record
+        :param decimals: amounts are rounded to decimals (before being summed) if specified
+        :return:
+        """
+        key_codes, columns = pd.factorize(pd.Series(keys, dtype=object))
+        amounts = np.asarray(amounts, dtype=float)
+        if decimals is not None:
+            amounts = np.round(amounts, decimals)
+
+        # records of the same (key, date) are summed
+        cells = key_codes * len(dates) + np.asarray(date_indices, dtype=np.intp)
+        values = np.bincount(cells, weights=amounts, minlength=len(columns) * len(dates))
+        values = values.reshape(len(columns), len(dates))
+
+        dataframe = pd.DataFrame(values.T, columns=columns, copy=False)
+        dataframe.insert(0, 'dates', dates)
+        return dataframe
+
+    def long_to_frame(self, dates: List[str], chunks: Iterable[pd.DataFrame], top_keys: TopKeys = None) \
+            -> pd.DataFrame:
+        """
+        returns dataframe with 'dates' column and a cost column per key from long format rows
+        :param dates: dataframe dates (rows of other dates are ignored)
+        :param chunks: long format rows chunks. with top keys reduction, chunks are reduced one at a time
+        :param top_keys: optional top keys reduction
+        :return:
+        """
+        accounts = self.config.accounts or {}
+        dates_index = pd.Index(dates)
+        date_indices = []
+        keys = []
+        amounts = []
+
+        for rows in chunks:
+            chunk_indices = dates_index.get_indexer(rows['date'])
+            in_range = chunk_indices >= 0
+
+            chunk_keys = [accounts.get(k, k) for k in rows['key'].values[in_range]]
+            chunk_amounts = rows['amount'].values[in_range].tolist()
+            chunk_indices = chunk_indices[in_range].tolist()
+
+            if top_keys:
+                for date_index, key, amount in zip(chunk_indices, chunk_keys, chunk_amounts):
+                    top_keys.add(date_index, key, amount)
+            else:
+                date_indices += chunk_indices
+                keys += chunk_keys
+                amounts += chunk_amounts
+
+        if top_keys:
+            date_indices, keys, amounts = top_keys.result()
+
+        return self.pivot_long_format(dates, date_indices, keys, amounts, AMOUNT_DECIMALS)
+
+    def get_tag_top_keys(self) -> Optional[TopKeys]:
+        """
+        returns tag report top keys reduction. None if tag reports are not reduced
+        """
+        tag_report = self.config.tag_report
+        if not tag_report:
+            return None
+
+        return TopKeys(tag_report.top_n, tag_report.min_share)
+
+    def set_deadline(self, deadline: Optional[Deadline]):
+        """
+        sets run deadline (None if run is not bounded). requests still executing when deadline is reached
+        (e.g. skipped optional reports) are abandoned, so implementations may stop them
+        """
+        self.deadline = deadline
+
+    def plan_requests(self):
+        """
+        called before reports are requested (possibly concurrently).
+        allows implementations to plan and merge their data requests
+        :return:
+        """
+        pass
 
     def get_current_month_forecast(self) -> pd.DataFrame:
         raise NotImplementedError
@@ -0,0 +1,220 @@
+import glob
+import logging
+import os
+import re
+import threading
+from datetime import datetime, date
+from typing import List, Dict, Iterator
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from costreport.app_config import AppConfig
+from costreport.collection.collector import Collector
+from costreport.collection.top_keys import TopKeys
+from costreport.utils.cache_manager import RawDateCacheManager
+from costreport.utils.date_utils import get_today, get_months_back, get_days_back, get_first_day_next_month, \
+    split_time_period
+
+logger = logging.getLogger(__name__)
+
+# normalized (see _normalize) CUR column names. csv ('lineItem/UsageStartDate') and
+# parquet ('line_item_usage_start_date') column names normalize to the same name
+USAGE_DATE_COLUMN = 'lineitemusagestartdate'
+ACCOUNT_COLUMN = 'lineitemusageaccountid'
+SERVICE_COLUMN = 'productproductname'
+COST_COLUMN = 'lineitemunblendedcost'
+LINE_ITEM_TYPE_COLUMN = 'lineitemlineitemtype'
+TAG_COLUMN_PREFIX = 'resourcetagsuser'
+
+# number of trailing days used for current month forecast
+FORECAST_DAYS_BACK = 7
+
+CUR_FILE_SUFFIXES = ('.csv', '.csv.gz', '.parquet')
+
+
+def _normalize(column_name: str) -> str:
+    return re.sub('[^a-z0-9]', '', column_name.lower())
+
+
+def _tag_name(column_name: str) -> str:
+    """
+    returns tag name of csv ('resourceTags/user:env') or parquet ('resource_tags_user_env') tag column
+    """
+    if ':' in column_name:
+        return column_name.split(':', 1)[1]
+
+    return column_name[len('resource_tags_user_'):]
+
+
+class CurCollector(Collector):
+    """
+    collector implementation reading local cost and usage report (CUR) files.
+    files are streamed in chunks and aggregated (per date and account, service and requested tags)
+    in a single pass which is shared by all reports of a run, so memory is bounded by the aggregates size
+    """
+
+    def __init__(self, config: AppConfig, exec_time: datetime, cache: RawDateCacheManager):
+        super().__init__(config, exec_time, cache)
+        self.directory = config.cur.directory
+        self.chunk_rows = config.cur.chunk_rows
+        self._lock = threading.Lock()
+        self._aggregates = None
+        self._tag_columns = {}
+
+    def plan_requests(self):
+        # files are re-scanned on every run
+        with self._lock:
+            self._aggregates = None
+
+    def _get_files(self) -> List[str]:
+        files = glob.glob(os.path.join(self.directory, '**', '*'), recursive=True)
+        return sorted(f for f in files if f.endswith(CUR_FILE_SUFFIXES))
+
+    def _get_columns(self, path: str) -> List[str]:
+        if path.endswith('.parquet'):
+            return pq.ParquetFile(path).schema_arrow.names
+
+        return pd.read_csv(path, nrows=0).columns.tolist()
+
+    def _iter_chunks(self, path: str, columns: List[str]) -> Iterator[pd.DataFrame]:
+        """
+        yields file chunks with given (normalized) columns
+        """
+        file_columns = [c for c in self._get_columns(path) if _normalize(c) in columns]
+
+        if path.endswith('.parquet'):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=self.chunk_rows, columns=file_columns):
+                yield batch.to_pandas().rename(columns=_normalize)
+        else:
+            for chunk in pd.read_csv(path, usecols=file_columns, dtype=str, chunksize=self.chunk_rows):
+                yield chunk.rename(columns=_normalize)
+
+    def _get_window_start(self) -> date:
+        periods = self.config.periods
+        return min(get_months_back(periods.monthly_report_months_back),
+                   get_days_back(periods.daily_report_days_back),
+                   get_days_back(periods.services_report_days_back),
+                   get_days_back(periods.tags_report_days_back),
+                   get_days_back(FORECAST_DAYS_BACK))
+
+    @staticmethod
+    def _get_dates(chunk: pd.DataFrame) -> pd.Series:
+        usage_dates = chunk[USAGE_DATE_COLUMN]
+        if pd.api.types.is_datetime64_any_dtype(usage_dates):
+            return usage_dates.dt.strftime('%Y-%m-%d')
+
+        return usage_dates.str[:10]
+
+    def _aggregate_chunk(self, chunk: pd.DataFrame, start: str, end: str) -> Dict[str, pd.Series]:
+        dates = self._get_dates(chunk)
+        mask = (dates >= start) & (dates < end)
+
+        if self.config.filtered_costs and LINE_ITEM_TYPE_COLUMN in chunk:
+            mask &= ~chunk[LINE_ITEM_TYPE_COLUMN].isin(self.config.filtered_costs)
+
+        chunk = chunk[mask].assign(date=dates[mask],
+                                   cost=pd.to_numeric(chunk.loc[mask, COST_COLUMN], errors='coerce').fillna(0))
+
+        partials = {'LINKED_ACCOUNT': chunk.groupby(['date', ACCOUNT_COLUMN], sort=False)['cost'].sum(),
+                    'SERVICE': chunk.groupby(['date', SERVICE_COLUMN], sort=False)['cost'].sum()}
+
+        for tag, column in self._tag_columns.items():
+            if column in chunk:
+                keys = tag + '$' + chunk[column].fillna('').astype(str)
+            else:
+                keys = pd.Series(f'{tag}$', index=chunk.index)
+
+            partials[f'TAG:{tag}'] = chunk.groupby([chunk['date'], keys], sort=False)['cost'].sum()
+
+        return partials
+
+    def _scan(self) -> Dict[str, pd.Series]:
+        """
+        returns cost per (date, key) series by dimension, aggregated from all CUR files in a single pass
+        """
+        start = self._get_window_start().isoformat()
+        end = get_today().isoformat()
+        self._tag_columns = {tag: _normalize(f'resourceTags/user:{tag}') for tag in self.config.resource_tags}
+        columns = {USAGE_DATE_COLUMN, ACCOUNT_COLUMN, SERVICE_COLUMN, COST_COLUMN, LINE_ITEM_TYPE_COLUMN} | \
+            set(self._tag_columns.values())
+
+        aggregates: Dict[str, pd.Series] = {}
+        files = self._get_files()
+        logger.info(f'aggregating {len(files)} CUR files from {start} to {end}')
+
+        for path in files:
+            for chunk in self._iter_chunks(path, columns):
+                for dimension, partial in self._aggregate_chunk(chunk, start, end).items():
+                    if dimension in aggregates:
+                        aggregates[dimension] = aggregates[dimension].add(partial, fill_value=0)
+                    else:
+                        aggregates[dimension] = partial
+
+        return aggregates
+
+    def _get_aggregates(self) -> Dict[str, pd.Series]:
+        with self._lock:
+            if self._aggregates is None:
+                self._aggregates = self._scan()
+
+        return self._aggregates
+
+    def _get_rows(self, dimension: str) -> pd.DataFrame:
+        """
+        returns long format (date, key, amount) rows of dimension
+        """
+        series = self._get_aggregates().get(dimension)
+        if series is None or series.empty:
+            return pd.DataFrame({'date': pd.Series([], dtype=object),
+                                 'key': pd.Series([], dtype=object),
+                                 'amount': pd.Series([], dtype=float)})
+
+        rows = series.reset_index()
+        rows.columns = ['date', 'key', 'amount']
+        return rows.sort_values('date', kind='mergesort')
+
+    def _get_report(self, dimension: str, start: date, granularity='DAILY', top_keys: TopKeys = None) \
+            -> pd.DataFrame:
+        rows = self._get_rows(dimension)
+        if granularity == 'MONTHLY':
+            rows = rows.assign(date=rows['date'].str[:8] + '01') \
+                .groupby(['date', 'key'], sort=False)['amount'].sum().reset_index()
+
+        dates = [period_start.isoformat() for period_start, _ in split_time_period(start, get_today(), granularity)]
+        return self.long_to_frame(dates, [rows], top_keys)
+
+    def get_monthly_report(self) -> pd.DataFrame:
+        return self._get_report('LINKED_ACCOUNT', get_months_back(self.config.periods.monthly_report_months_back),
+                                granularity='MONTHLY')
+
+    def get_daily_report(self) -> pd.DataFrame:
+        return self._get_report('LINKED_ACCOUNT', get_days_back(self.config.periods.daily_report_days_back))
+
+    def get_services_report(self) -> pd.DataFrame:
+        return self._get_report('SERVICE', get_days_back(self.config.periods.services_report_days_back))
+
+    def get_tag_report(self, tag_name) -> pd.DataFrame:
+        return self._get_report(f'TAG:{tag_name}', get_days_back(self.config.periods.tags_report_days_back),
+                                top_keys=self.get_tag_top_keys())
+
+    def get_available_tags(self) -> List[str]:
+        tags = []
+        for path in self._get_files():
+            for column in self._get_columns(path):
+                if _normalize(column).startswith(TAG_COLUMN_PREFIX) and _tag_name(column) not in tags:
+                    tags.append(_tag_name(column))
+
+        return tags
+
+    def get_current_month_forecast(self) -> pd.DataFrame:
+        """
+        CUR files do not include forecasts. forecast is the average daily cost of the last
+        FORECAST_DAYS_BACK days multiplied by the number of remaining days of the month
+        """
+        rows = self._get_rows('LINKED_ACCOUNT')
+        recent = rows[rows['date'] >= get_days_back(FORECAST_DAYS_BACK).isoformat()]
+        remaining_days = (get_first_day_next_month() - get_today()).days
+        forecast = recent['amount'].sum() / FORECAST_DAYS_BACK * remaining_days
+
+        return pd.DataFrame.from_dict({'values': [int(forecast)]})
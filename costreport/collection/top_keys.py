@@ -0,0 +1,115 @@
+import heapq
+import logging
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# key of summed costs of keys out of the top N (tag values). parentheses are not valid in tag values,
+# so the key does not clash with a reported tag value
+OTHER_KEY = '(other values)'
+
+# number of tracked keys per reported key
+CAPACITY_FACTOR = 10
+MIN_CAPACITY = 100
+
+
+class TopKeys:
+    """
+    single pass top N keys (by cost) reduction of long format (date index, key, amount) records.
+    costs of keys out of the top N, or with a cost share below min share, are summed into an OTHER_KEY key.
+
+    memory is bounded regardless of the number of distinct keys: a bounded number of keys is tracked
+    (space saving algorithm). when a new key arrives and all counters are in use, the key with the minimal
+    cost estimate is evicted and its per date costs are moved to OTHER_KEY, so the sum of costs is preserved
+    """
+
+    def __init__(self, top_n: int, min_share: float = 0.0):
+        """
+        :param top_n: number of reported keys
+        :param min_share: minimal key share (0-1) of total cost. keys below are reported as OTHER_KEY
+        """
+        self.top_n = top_n
+        self.min_share = min_share
+        self.capacity = max(top_n * CAPACITY_FACTOR, MIN_CAPACITY)
+        # key -> cost estimate (space saving counter)
+        self._counts: Dict[str, float] = {}
+        # key -> date index -> amount (tracked since key was last added)
+        self._amounts: Dict[str, Dict[int, float]] = {}
+        self._other: Dict[int, float] = {}
+        # (count, key) min heap. entries of updated or evicted counters are skipped on pop
+        self._heap: List[Tuple[float, str]] = []
+        self.records = 0
+        self.evicted = 0
+
+    def add(self, date_index: int, key: str, amount: float):
+        self.records += 1
+        weight = abs(amount)
+
+        if key in self._counts:
+            count = self._counts[key] + weight
+        elif len(self._counts) < self.capacity:
+            count = weight
+            self._amounts[key] = {}
+        else:
+            count = self._evict_min() + weight
+            self._amounts[key] = {}
+
+        self._counts[key] = count
+        key_amounts = self._amounts[key]
+        key_amounts[date_index] = key_amounts.get(date_index, 0.0) + amount
+        self._push(count, key)
+
+    def _push(self, count: float, key: str):
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 4 * self.capacity:
+            # drop outdated entries
+            self._heap = [(c, k) for k, c in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def _evict_min(self) -> float:
+        """
+        evicts the key with the minimal cost estimate. returns its cost estimate
+        """
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == count:
+                break
+
+        del self._counts[key]
+        for date_index, amount in self._amounts.pop(key).items():
+            self._other[date_index] = self._other.get(date_index, 0.0) + amount
+
+        self.evicted += 1
+        return count
+
+    def result(self) -> Tuple[List[int], List[str], List[float]]:
+        """
+        returns long format (date indices, keys, amounts) arrays of top keys and OTHER_KEY
+        """
+        totals = {key: sum(amounts.values()) for key, amounts in self._amounts.items()}
+        total = sum(abs(t) for t in totals.values()) + sum(abs(a) for a in self._other.values())
+        ranked = sorted(totals, key=lambda k: abs(totals[k]), reverse=True)
+        top = [k for k in ranked[:self.top_n] if not total or abs(totals[k]) / total >= self.min_share]
+
+        other = dict(self._other)
+        for key in ranked:
+            if key not in top:
+                for date_index, amount in self._amounts[key].items():
+                    other[date_index] = other.get(date_index, 0.0) + amount
+
+        date_indices = []
+        keys = []
+        amounts = []
+        for key in top:
+            for date_index, amount in self._amounts[key].items():
+                date_indices.append(date_index)
+                keys.append(key)
+                amounts.append(amount)
+
+        for date_index, amount in other.items():
+            date_indices.append(date_index)
+            keys.append(OTHER_KEY)
+            amounts.append(amount)
+
+        logger.debug(f'reduced {self.records} records to {len(top)} top keys ({self.evicted} evictions)')
+        return date_indices, keys, amounts
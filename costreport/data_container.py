@@ -2,6 +2,7 @@ from typing import Dict, Union
 
 from pandas import DataFrame
 
+from costreport.analysis.aggregations import FrameAggregates
 from costreport.utils.consts import ReportItemGroup
 
 
@@ -19,6 +20,7 @@ class DataContainer:
 
     def __init__(self):
         self.data_items: Dict[str, DataItem] = {}
+        self._aggregates: Dict[str, FrameAggregates] = {}
 
     def add(self, name: str, value: Union[DataFrame, str], group: ReportItemGroup = None):
         """
@@ -28,12 +30,27 @@ class DataContainer:
         :return:
         """
         self.data_items[name] = DataItem(name, value, group)
+        self._aggregates.pop(name, None)
 
     def get(self, item_name: str) -> DataItem:
         return self.data_items[item_name]
 
+    def has(self, item_name: str) -> bool:
+        return item_name in self.data_items
+
     def get_value(self, item_name: str) -> Union[DataFrame, str]:
         return self.data_items[item_name].value
 
     def get_by_group(self, group: ReportItemGroup):
         return list(filter(lambda i: i.group == group, self.data_items.values()))
+
+    def aggregates(self, item_name: str) -> FrameAggregates:
+        """
+        returns (shared) aggregates of a dataframe data item
+        :param item_name:
+        :return:
+        """
+        if item_name not in self._aggregates:
+            self._aggregates[item_name] = FrameAggregates(self.get_value(item_name))
+
+        return self._aggregates[item_name]
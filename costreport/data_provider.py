@@ -1,98 +1,191 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from datetime import datetime
+from typing import Dict, List, Optional
 
 import pandas as pd
 
+from costreport.analysis import aggregations
 from costreport.app_config import AppConfig
 from costreport.collection.collector import Collector
 from costreport.data_container import DataContainer
 from costreport.utils import consts
 from costreport.utils.consts import ReportItemName, ReportItemGroup
 from costreport.utils.date_utils import format_datetime, TIME_FORMAT
+from costreport.utils.deadline import Deadline, DeadlineExceeded
+from costreport.utils.instrumentation import instrumented, submit
 
 logger = logging.getLogger(__name__)
 
+SERVICES_REQUEST = 'services'
+AVAILABLE_TAGS_REQUEST = 'available_tags'
+TAG_REQUEST_PREFIX = 'tag:'
+
+
+def is_optional_request(name: str) -> bool:
+    """
+    optional requests (services and tag reports) are skipped when run deadline is reached
+    """
+    return name in [SERVICES_REQUEST, AVAILABLE_TAGS_REQUEST] or name.startswith(TAG_REQUEST_PREFIX)
+
 
 class DataProvider:
 
     def __init__(self,
                  exec_time: datetime,
                  config: AppConfig,
-                 collector: Collector):
+                 collector: Collector,
+                 deadline: Deadline = None):
+        """
+        :param exec_time:
+        :param config:
+        :param collector:
+        :param deadline: data fetch deadline. requests which did not complete by deadline fail the run,
+        except for optional requests which are skipped (their report items are not generated)
+        """
         self.exec_time = exec_time
         self.config = config
         self.collector = collector
+        self.deadline = deadline
+        self.skipped: List[str] = []
+        self._fetch_deadline: Optional[Deadline] = None
 
         self.data_container: DataContainer = DataContainer()
 
+    @instrumented('provide')
     def generate(self) -> DataContainer:
         logger.info('fetching data and creating data items')
         self.generate_current_date()
-        self.generate_current_month_forecast()
-        self.generate_daily_report()
-        self.generate_monthly_report()
-        self.generate_services_report()
-        self.get_available_tags()
-        self.generate_tag_reports()
+        self.collector.set_deadline(self.deadline)
+        self.collector.plan_requests()
+        # fetch timeout bounds all requests together (not each wait)
+        self._fetch_deadline = Deadline(self.config.fetch.timeout_seconds)
+
+        pool = ThreadPoolExecutor(max_workers=self.config.fetch.max_workers, thread_name_prefix='fetch')
+        futures = {}
+        try:
+            self._submit_fetches(pool, futures)
+            # required requests are waited for first, optional requests are waited for until deadline
+            results = {name: self._wait(name, future) for name, future in futures.items()
+                       if not is_optional_request(name)}
+            for name, future in futures.items():
+                if is_optional_request(name):
+                    result = self._wait_optional(name, future)
+                    if result is not None:
+                        results[name] = result
+        except Exception:
+            # cancels requests which did not start. running requests can not be interrupted and keep running
+            for future in futures.values():
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=False)
+
+        # assembly is done by the calling thread in a fixed order so data container content
+        # does not depend on requests completion order
+        self.generate_current_month_forecast(results['forecast'])
+        self.generate_daily_report(results['daily'])
+        self.generate_monthly_report(results['monthly'])
+        if SERVICES_REQUEST in results:
+            self.generate_services_report(results[SERVICES_REQUEST])
+        if AVAILABLE_TAGS_REQUEST in results:
+            self.get_available_tags(results[AVAILABLE_TAGS_REQUEST])
+        self.generate_tag_reports({tag: results[f'{TAG_REQUEST_PREFIX}{tag}'] for tag in self.config.resource_tags
+                                   if f'{TAG_REQUEST_PREFIX}{tag}' in results})
+
+        if self.skipped:
+            logger.warning(f'run deadline reached. skipped optional reports: {self.skipped}')
 
         return self.data_container
 
-    def get_available_tags(self):
-        avail_tags = self.collector.get_available_tags()
+    def _submit_fetches(self, pool: ThreadPoolExecutor, futures: Dict):
+        """
+        submits all collector requests to the fetch pool (in current context, see instrumentation.submit)
+        :param pool:
+        :param futures: filled with submitted futures by request name
+        :return:
+        """
+        futures['forecast'] = submit(pool, self.collector.get_current_month_forecast)
+        futures['daily'] = submit(pool, self.collector.get_daily_report)
+        futures['monthly'] = submit(pool, self.collector.get_monthly_report)
+        if self.deadline and self.deadline.expired():
+            self.skipped += [SERVICES_REQUEST, AVAILABLE_TAGS_REQUEST] + \
+                            [f'{TAG_REQUEST_PREFIX}{tag}' for tag in self.config.resource_tags]
+            return
+
+        futures[SERVICES_REQUEST] = submit(pool, self.collector.get_services_report)
+        futures[AVAILABLE_TAGS_REQUEST] = submit(pool, self.collector.get_available_tags)
+
+        for tag in self.config.resource_tags:
+            logger.info(f'generating cost report for tag {tag}')
+            futures[f'{TAG_REQUEST_PREFIX}{tag}'] = submit(pool, self.collector.get_tag_report, tag)
+
+    def _get_timeout(self) -> float:
+        """
+        returns time left until fetch timeout (or run deadline if earlier)
+        """
+        timeout = self._fetch_deadline.remaining()
+        return self.deadline.timeout(timeout) if self.deadline else timeout
+
+    def _wait(self, name, future):
+        try:
+            return future.result(timeout=self._get_timeout())
+        except (TimeoutError, DeadlineExceeded):
+            if self.deadline and self.deadline.expired():
+                raise DeadlineExceeded(f'{name} request did not complete by run deadline')
+            raise TimeoutError(f'{name} request did not complete within fetch timeout '
+                               f'({self.config.fetch.timeout_seconds:.0f} seconds)')
+
+    def _wait_optional(self, name, future):
+        """
+        returns optional request result, or None if request was skipped since run deadline was reached
+        """
+        if not self.deadline:
+            return self._wait(name, future)
+
+        try:
+            return future.result(timeout=self._get_timeout())
+        except (TimeoutError, DeadlineExceeded):
+            # request may have been stopped by the deadline, or still complete in background (its results are cached)
+            self.skipped.append(name)
+            return None
+
+    def get_available_tags(self, avail_tags):
         logger.info(f'available tags for tag reports time window:{avail_tags}')
 
     @staticmethod
     def get_totals(dataframe):
-        account_col_names = dataframe.columns.tolist()
-        account_col_names.remove('dates')
-
-        totals = []
-        for i in range(0, len(dataframe['dates'].tolist())):
-            total = 0
-            for account in account_col_names:
-                total += dataframe[account].tolist()[i]
-            totals.append(total)
-
-        return pd.DataFrame.from_dict({
-            'dates': dataframe['dates'].tolist(),
-            'values': totals})
+        return aggregations.row_totals(dataframe)
 
     def generate_current_date(self):
         item_name = consts.ReportItemName.CURRENT_DATE.value
         exec_time_str = format_datetime(self.exec_time, TIME_FORMAT)
         self.data_container.add(item_name, exec_time_str)
 
-    def generate_monthly_report(self):
+    def generate_monthly_report(self, dataframe: pd.DataFrame):
         item_name = consts.ReportItemName.MONTHLY_COST.value
-        dataframe = self.collector.get_monthly_report()
         self.data_container.add(item_name, dataframe)
         # month totals (all accounts)
-        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST.value, self.get_totals(dataframe))
+        self.data_container.add(ReportItemName.MONTHLY_TOTAL_COST.value,
+                                self.data_container.aggregates(item_name).totals())
 
-    def generate_daily_report(self):
+    def generate_daily_report(self, dataframe: pd.DataFrame):
         item_name = consts.ReportItemName.DAILY_COST.value
-        dataframe = self.collector.get_daily_report()
         self.data_container.add(item_name, dataframe)
 
-        self.data_container.add(ReportItemName.DAILY_TOTAL_COST.value, self.get_totals(dataframe))
+        self.data_container.add(ReportItemName.DAILY_TOTAL_COST.value,
+                                self.data_container.aggregates(item_name).totals())
 
-    def generate_services_report(self):
+    def generate_services_report(self, dataframe: pd.DataFrame):
         item_name = consts.ReportItemName.SERVICES_COST.value
-        dataframe = self.collector.get_services_report()
-
         self.data_container.add(item_name, dataframe)
 
-    def generate_tag_reports(self):
-        resource_tags = self.config.resource_tags
-        if resource_tags:
-            for tag in resource_tags:
-                logger.info(f'generating cost report for tag {tag}')
-                item_name = f"'{tag}' Resources Cost"
-                dataframe = self.collector.get_tag_report(tag)
-                self.data_container.add(item_name, dataframe, ReportItemGroup.TAGS)
+    def generate_tag_reports(self, tag_reports: Dict[str, pd.DataFrame]):
+        for tag, dataframe in tag_reports.items():
+            item_name = f"'{tag}' Resources Cost"
+            self.data_container.add(item_name, dataframe, ReportItemGroup.TAGS)
 
-    def generate_current_month_forecast(self):
+    def generate_current_month_forecast(self, dataframe: pd.DataFrame):
         item_name = consts.ReportItemName.FORECAST.value
-        dataframe = self.collector.get_current_month_forecast()
         forecast = dataframe['values'][0]
         self.data_container.add(item_name, forecast)
@@ -1,32 +1,58 @@
+import contextlib
 import datetime
+import importlib
 import logging
 import os
+import time
 from abc import ABC, abstractmethod
-from time import sleep
-
-import croniter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict
 
 from costreport.analysis.analyzers import DataAnalyzer
-from costreport.app_config import AppConfig, ReportType, ReportDestination, LocalDestination
-from costreport.collection.aws.aws_collector import AwsCollector
+from costreport.app_config import AppConfig, ReportType, ReportDestination, LocalDestination, Report, \
+    ReportVariant, CollectorType
+from costreport.collection.collector import Collector
 from costreport.data_container import DataContainer
 from costreport.data_provider import DataProvider
 from costreport.output_manager import OutputManager
-from costreport.report_generators.html_generator import HTMLReportGenerator
+from costreport.report_variants import derive_data_container
+from costreport.s3_client import S3Client
 from costreport.utils import consts
 from costreport.utils.cache_manager import RawDateCacheManager
-from costreport.utils.date_utils import get_time
+from costreport.utils.date_utils import get_time, format_datetime, PATH_TIME_FORMAT
+from costreport.utils.deadline import Deadline, DeadlineExceeded
+from costreport.utils.instrumentation import RunInstrumentation, instrument_run, submit
+from costreport.utils.profiler import RunProfiler
+from costreport.utils.run_lock import RunLock
+from costreport.utils.run_metrics import RunMetrics
 
 logger = logging.getLogger(__name__)
 
+# report generators and collectors are imported on use, so dependencies of unused implementations
+# (e.g. boto3 of aws collector when cur collector is configured) are not loaded
 report_generators = {
-    ReportType.HTML.value: HTMLReportGenerator
+    ReportType.HTML.value: 'costreport.report_generators.html_generator.HTMLReportGenerator'
+}
+
+collectors = {
+    CollectorType.AWS.value: 'costreport.collection.aws.aws_collector.AwsCollector',
+    CollectorType.CUR.value: 'costreport.collection.cur.cur_collector.CurCollector'
 }
 
 
+def _import_class(path: str):
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
 class ExecutorBase(ABC):
 
-    def __init__(self, config: AppConfig):
+    def __init__(self, config: AppConfig, ce_client=None, s3_client=None):
+        """
+        :param config:
+        :param ce_client: cost explorer client used by aws collector. created by collector by default
+        :param s3_client: s3 client used by s3 destinations. created on first use by default
+        """
         self.config = config
 
         # create local directory if local destination is configured
@@ -35,25 +61,143 @@ class ExecutorBase(ABC):
             if not os.path.exists(local_dest.directory):
                 os.makedirs(local_dest.directory)
 
-    def _generate_reports(self):
+        # state kept warm between runs
+        self._collector = None
+        self._ce_client = ce_client
+        self._s3_client = None
+        if s3_client:
+            self._get_s3_client(client=s3_client)
+        # optional reports skipped by latest run (run deadline was reached)
+        self.skipped_reports: List[str] = []
+        self._lock = RunLock(consts.RUN_LOCK_FILE)
+        self.metrics = RunMetrics()
+
+    def _get_collector(self, exec_time: datetime.datetime) -> Collector:
+        if not self._collector:
+            collector_cls = _import_class(collectors[self.config.collector])
+            # only aws collector uses cost explorer client
+            kwargs = {'ce_client': self._ce_client} if self._ce_client else {}
+            self._collector = collector_cls(self.config,
+                                            exec_time,
+                                            RawDateCacheManager(self.config, self.config.collector),
+                                            **kwargs)
+
+        self._collector.exec_time = exec_time
+        return self._collector
+
+    def _get_s3_client(self, client=None):
+        """
+        returns s3 client of s3 destinations. None if no s3 destination is configured
+        :param client: optional s3 client (e.g. a stub). defaults to boto3 client created on first use
+        """
+        if not self._s3_client and self.config.destinations.get(ReportDestination.S3.value):
+            self._s3_client = S3Client(region_name='us-east-1',
+                                       aws_access_key_id=consts.AWS_ACCESS_KEY_ID,
+                                       aws_secret_access_key=consts.AWS_SECRET_ACCESS_KEY,
+                                       client=client)
+
+        return self._s3_client
+
+    def _generate_reports(self, deadline: Deadline = None):
         exec_time = get_time()
-        reporter = DataProvider(exec_time, self.config, AwsCollector(self.config,
-                                                                     exec_time,
-                                                                     RawDateCacheManager(self.config,
-                                                                                         "aws")))
-        data_container: DataContainer = reporter.generate()
-        DataAnalyzer(data_container).analyze()
-        additional_data_items = {consts.ReportItemName.REPORT_TITLE.value: self.config.report_title}
-
-        for report_cfg in self.config.reports:
-            generator_cls = report_generators.get(report_cfg.name)
-            if not generator_cls:
+        reporter = DataProvider(exec_time, self.config, self._get_collector(exec_time), deadline)
+        try:
+            data_container: DataContainer = reporter.generate()
+        finally:
+            self.skipped_reports = reporter.skipped
+
+        if not self.config.variants:
+            DataAnalyzer(data_container).analyze()
+            self._output_reports(exec_time, data_container, self.config.report_title, self.config.reports)
+            return
+
+        logger.info(f'generating {len(self.config.variants)} report variants')
+        with ThreadPoolExecutor(max_workers=len(self.config.variants), thread_name_prefix='variant') as pool:
+            futures = [submit(pool, self._generate_variant, exec_time, data_container, variant)
+                       for variant in self.config.variants]
+            for future in futures:
+                future.result()
+
+    def _generate_variant(self, exec_time: datetime.datetime, data_container: DataContainer, variant: ReportVariant):
+        variant_container = derive_data_container(data_container, variant, self.config.accounts)
+        DataAnalyzer(variant_container).analyze()
+        self._output_reports(exec_time, variant_container, variant.report_title, variant.reports, variant.name)
+
+    def _output_reports(self,
+                        exec_time: datetime.datetime,
+                        data_container: DataContainer,
+                        report_title: str,
+                        reports: List[Report],
+                        report_name: str = None):
+        additional_data_items = {consts.ReportItemName.REPORT_TITLE.value: report_title}
+
+        for report_cfg in reports:
+            generator_path = report_generators.get(report_cfg.name)
+            if not generator_path:
                 raise Exception(f'unknown report name : {report_cfg.name}')
+            generator_cls = _import_class(generator_path)
             output = generator_cls(data_container, report_cfg.report_config, self.config.filtered_services) \
                 .generate(additional_data_items)
-            output_manager = OutputManager(exec_time, self.config.destinations)
+            output_manager = OutputManager(exec_time, self.config.destinations, self._get_s3_client(), report_name)
             output_manager.output(output)
 
+    @staticmethod
+    def _get_profiler(start_time: datetime.datetime, instrumentation: RunInstrumentation):
+        """
+        returns run profiler in profiling mode (PROFILING environment variable)
+        """
+        if not consts.PROFILING:
+            return contextlib.nullcontext()
+
+        profiler = RunProfiler(consts.PROFILING_DIR,
+                               f'run_{format_datetime(start_time, PATH_TIME_FORMAT)}',
+                               consts.PROFILING_SAMPLE_INTERVAL)
+        profiler.attach(instrumentation)
+        return profiler
+
+    def _run(self, raise_errors=True, deadline: Deadline = None) -> bool:
+        """
+        executes a single report run. runs are skipped if another run is in progress
+        :param raise_errors: whether run errors are raised or only logged
+        :param deadline: data fetch deadline (optional reports are skipped when it is reached)
+        :return: whether run was executed
+        """
+        if not self._lock.acquire():
+            logger.warning('another report run is in progress. skipping run')
+            self.metrics.skipped_runs += 1
+            return False
+
+        start_time = get_time()
+        start = time.monotonic()
+        success = False
+        instrumentation = RunInstrumentation()
+        try:
+            with instrument_run(instrumentation), self._get_profiler(start_time, instrumentation):
+                self._generate_reports(deadline)
+            success = True
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception('report run failed')
+        finally:
+            self._lock.release()
+            duration = time.monotonic() - start
+            stages = instrumentation.summary()
+            self.metrics.add_run(start_time, duration, success, stages)
+            logger.info(f'report run {"completed" if success else "failed"} in {duration:.1f} seconds')
+            for name, stats in stages.items():
+                logger.info(f"stage {name}: wall={stats['wall_seconds']}s cpu={stats['cpu_seconds']}s "
+                            f"peak_rss={stats['peak_rss_bytes'] / 2 ** 20:.0f}MB api_calls={stats['api_calls']} "
+                            f"pages={stats['pages']} bytes={stats['bytes_downloaded']}")
+
+            if self.config.metrics_file:
+                self.metrics.export(self.config.metrics_file)
+
+            if self.config.metrics_prometheus_file:
+                self.metrics.export_prometheus(self.config.metrics_prometheus_file)
+
+        return True
+
     def exec(self):
         self._exec()
 
@@ -69,23 +213,21 @@ class SingleExecutor(ExecutorBase):
 
     def _exec(self):
         logger.info('executing single report executor')
-        self._generate_reports()
+        self._run()
 
 
 class ScheduledExecutor(ExecutorBase):
     """
-
+    executes report runs on cron schedule. scheduled times which pass while a run is executing
+    are coalesced into a single catch up run
     """
 
     @staticmethod
-    def _round_time(dt=None):
-        """
-        floors datetime minute
-        """
-        if not dt:
-            dt = datetime.datetime.now()
-
-        return dt.replace(second=0, microsecond=0)
+    def _sleep_until(next_exec: datetime.datetime):
+        delay = (next_exec - datetime.datetime.now()).total_seconds()
+        if delay > 0:
+            logger.info(f'waiting until next exec time:{next_exec}')
+            time.sleep(delay)
 
     def _exec(self):
         schedule = self.config.schedule
@@ -93,21 +235,89 @@ class ScheduledExecutor(ExecutorBase):
             raise Exception('expected schedule configuration!')
         logger.info(f'executing scheduled report executor with schedule {schedule}')
 
-        # init croniter
-        now = datetime.datetime.now()
-        cron = croniter.croniter(schedule, now)
+        # croniter is only required by scheduled executor
+        import croniter
+        cron = croniter.croniter(schedule, datetime.datetime.now())
+        next_exec = cron.get_next(ret_type=datetime.datetime)
 
         while True:
-            # get next execution time
+            self._sleep_until(next_exec)
+            self._run(raise_errors=False)
+
             next_exec = cron.get_next(ret_type=datetime.datetime)
-            logger.info(f'waiting until next exec time:{next_exec}')
+            missed = 0
+            while next_exec <= datetime.datetime.now():
+                missed += 1
+                next_exec = cron.get_next(ret_type=datetime.datetime)
+
+            if missed:
+                logger.warning(f'{missed} scheduled run(s) passed while previous run was executing. '
+                               f'executing catch up run')
+                self.metrics.missed_ticks += missed
+                # step back to latest passed time so catch up run is executed immediately
+                # and the upcoming scheduled time is kept
+                next_exec = cron.get_prev(ret_type=datetime.datetime)
 
-            still_waiting = True
-            while still_waiting:
-                rounded_now = self._round_time()
 
-                if rounded_now == next_exec:
-                    self._generate_reports()
-                    still_waiting = False
-                else:
-                    sleep(60)
+class ServerlessExecutor(ExecutorBase):
+    """
+    executes a report run per serverless function invocation. executor is created once per container and
+    its state (configuration, clients, collector and its cache, report templates) is reused by warm invocations
+    """
+
+    def __init__(self, config: AppConfig, ce_client=None, s3_client=None):
+        super().__init__(config, ce_client, s3_client)
+        self.invocations = 0
+
+        for report_cfg in self._get_reports():
+            # function runtimes usually lack shared memory (/dev/shm) required by render process pool
+            report_cfg.report_config.setdefault('render_workers', 1)
+
+        self._warm_up()
+
+    def _get_reports(self) -> List[Report]:
+        return self.config.reports + [r for variant in self.config.variants for r in variant.reports]
+
+    def _warm_up(self):
+        """
+        creates run state ahead of first invocation (on container initialization)
+        """
+        self._get_collector(get_time())
+        self._get_s3_client()
+        for report_cfg in self._get_reports():
+            generator_path = report_generators.get(report_cfg.name)
+            if generator_path:
+                _import_class(generator_path).warm_up(report_cfg.report_config)
+
+    def invoke(self, remaining_seconds: Optional[float] = None) -> Dict:
+        """
+        executes a report run. data fetch is bounded by invocation remaining time minus time reserved
+        for analysis, rendering and output. optional reports (services, tags) are skipped when time runs short
+        :param remaining_seconds: invocation remaining time. run is not bounded if not specified
+        :return: invocation result
+        """
+        self.invocations += 1
+        deadline = None
+        if remaining_seconds is not None:
+            deadline = Deadline(max(0.0, remaining_seconds - self.config.serverless.reserve_seconds))
+
+        start = time.monotonic()
+        deadline_exceeded = False
+        try:
+            executed = self._run(deadline=deadline)
+        except DeadlineExceeded as e:
+            # the run failed (see run metrics). not raised, as a retried invocation would run out of time as well
+            logger.error(f'report run did not complete by invocation deadline: {str(e)}')
+            executed = False
+            deadline_exceeded = True
+
+        return {'executed': executed,
+                'invocation': self.invocations,
+                'cold_start': self.invocations == 1,
+                'duration_seconds': round(time.monotonic() - start, 3),
+                'deadline_exceeded': deadline_exceeded,
+                'skipped_reports': list(self.skipped_reports) if executed else []}
+
+    def _exec(self):
+        logger.info('executing serverless report executor')
+        self.invoke()
@@ -0,0 +1,59 @@
+"""
+serverless function entry point (e.g. AWS Lambda handler 'costreport.handler.handler').
+
+executor state (configuration, cost explorer and s3 clients, collector cache, report templates) is created once
+per container and reused by following (warm) invocations. in a function runtime it is created on module import
+(container initialization), otherwise on first invocation or by an explicit init() call, e.g. with stubbed clients:
+
+    init(ce_client=stub_cost_explorer, s3_client=stub_s3)
+    handler({}, None)
+"""
+import logging
+import os
+from typing import Optional, Dict
+
+from costreport.app_config import AppConfig
+from costreport.executors import ServerlessExecutor
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ServerlessExecutor] = None
+
+
+def init(config: AppConfig = None, ce_client=None, s3_client=None) -> ServerlessExecutor:
+    """
+    creates container executor, replacing existing executor
+    :param config: defaults to configuration file configuration
+    :param ce_client: cost explorer client. created by collector by default
+    :param s3_client: s3 client. created on first use by default
+    :return:
+    """
+    global _executor
+    logger.info('initializing serverless executor')
+    _executor = ServerlessExecutor(config or AppConfig(), ce_client, s3_client)
+    return _executor
+
+
+def _get_remaining_seconds(context) -> Optional[float]:
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+
+    return context.get_remaining_time_in_millis() / 1000
+
+
+def handler(event, context) -> Dict:
+    """
+    executes a report run
+    :param event: invocation event (not used, reports are generated according to configuration)
+    :param context: invocation context. run is bounded by context remaining time
+    :return: invocation result
+    """
+    executor = _executor or init()
+    result = executor.invoke(_get_remaining_seconds(context))
+    logger.info(f'invocation result: {result}')
+    return result
+
+
+# function runtimes set function name environment variable. state is created during container initialization
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    init()
@@ -1,16 +1,38 @@
-from typing import List
+from typing import List, Sequence
+
+import numpy as np
 
 from costreport.utils.consts import ItemType
 
+# series values dtype. float32 halves series memory, but is exact only up to about 7 significant digits
+VALUES_DTYPE = np.float64
+
 
 class DataSeries:
-    def __init__(self, name, values: List[int]):
+    __slots__ = ('name', 'values')
+
+    def __init__(self, name, values: Sequence[float], dtype=VALUES_DTYPE):
+        """
+        :param name:
+        :param values: series values, stored as a contiguous array of dtype.
+        contiguous arrays of dtype (e.g. report dataframe columns) are stored as is, without copying
+        :param dtype: float64 or float32
+        """
         self.name = name
-        self.values = values
+        self.values: np.ndarray = np.ascontiguousarray(values, dtype=dtype)
 
 
 class ItemDefinition:
-    def __init__(self, item_name, item_type: ItemType, x: List[str], y: List[DataSeries] = None, group=None):
+    __slots__ = ('item_name', 'chart_type', 'x', 'y', 'group')
+
+    def __init__(self, item_name, item_type: ItemType, x: Sequence, y: List[DataSeries] = None, group=None):
+        """
+        :param item_name:
+        :param item_type:
+        :param x: chart x values (a single date index shared by all chart series) or item value
+        :param y: chart series
+        :param group:
+        """
         self.item_name = item_name
         self.chart_type = item_type
         self.x = x
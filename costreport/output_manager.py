@@ -1,64 +1,120 @@
 import logging
 import os
-import shutil
-import uuid
 from datetime import datetime
+from typing import Iterable
 
 from costreport.app_config import ReportDestination, S3Destination, LocalDestination
-from costreport.s3_client import S3Client
+from costreport.s3_client import S3Client, S3ObjectWriter
 from costreport.utils.consts import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
 from costreport.utils.date_utils import format_datetime, PATH_TIME_FORMAT
+from costreport.utils.instrumentation import instrumented
 
 logger = logging.getLogger(__name__)
 
 
+class LocalFileWriter:
+    """
+    writes content to a temporary file which is renamed to the target file name on close
+    so partially written reports are never left in the destination directory
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._tmp_file_name = f'{file_name}.part'
+        self._f = open(self._tmp_file_name, 'wb')
+
+    def write(self, data: bytes):
+        self._f.write(data)
+
+    def close(self):
+        self._f.close()
+        os.replace(self._tmp_file_name, self.file_name)
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(self._tmp_file_name)
+        except FileNotFoundError:
+            pass
+
+
 class OutputManager:
-    def __init__(self, exec_time: datetime, dest_config):
+    def __init__(self, exec_time: datetime, dest_config, s3_client: S3Client = None, report_name: str = None):
+        """
+        :param exec_time:
+        :param dest_config:
+        :param s3_client: optional (reused) s3 client
+        :param report_name: optional report name (report variant) added to report file name
+        """
         self.exec_time = exec_time
         self.dest_config = dest_config
+        self.s3_client = s3_client
+        self.report_name = report_name
 
-    def output(self, report_html_str):
+    @instrumented('output')
+    def output(self, report_chunks: Iterable[str]):
+        """
+        streams report chunks to all configured destinations.
+        report chunks are rendered while streamed, so template rendering time is part of output stage
+        :param report_chunks: report content chunks
+        :return:
+        """
         if not self.dest_config:
             raise Exception('no configured report destinations')
 
-        if self.dest_config.get(ReportDestination.LOCAL.value):
-            self._save_html_report(self.dest_config[ReportDestination.LOCAL.value], report_html_str)
+        # writers which are not closed are aborted on any failure (no partial local file or dangling s3 upload)
+        writers = []
+        try:
+            if self.dest_config.get(ReportDestination.LOCAL.value):
+                writers.append(self._open_local_writer(self.dest_config[ReportDestination.LOCAL.value]))
+
+            if self.dest_config.get(ReportDestination.S3.value):
+                s3_writer = self._open_s3_writer(self.dest_config[ReportDestination.S3.value])
+                if s3_writer:
+                    writers.append(s3_writer)
+
+            for chunk in report_chunks:
+                data = chunk.encode('utf-8')
+                for writer in writers:
+                    writer.write(data)
 
-        if self.dest_config.get(ReportDestination.S3.value):
-            self._upload_to_s3(self.dest_config[ReportDestination.S3.value], report_html_str)
+            while writers:
+                writers[0].close()
+                writers.pop(0)
+        except Exception:
+            for writer in writers:
+                self._abort(writer)
+            raise
+
+    @staticmethod
+    def _abort(writer):
+        try:
+            writer.abort()
+        except Exception as e:
+            logger.error(f'error aborting report output. error:{str(e)}')
 
     def _get_report_file_name(self):
-        return f'cost_report_{format_datetime(self.exec_time, PATH_TIME_FORMAT)}.html'
+        name = f'cost_report_{self.report_name}' if self.report_name else 'cost_report'
+        return f'{name}_{format_datetime(self.exec_time, PATH_TIME_FORMAT)}.html'
 
-    def _save_html_report(self, dest_config: LocalDestination, report_html_str):
+    def _open_local_writer(self, dest_config: LocalDestination) -> LocalFileWriter:
         directory = dest_config.directory
         local_file_name = f'{directory}/{self._get_report_file_name()}'
         logger.info(f'saving generated report file as {local_file_name}')
-        f = open(local_file_name, 'w')
-        f.write(report_html_str)
-        f.close()
+        return LocalFileWriter(local_file_name)
 
-    def _upload_to_s3(self, dest_config: S3Destination, report_html_str):
+    def _open_s3_writer(self, dest_config: S3Destination) -> S3ObjectWriter:
         if not dest_config.bucket_name:
             logger.error('s3 destination bucket name is not specified! aborting s3 upload')
-            return
+            return None
 
-        s3_client = S3Client(region_name='us-east-1',
-                             aws_access_key_id=AWS_ACCESS_KEY_ID,
-                             aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
+        if not self.s3_client:
+            self.s3_client = S3Client(region_name='us-east-1',
+                                      aws_access_key_id=AWS_ACCESS_KEY_ID,
+                                      aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
 
         object_key = f'{dest_config.object_key_prefix}/{self._get_report_file_name()}' if \
             dest_config.object_key_prefix else self._get_report_file_name()
         logger.info(f'uploading report to s3. bucket:{dest_config.bucket_name}. key: {object_key}')
-        tmp_directory = str(uuid.uuid4())
-        os.makedirs(tmp_directory)
-        local_file_name = f'{tmp_directory}/{self._get_report_file_name()}'
-        f = open(local_file_name, 'w')
-        f.write(report_html_str)
-        f.close()
-
-        s3_client.upload_file(local_file_name,
-                              dest_config.bucket_name,
-                              object_key)
-
-        shutil.rmtree(tmp_directory)
+
+        return self.s3_client.open_writer(dest_config.bucket_name, object_key)
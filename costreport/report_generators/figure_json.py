@@ -0,0 +1,69 @@
+"""
+chart divs generated directly from chart series arrays. figures are not built from plotly figure objects (no per
+trace validation) and are serialized with orjson when installed (plotly json encoder otherwise encodes every figure
+twice to replace NaN values). generated divs are equivalent to plotly.offline.plot(figure, output_type='div')
+"""
+import json
+import pkgutil
+import uuid
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == 'f' and not np.isfinite(obj).all():
+            # NaN and infinity are not valid json, serialized as null (as plotly json encoder does)
+            return np.where(np.isfinite(obj), obj, None).tolist()
+        return obj.tolist()
+    elif isinstance(obj, np.generic):
+        return obj.item()
+
+    raise TypeError(f'{type(obj)} is not json serializable')
+
+
+def dumps(obj) -> str:
+    """
+    serializes figure object. numpy arrays are serialized as lists, NaN and infinity values as null
+    """
+    if orjson is not None:
+        # orjson serializes numeric arrays natively (object arrays, e.g. dates, by default function)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    return json.dumps(obj, default=_default, allow_nan=False)
+
+
+@lru_cache()
+def template_json(name: str) -> str:
+    """
+    returns serialized plotly layout template. templates are serialized once per process
+    :param name: plotly template name (e.g. plotly_dark)
+    """
+    # template files plotly.io.templates are loaded from. read directly, plotly figure objects are not imported
+    return dumps(json.loads(pkgutil.get_data('plotly', f'package_data/templates/{name}.json')))
+
+
+def chart_div(traces: List[Dict], layout: Dict, template: str) -> str:
+    """
+    returns chart div (plotly.js library is not included)
+    :param traces: figure traces (trace dicts, as passed to plotly Figure)
+    :param layout: figure layout, without template
+    :param template: plotly template name
+    :return:
+    """
+    div_id = str(uuid.uuid4())
+    layout_json = dumps(layout)[:-1]
+    layout_json = f'{layout_json}{", " if len(layout_json) > 1 else ""}"template": {template_json(template)}}}'
+
+    return f'<div><div id="{div_id}" class="plotly-graph-div" style="height:100%; width:100%;"></div>' \
+           f'<script type="text/javascript">window.PLOTLYENV=window.PLOTLYENV || {{}};' \
+           f'if (document.getElementById("{div_id}")) {{' \
+           f'Plotly.newPlot("{div_id}", {dumps(traces)}, {layout_json}, {{"responsive": true}})' \
+           f'}};</script></div>'
@@ -1,4 +1,5 @@
 from abc import ABC
+from typing import Iterator
 
 from costreport.data_container import DataContainer
 
@@ -9,9 +10,18 @@ class ReportGeneratorBase(ABC):
         self.config = config
         self.filtered_services = filtered_services
 
-    def generate(self, additional_data_items) -> str:
+    @classmethod
+    def warm_up(cls, config):
         """
-        return formatted report string
+        prepares generation resources (e.g. templates) ahead of first report generation
+        :param config: report configuration
+        :return:
+        """
+        pass
+
+    def generate(self, additional_data_items) -> Iterator[str]:
+        """
+        return formatted report content chunks (report may be rendered lazily while iterated)
         :param additional_data_items:
         :return:
         """
@@ -1,66 +1,125 @@
 import logging
+import multiprocessing
+import os
 import pathlib
-from typing import List
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Iterator, Dict, Optional, Callable, Tuple
 
 import pandas as pd
-import plotly.graph_objs as go
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 from markupsafe import Markup
-from plotly.offline import plot
 
 from costreport.data_container import DataContainer
 from costreport.model import DataSeries, ItemDefinition
+from costreport.report_generators import figure_json
 from costreport.report_generators.generator_base import ReportGeneratorBase
-from costreport.utils.consts import ReportItemName, ItemType, ReportItemGroup
+from costreport.report_generators.render_cache import RenderCache
+from costreport.utils.consts import ReportItemName, ItemType, ReportItemGroup, PROFILING
+from costreport.utils.instrumentation import instrumented, record_cpu_time
 
 logger = logging.getLogger(__name__)
 
-jinja_env = Environment(
-    loader=FileSystemLoader(f'{pathlib.Path(__file__).parent.absolute()}/../../report_templates'),
-    autoescape=select_autoescape(['html'])
-)
+TEMPLATES_DIR = f'{pathlib.Path(__file__).parent.absolute()}/../../report_templates'
+
+# plotly and jinja2 are imported when report is rendered (render stage) and not on module import
+_jinja_env = None
+
+
+def get_jinja_env():
+    global _jinja_env
+    if _jinja_env is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+        _jinja_env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(['html']))
+
+    return _jinja_env
+
+
+# template output is yielded in chunks of about this size (characters). chart divs rendered while the template
+# is streamed are released once their chunk is yielded
+RENDER_CHUNK_SIZE = 64 * 1024
+
+PLOTLYJS_INLINE = 'inline'
+PLOTLYJS_CDN = 'cdn'
+
+# TODO: configurable
+CHART_TEMPLATE = 'plotly_dark'
+
+# rendered charts cache (see RenderCache). enabled when render_cache_dir is configured, size 0 disables the cache
+RENDER_CACHE_MB_DEFAULT = 64
+
+
+def get_plotlyjs_script(mode: str) -> str:
+    """
+    returns plotly.js script tag. the library is included once per report (chart divs do not include it)
+    :param mode: 'inline' - library source is embedded. 'cdn' - library is referenced from plotly CDN
+    :return:
+    """
+    from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+    if mode == PLOTLYJS_INLINE:
+        return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    elif mode == PLOTLYJS_CDN:
+        return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+    else:
+        raise Exception(f'unsupported plotlyjs mode {mode}')
+
+
+def template_includes_plotlyjs(template_name: str) -> bool:
+    """
+    returns whether template includes plotly.js library (references items['plotlyjs'])
+    """
+    env = get_jinja_env()
+    source, _, _ = env.loader.get_source(env, template_name)
+    return 'plotlyjs' in source
 
 
 class ChartPlotter:
 
+    def __init__(self, include_plotlyjs=False, validate_figures=False):
+        """
+        :param include_plotlyjs: whether every chart div should embed plotly.js library
+        :param validate_figures: whether figures are built and serialized by plotly figure objects (validated).
+        by default figures json is generated directly from series arrays (see figure_json)
+        """
+        self.include_plotlyjs = include_plotlyjs
+        self.validate_figures = validate_figures
+
     @staticmethod
     def _get_value_div(chart_def: ItemDefinition) -> str:
         return chart_def.x[0]
 
-    @staticmethod
-    def _get_chart_div(chart_def: ItemDefinition) -> str:
-        data = []
-        x = chart_def.x
-        y = chart_def.y
-
-        for series in y:
-            if chart_def.chart_type in [ItemType.BAR, ItemType.STACK]:
-                data.append(go.Bar(name=series.name, x=x, y=series.values))
-            elif chart_def.chart_type == ItemType.LINE:
-                data.append(go.Line(name=series.name, x=x, y=series.values))
-            else:
-                raise Exception(f'unsupported chart type {chart_def.chart_type}')
+    def _plot(self, traces: List[Dict], layout: Dict) -> str:
+        if self.validate_figures:
+            import plotly.graph_objs as go
+            from plotly.offline import plot
 
-        fig = go.Figure(data=data)
+            fig = go.Figure(data=traces, layout=layout)
+            fig.update_layout(template=CHART_TEMPLATE)
+            return plot(fig, output_type='div', include_plotlyjs=self.include_plotlyjs)
 
-        # TODO: configurable
-        fig.update_layout(template="plotly_dark")
+        div = figure_json.chart_div(traces, layout, CHART_TEMPLATE)
+        return get_plotlyjs_script(PLOTLYJS_INLINE) + div if self.include_plotlyjs else div
 
-        if chart_def.chart_type == ItemType.STACK:
-            fig.update_layout(barmode='stack')
+    def _get_chart_div(self, chart_def: ItemDefinition) -> str:
+        if chart_def.chart_type in [ItemType.BAR, ItemType.STACK]:
+            trace_type = 'bar'
+        elif chart_def.chart_type == ItemType.LINE:
+            trace_type = 'scatter'
+        else:
+            raise Exception(f'unsupported chart type {chart_def.chart_type}')
 
-        return plot(fig, output_type='div')
+        traces = [{'type': trace_type, 'name': series.name, 'x': chart_def.x, 'y': series.values}
+                  for series in chart_def.y]
+        layout = {'barmode': 'stack'} if chart_def.chart_type == ItemType.STACK else {}
 
-    @staticmethod
-    def _get_pie_chart_div(chart_def: ItemDefinition) -> str:
-        labels = chart_def.x
-        values = chart_def.y[0].values
+        return self._plot(traces, layout)
 
-        fig = go.Figure(data=[go.Pie(labels=labels, values=values, textinfo='label+percent',
-                                     insidetextorientation='radial')])
+    def _get_pie_chart_div(self, chart_def: ItemDefinition) -> str:
+        traces = [{'type': 'pie', 'labels': chart_def.x, 'values': chart_def.y[0].values,
+                   'textinfo': 'label+percent', 'insidetextorientation': 'radial'}]
 
-        fig.update_layout(template="plotly_dark")
-        return plot(fig, output_type='div')
+        return self._plot(traces, {})
 
     def get_div(self, chart_def: ItemDefinition) -> str:
         if chart_def.chart_type in [ItemType.BAR, ItemType.LINE, ItemType.STACK]:
@@ -74,30 +133,184 @@ class ChartPlotter:
 
         return div
 
+    def get_div_and_cpu_time(self, chart_def: ItemDefinition) -> Tuple[str, float]:
+        """
+        returns chart div and cpu time of its rendering. used by render worker processes, whose cpu time
+        is not measured by the report process
+        """
+        start = time.process_time()
+        div = self.get_div(chart_def)
+        return div, time.process_time() - start
+
+
+class LazyDiv:
+    """
+    chart div rendered when template outputs it (html safe, not escaped by template)
+    """
+    __slots__ = ('_render',)
+
+    def __init__(self, render: Callable[[], str]):
+        self._render = render
+
+    def __html__(self) -> str:
+        return self._render()
+
+    def __str__(self) -> str:
+        return self._render()
+
 
 class LayoutManager:
 
     def __init__(self, items_defs: List[ItemDefinition], config):
         self.items_defs = items_defs
-        self.plotter: ChartPlotter = ChartPlotter()
         self.config = config
 
-    def layout(self, data_items=None) -> str:
+        # templates predating plotly.js inclusion once per report would render blank charts
+        include_plotlyjs = not template_includes_plotlyjs(config['template_name'])
+        if include_plotlyjs:
+            logger.warning(f"template {config['template_name']} does not include plotly.js (items['plotlyjs']), "
+                           f"plotly.js is embedded in every chart")
+
+        self.plotter: ChartPlotter = ChartPlotter(include_plotlyjs=include_plotlyjs,
+                                                  validate_figures=config.get('validate_figures', False))
+        # whether charts are rendered while content is streamed (see layout)
+        self.lazy = False
+        self.render_cache: Optional[RenderCache] = self._get_render_cache()
+
+    def _get_render_cache(self) -> Optional[RenderCache]:
+        directory = self.config.get('render_cache_dir')
+        max_size_mb = self.config.get('render_cache_mb', RENDER_CACHE_MB_DEFAULT)
+        if not directory or not max_size_mb:
+            return None
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logger.warning(f'could not create render cache directory: {str(e)}. charts are not cached')
+            return None
+
+        if not os.access(directory, os.W_OK):
+            logger.warning(f'render cache directory {directory} is not writable. charts are not cached')
+            return None
+
+        from plotly import __version__ as plotly_version
+        settings = (CHART_TEMPLATE, self.plotter.validate_figures, self.plotter.include_plotlyjs, plotly_version)
+        return RenderCache(directory, int(max_size_mb * 1024 * 1024), settings)
+
+    def _get_workers(self, charts: int) -> int:
+        if PROFILING:
+            # charts are rendered in process so figures serialization is profiled
+            return 1
+
+        return min(self.config.get('render_workers', os.cpu_count() or 1), charts)
+
+    def _log_render_cache(self):
+        if self.render_cache:
+            logger.info(f'chart render cache: {self.render_cache.hits} hits, {self.render_cache.misses} misses')
+
+    def _get_div(self, item_def: ItemDefinition) -> str:
+        """
+        renders item div in process. chart divs are served from render cache if their data did not change
+        """
+        if item_def.chart_type == ItemType.VALUE or not self.render_cache:
+            return self.plotter.get_div(item_def)
+
+        key = self.render_cache.key(item_def)
+        div = self.render_cache.get(key)
+        if div is None:
+            div = self.plotter.get_div(item_def)
+            self.render_cache.set(key, div)
+
+        return div
+
+    def _render_divs(self) -> List[str]:
         """
-        returns html string
+        returns items divs (in items definitions order).
+        charts are rendered by a process pool, values are rendered inline
+        :return:
+        """
+        divs = [None] * len(self.items_defs)
+        charts = [(i, d) for i, d in enumerate(self.items_defs) if d.chart_type != ItemType.VALUE]
+
+        # charts whose data did not change since they were rendered (e.g. by previous run) are not rendered
+        cache_keys = {}
+        if self.render_cache:
+            for i, item_def in charts:
+                cache_keys[i] = self.render_cache.key(item_def)
+                divs[i] = self.render_cache.get(cache_keys[i])
+            charts = [(i, d) for i, d in charts if divs[i] is None]
+
+        workers = self._get_workers(len(charts))
+        if workers > 1:
+            logger.info(f'rendering {len(charts)} charts using {workers} processes')
+            # forkserver - rendering may be started from multiple threads (report variants)
+            cpu_seconds = 0.0
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver')) as pool:
+                for (i, _), (div, cpu) in zip(charts, pool.map(self.plotter.get_div_and_cpu_time,
+                                                               [d for _, d in charts])):
+                    divs[i] = div
+                    cpu_seconds += cpu
+            record_cpu_time(cpu_seconds)
+
+        for i, item_def in enumerate(self.items_defs):
+            if divs[i] is None:
+                divs[i] = self.plotter.get_div(item_def)
+
+        if self.render_cache:
+            for i, _ in charts:
+                self.render_cache.set(cache_keys[i], divs[i])
+        self._log_render_cache()
+
+        return divs
+
+    def _lazy_divs(self) -> List:
+        """
+        returns items divs (in items definitions order). chart divs are rendered in process when template stream
+        reaches them, so a chart div is held in memory only until its chunk is written
+        """
+        return [LazyDiv(partial(self._get_div, d)) if d.chart_type != ItemType.VALUE else self._get_div(d)
+                for d in self.items_defs]
+
+    def _stream(self, template, data_items) -> Iterator[str]:
+        chunk = []
+        chunk_size = 0
+        for event in template.generate(items=data_items):
+            chunk.append(event)
+            chunk_size += len(event)
+            if chunk_size >= RENDER_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                chunk_size = 0
+
+        if chunk:
+            yield ''.join(chunk)
+
+        if self.lazy:
+            self._log_render_cache()
+
+    @instrumented('layout')
+    def layout(self, data_items=None) -> Iterator[str]:
+        """
+        returns html content chunks iterator. content is rendered while iterated.
+        with a process pool (render_workers > 1) all charts are rendered before content is streamed,
+        otherwise charts are rendered while content is streamed
         :return:
         """
 
         if not data_items:
             data_items = {}
 
-        template = jinja_env.get_template(self.config['template_name'])
+        template = get_jinja_env().get_template(self.config['template_name'])
         logger.info(f'using {template} template file')
 
-        for item_def in self.items_defs:
-            div = self.plotter.get_div(item_def)
+        data_items['plotlyjs'] = Markup(get_plotlyjs_script(self.config.get('plotlyjs', PLOTLYJS_INLINE)))
+
+        charts = len([d for d in self.items_defs if d.chart_type != ItemType.VALUE])
+        self.lazy = self._get_workers(charts) <= 1
+        divs = self._lazy_divs() if self.lazy else self._render_divs()
 
-            if item_def.chart_type != ItemType.VALUE:
+        for item_def, div in zip(self.items_defs, divs):
+            if item_def.chart_type != ItemType.VALUE and not self.lazy:
                 div = Markup(div)
 
             if item_def.group is None:
@@ -112,7 +325,7 @@ class LayoutManager:
         if not data_items.get("tags", None):
             data_items['tags'] = {}
 
-        return template.render(items=data_items)
+        return self._stream(template, data_items)
 
 
 class HTMLReportGenerator(ReportGeneratorBase):
@@ -120,7 +333,17 @@ class HTMLReportGenerator(ReportGeneratorBase):
     def __init__(self, data_container: DataContainer, config, filtered_services):
         super().__init__(data_container, config, filtered_services)
 
-    def generate(self, additional_data_items):
+    @classmethod
+    def warm_up(cls, config):
+        # compiled template is cached by jinja environment
+        get_jinja_env().get_template(config['template_name'])
+        if config.get('validate_figures', False):
+            import plotly.graph_objs  # noqa: F401
+        else:
+            figure_json.template_json(CHART_TEMPLATE)
+
+    @instrumented('generate')
+    def generate(self, additional_data_items) -> Iterator[str]:
         items_def = self._data_to_items_defs()
         return LayoutManager(items_def, self.config).layout(additional_data_items)
 
@@ -139,11 +362,13 @@ class HTMLReportGenerator(ReportGeneratorBase):
         if 'dates' not in column_names:
             raise Exception("dataframe should have 'dates' column")
 
-        x_values = dataframe['dates']
+        # date index shared by all chart series
+        x_values = dataframe['dates'].values
         column_names.remove('dates')
         data_series = []
 
         for names in column_names:
+            # column array (not copied by DataSeries if contiguous, see Collector.pivot_long_format)
             data_values = dataframe[names].values
 
             # sanity check
@@ -159,6 +384,47 @@ class HTMLReportGenerator(ReportGeneratorBase):
                               data_series,
                               group=group)
 
+    def _add_services_items_defs(self, items_defs: List[ItemDefinition]):
+        """
+        adds services cost and top services charts
+        """
+        item_name = ReportItemName.SERVICES_COST.value
+        services_cost_df = self.data_container.get_value(item_name)
+        item_def: ItemDefinition = self.create_item_definition_from_df(dataframe=services_cost_df,
+                                                                       item_name=item_name,
+                                                                       chart_type=ItemType.LINE,
+                                                                       group=ReportItemGroup.CHARTS.value,
+                                                                       filtered_keys=self.filtered_services)
+        items_defs.append(item_def)
+
+        # calculate services total cost
+        services_totals = self.data_container.aggregates(item_name).column_totals()
+
+        total_values = {}
+        # sum service cost
+        for service_name, total in services_totals.items():
+            if service_name not in self.filtered_services:
+                total_values[service_name] = round(total)
+
+        # sort services by cost
+        total_values = {k: v for k, v in sorted(total_values.items(), key=lambda item: item[1], reverse=True)}
+
+        # top services (5 and others)
+        top = {'others': 0}
+        for i, k in enumerate(total_values):
+            if i <= 5:
+                top[k] = total_values[k]
+            else:
+                top['others'] = top['others'] + total_values[k]
+
+        item_name = ReportItemName.SERVICES_TOP_COST.value
+        item_def: ItemDefinition = ItemDefinition(item_name,
+                                                  item_type=ItemType.PIE,
+                                                  x=list(top.keys()),
+                                                  y=[DataSeries('values', list(top.values()))],
+                                                  group=ReportItemGroup.CHARTS.value)
+        items_defs.append(item_def)
+
     def _data_to_items_defs(self):
         items_defs = []
 
@@ -169,7 +435,6 @@ class HTMLReportGenerator(ReportGeneratorBase):
                                              [val]))
 
         for item in [ReportItemName.CURRENT_DATE,
-                     ReportItemName.FORECAST_PER,
                      ReportItemName.MONTHLY_TOTAL_COST_MIN,
                      ReportItemName.MONTHLY_TOTAL_COST_MAX,
                      ReportItemName.MONTHLY_TOTAL_COST_MEAN,
@@ -181,11 +446,14 @@ class HTMLReportGenerator(ReportGeneratorBase):
                      ]:
             __add_value(item)
 
+        # forecast is organization wide, not included in reports limited to accounts
         item_name = ReportItemName.FORECAST.value
-        forecast = self.data_container.get_value(item_name)
-        items_defs.append(ItemDefinition(item_name,
-                                         ItemType.VALUE,
-                                         [f'${str(forecast)}']))
+        if self.data_container.has(item_name):
+            __add_value(ReportItemName.FORECAST_PER)
+            forecast = self.data_container.get_value(item_name)
+            items_defs.append(ItemDefinition(item_name,
+                                             ItemType.VALUE,
+                                             [f'${str(forecast)}']))
 
         item_name = ReportItemName.MONTHLY_COST.value
         monthly_cost_df = self.data_container.get_value(item_name)
@@ -220,43 +488,9 @@ class HTMLReportGenerator(ReportGeneratorBase):
                                              [f'${str(cost)}'],
                                              group=ReportItemGroup.ACCOUNT_COST.value))
 
-        # services cost
-        item_name = ReportItemName.SERVICES_COST.value
-        services_cost_df = self.data_container.get_value(item_name)
-        item_def: ItemDefinition = self.create_item_definition_from_df(dataframe=services_cost_df,
-                                                                       item_name=item_name,
-                                                                       chart_type=ItemType.LINE,
-                                                                       group=ReportItemGroup.CHARTS.value,
-                                                                       filtered_keys=self.filtered_services)
-        items_defs.append(item_def)
-
-        # calculate services total cost
-        service_names = services_cost_df.columns.values.tolist()
-        service_names.remove('dates')
-
-        total_values = {}
-        # sum service cost
-        for service_name in list(filter(lambda i: i not in self.filtered_services, service_names)):
-            total_values[service_name] = round(services_cost_df[service_name].values.sum())
-
-        # sort services by cost
-        total_values = {k: v for k, v in sorted(total_values.items(), key=lambda item: item[1], reverse=True)}
-
-        # top services (5 and others)
-        top = {'others': 0}
-        for i, k in enumerate(total_values):
-            if i <= 5:
-                top[k] = total_values[k]
-            else:
-                top['others'] = top['others'] + total_values[k]
-
-        item_name = ReportItemName.SERVICES_TOP_COST.value
-        item_def: ItemDefinition = ItemDefinition(item_name,
-                                                  item_type=ItemType.PIE,
-                                                  x=list(top.keys()),
-                                                  y=[DataSeries('values', list(top.values()))],
-                                                  group=ReportItemGroup.CHARTS.value)
-        items_defs.append(item_def)
+        # services cost (optional, may be skipped when run deadline is reached)
+        if self.data_container.has(ReportItemName.SERVICES_COST.value):
+            self._add_services_items_defs(items_defs)
 
         # tags cost
         tag_items = self.data_container.get_by_group(ReportItemGroup.TAGS)
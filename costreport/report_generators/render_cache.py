@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import re
+import uuid
+from typing import Optional, Tuple
+
+import numpy as np
+
+from costreport.model import ItemDefinition
+from costreport.utils.cache_backends import DiskCacheBackend
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'charts'
+# bump when rendered divs change for same chart data and render settings
+RENDER_CACHE_VERSION = 1
+
+# cached divs store a placeholder instead of div id, so divs reused in the same report have unique ids
+_DIV_ID_PLACEHOLDER = '__chart_div_id__'
+_DIV_ID = re.compile(r'<div id="([^"]+)" class="plotly-graph-div"')
+
+
+class RenderCache:
+    """
+    rendered chart divs cache, shared by runs. divs are keyed by a hash of chart data (chart type, x values,
+    series names and values) and render settings, so only charts whose inputs changed are rendered.
+    entries are stored on disk, least recently used entries are evicted when size exceeds max size
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int, settings: Tuple):
+        """
+        :param directory: cache directory
+        :param max_size_bytes: cache size bound
+        :param settings: render settings affecting rendered divs (e.g. template, plotly version)
+        """
+        self.backend = DiskCacheBackend(directory, max_size_bytes)
+        self.settings = repr((RENDER_CACHE_VERSION,) + tuple(settings)).encode()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, chart_def: ItemDefinition) -> str:
+        digest = hashlib.sha256(self.settings)
+        digest.update(chart_def.chart_type.value.encode())
+        digest.update('\x1f'.join(map(str, chart_def.x)).encode())
+        for series in chart_def.y:
+            values = np.ascontiguousarray(series.values)
+            digest.update(f'\x1e{series.name}\x1f{values.dtype.str}\x1f'.encode())
+            digest.update(values.tobytes())
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(NAMESPACE, key)
+        except OSError as e:
+            logger.warning(f'failed to read rendered chart from render cache: {str(e)}')
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value.decode().replace(_DIV_ID_PLACEHOLDER, str(uuid.uuid4()))
+
+    def set(self, key: str, div: str):
+        match = _DIV_ID.search(div)
+        if match:
+            div = div.replace(match.group(1), _DIV_ID_PLACEHOLDER)
+
+        try:
+            self.backend.set(NAMESPACE, key, div.encode())
+        except OSError as e:
+            # report is rendered regardless, chart is rendered again by next run
+            logger.warning(f'failed to store rendered chart in render cache: {str(e)}')
@@ -0,0 +1,86 @@
+import logging
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from costreport.app_config import ReportVariant
+from costreport.data_container import DataContainer
+from costreport.utils.consts import ReportItemName, ReportItemGroup
+from costreport.utils.date_utils import get_days_back, get_months_back
+
+logger = logging.getLogger(__name__)
+
+
+def _slice(dataframe: pd.DataFrame, start_date: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    returns dataframe rows from start_date (inclusive) with 'dates' and given columns (all columns if None)
+    """
+    dataframe = dataframe[dataframe['dates'] >= start_date]
+    if columns is not None:
+        dataframe = dataframe[['dates'] + [c for c in dataframe.columns if c in columns]]
+
+    return dataframe.reset_index(drop=True)
+
+
+def _get_account_columns(variant: ReportVariant, accounts_names: Dict[str, str]) -> Optional[List[str]]:
+    """
+    returns accounts reports column names of variant accounts (None for all accounts)
+    """
+    if variant.accounts is None:
+        return None
+
+    return [accounts_names.get(a, a) for a in variant.accounts]
+
+
+def derive_data_container(source: DataContainer, variant: ReportVariant, accounts_names: Dict[str, str]) \
+        -> DataContainer:
+    """
+    returns variant data container derived from data collected for all variants.
+    variant time frames and tags are sliced from collected data and account reports are
+    limited to variant accounts. services, tags and forecast data are organization wide (not collected per account),
+    so they are not included in variants limited to accounts
+    :param source: collected data container
+    :param variant:
+    :param accounts_names: account id to name mapping
+    :return:
+    """
+    logger.info(f'deriving report variant {variant.name} data')
+    derived = DataContainer()
+    periods = variant.periods
+    account_columns = _get_account_columns(variant, accounts_names)
+
+    derived.add(ReportItemName.CURRENT_DATE.value, source.get_value(ReportItemName.CURRENT_DATE.value))
+
+    item_name = ReportItemName.DAILY_COST.value
+    derived.add(item_name, _slice(source.get_value(item_name),
+                                  get_days_back(periods.daily_report_days_back).isoformat(),
+                                  account_columns))
+    derived.add(ReportItemName.DAILY_TOTAL_COST.value, derived.aggregates(item_name).totals())
+
+    item_name = ReportItemName.MONTHLY_COST.value
+    derived.add(item_name, _slice(source.get_value(item_name),
+                                  get_months_back(periods.monthly_report_months_back).isoformat(),
+                                  account_columns))
+    derived.add(ReportItemName.MONTHLY_TOTAL_COST.value, derived.aggregates(item_name).totals())
+
+    if account_columns is not None:
+        logger.info(f'report variant {variant.name} is limited to accounts. '
+                    f'organization wide forecast, services and tags reports are not included')
+        return derived
+
+    item_name = ReportItemName.FORECAST.value
+    derived.add(item_name, source.get_value(item_name))
+
+    # services and tag reports are optional (may be skipped when run deadline is reached)
+    item_name = ReportItemName.SERVICES_COST.value
+    if source.has(item_name):
+        derived.add(item_name, _slice(source.get_value(item_name),
+                                      get_days_back(periods.services_report_days_back).isoformat()))
+
+    tags_start_date = get_days_back(periods.tags_report_days_back).isoformat()
+    for tag in variant.resource_tags:
+        item_name = f"'{tag}' Resources Cost"
+        if source.has(item_name):
+            derived.add(item_name, _slice(source.get_value(item_name), tags_start_date), ReportItemGroup.TAGS)
+
+    return derived
@@ -1,10 +1,89 @@
 import logging
 
-import boto3
 from botocore.exceptions import ClientError
 
 logger = logging.getLogger(__name__)
 
+# S3 minimal multipart upload part size (except for last part)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3ObjectWriter:
+    """
+    streams written content to S3 object using multipart upload.
+    content smaller than a single part is uploaded with a single put request
+    """
+
+    def __init__(self, client, bucket_name: str, object_name: str, part_size: int = 2 * MIN_PART_SIZE):
+        self._client = client
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self.failed = False
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(Bucket=self.bucket_name,
+                                                                   Key=self.object_name)['UploadId']
+
+        part_number = len(self._parts) + 1
+        response = self._client.upload_part(Bucket=self.bucket_name,
+                                            Key=self.object_name,
+                                            PartNumber=part_number,
+                                            UploadId=self._upload_id,
+                                            Body=bytes(self._buffer))
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self._buffer = bytearray()
+
+    def _fail(self, e: Exception):
+        logger.error(f'error uploading {self.object_name} to s3. error:{str(e)}')
+        self.failed = True
+        self.abort()
+
+    def write(self, data: bytes):
+        if self.failed:
+            return
+
+        self._buffer += data
+        if len(self._buffer) >= self.part_size:
+            try:
+                self._upload_part()
+            except ClientError as e:
+                self._fail(e)
+
+    def close(self):
+        if self.failed:
+            return
+
+        try:
+            if self._upload_id is None:
+                self._client.put_object(Bucket=self.bucket_name, Key=self.object_name, Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part()
+
+                self._client.complete_multipart_upload(Bucket=self.bucket_name,
+                                                       Key=self.object_name,
+                                                       UploadId=self._upload_id,
+                                                       MultipartUpload={'Parts': self._parts})
+        except ClientError as e:
+            self._fail(e)
+
+    def abort(self):
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            try:
+                self._client.abort_multipart_upload(Bucket=self.bucket_name,
+                                                    Key=self.object_name,
+                                                    UploadId=self._upload_id)
+            except ClientError as e:
+                logger.error(f'error aborting {self.object_name} s3 upload. error:{str(e)}')
+
+            self._upload_id = None
+
 
 class S3Client:
     """
@@ -14,17 +93,25 @@ class S3Client:
     def __init__(self,
                  region_name,
                  aws_access_key_id,
-                 aws_secret_access_key):
+                 aws_secret_access_key,
+                 client=None):
+        """
+        :param region_name:
+        :param aws_access_key_id:
+        :param aws_secret_access_key:
+        :param client: s3 client. created on first use by default
+        """
 
         self.region_name = region_name
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
-        self._client = None
+        self._client = client
         self._resource = None
 
     @property
     def client(self):
         if not self._client:
+            import boto3
             self._client = boto3.client(
                 's3',
                 region_name=self.region_name,
@@ -36,6 +123,7 @@ class S3Client:
     @property
     def resource(self):
         if not self._resource:
+            import boto3
             self._resource = boto3.resource(
                 's3',
                 region_name=self.region_name,
@@ -45,7 +133,8 @@ class S3Client:
         return self._resource
 
     def _is_bucket_exists(self, name) -> bool:
-        return self.resource.Bucket(name) in self.resource.buckets.all()
+        # client (unlike resource) may be shared between threads
+        return name in [b['Name'] for b in self.client.list_buckets()['Buckets']]
 
     def _create_bucket(self, name):
         logger.info(f'creating bucket {name}')
@@ -76,3 +165,14 @@ class S3Client:
             self.client.upload_file(file_name, bucket_name, object_name)
         except ClientError as e:
             logging.error(f'error loading file {file_name} to s3. error:{str(e)}')
+
+    def open_writer(self, bucket_name: str, object_name: str) -> S3ObjectWriter:
+        """
+        returns writer streaming content to S3 object
+        :param bucket_name: Bucket name to upload to
+        :param object_name: S3 object name
+        :return:
+        """
+
+        self._create_bucket_if_not_exists(bucket_name)
+        return S3ObjectWriter(self.client, bucket_name, object_name)
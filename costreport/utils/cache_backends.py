@@ -0,0 +1,314 @@
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Tuple
+
+from costreport.app_config import CacheConfig, CacheBackendType, ConfigurationException
+
+logger = logging.getLogger(__name__)
+
+# disk entries are prefixed with their expiry time (0 for entries that never expire)
+_EXPIRY_HEADER = struct.Struct('>d')
+
+# eviction frees space down to this fraction of the size bound
+EVICTION_TARGET_FACTOR = 0.9
+
+
+def _get_expires_at(ttl_seconds: Optional[float]) -> float:
+    return time.time() + ttl_seconds if ttl_seconds else 0.0
+
+
+class CacheBackend(ABC):
+    """
+    cache entries storage. entries are addressed by namespace (key class) and key
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        """
+        returns entry value. None if entry does not exist or expired
+        """
+        pass
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        """
+        stores entry (atomically). entries without ttl do not expire
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        pass
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    entries are stored as files under <directory>/<namespace>/<key>. files are written to a temporary file
+    and renamed, so readers never see partially written entries. when total size exceeds max size,
+    least recently used entries (by file modification time, updated on read) are evicted
+    """
+
+    def __init__(self, directory: str, max_size_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.directory, namespace, key)
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        path = self._path(namespace, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if len(data) < _EXPIRY_HEADER.size:
+            return None
+
+        expires_at = _EXPIRY_HEADER.unpack_from(data)[0]
+        if expires_at and expires_at < time.time():
+            self.delete(namespace, key)
+            return None
+
+        # mark entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return data[_EXPIRY_HEADER.size:]
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        path = self._path(namespace, key)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_EXPIRY_HEADER.pack(_get_expires_at(ttl_seconds)))
+            f.write(value)
+        os.replace(tmp_path, path)
+
+        if self.max_size_bytes:
+            with self._lock:
+                if self._size is None:
+                    self._size = self._get_size()
+                else:
+                    self._size += _EXPIRY_HEADER.size + len(value)
+
+                if self._size > self.max_size_bytes:
+                    self._evict()
+
+    def delete(self, namespace: str, key: str):
+        try:
+            os.remove(self._path(namespace, key))
+        except FileNotFoundError:
+            pass
+
+    def _get_entries(self):
+        for namespace in os.scandir(self.directory):
+            if namespace.is_dir():
+                for entry in os.scandir(namespace.path):
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        yield entry
+
+    def _get_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._get_entries())
+
+    def _evict(self):
+        # entries may be written by other processes sharing the directory, sizes are recalculated
+        entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._get_entries()))
+        self._size = sum(size for _, size, _ in entries)
+        target_size = self.max_size_bytes * EVICTION_TARGET_FACTOR
+        evicted = 0
+
+        for _, size, path in entries:
+            if self._size <= target_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            evicted += 1
+
+        logger.info(f'evicted {evicted} least recently used cache entries')
+
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    entries are stored in a sqlite database (WAL journal, may be shared by several processes on the same host).
+    when total size exceeds max size, least recently used entries are evicted
+    """
+
+    def __init__(self, path: str, max_size_bytes: Optional[int] = None):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                                 'namespace TEXT NOT NULL, '
+                                 'key TEXT NOT NULL, '
+                                 'value BLOB NOT NULL, '
+                                 'expires_at REAL NOT NULL, '
+                                 'accessed_at REAL NOT NULL, '
+                                 'PRIMARY KEY (namespace, key))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS cache_entries_accessed_at '
+                                 'ON cache_entries (accessed_at)')
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute('SELECT value, expires_at FROM cache_entries '
+                                           'WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            if not row:
+                return None
+
+            if row[1] and row[1] < now:
+                self._connection.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                                         (namespace, key))
+                return None
+
+            self._connection.execute('UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                                     (now, namespace, key))
+            return bytes(row[0])
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)',
+                                     (namespace, key, sqlite3.Binary(value), _get_expires_at(ttl_seconds),
+                                      time.time()))
+            if self.max_size_bytes:
+                if self._size is None:
+                    self._size = self._get_size()
+                else:
+                    self._size += len(value)
+
+                if self._size > self.max_size_bytes:
+                    self._evict()
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._connection.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def _get_size(self) -> int:
+        return self._connection.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries').fetchone()[0]
+
+    def _evict(self):
+        # entries may be written by other processes sharing the database, size is recalculated
+        size = self._get_size()
+        self._size = size
+        if size <= self.max_size_bytes:
+            return
+
+        target_size = self.max_size_bytes * EVICTION_TARGET_FACTOR
+        evicted = 0
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            for namespace, key, entry_size in self._connection.execute(
+                    'SELECT namespace, key, LENGTH(value) FROM cache_entries ORDER BY accessed_at').fetchall():
+                if size <= target_size:
+                    break
+                self._connection.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                                         (namespace, key))
+                size -= entry_size
+                evicted += 1
+            self._connection.execute('COMMIT')
+        except Exception:
+            self._connection.execute('ROLLBACK')
+            raise
+
+        self._size = size
+
+        logger.info(f'evicted {evicted} least recently used cache entries')
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    entries are stored in a redis compatible server, so the cache can be shared by reporters on several hosts.
+    expiry is set per entry. size bound and eviction are delegated to the server
+    (e.g. maxmemory with allkeys-lru policy). server errors are logged and handled as cache misses
+    """
+
+    def __init__(self, client, prefix: str = 'costreport'):
+        """
+        :param client: redis-py compatible client (get, set with px, delete)
+        :param prefix: keys prefix
+        """
+        self.client = client
+        self.prefix = prefix
+
+    @staticmethod
+    def from_url(url: str) -> 'RedisCacheBackend':
+        try:
+            import redis
+        except ImportError:
+            raise ConfigurationException('redis cache backend requires redis package (pip install redis)')
+
+        return RedisCacheBackend(redis.Redis.from_url(url))
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f'{self.prefix}:{namespace}:{key}'
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self._key(namespace, key))
+        except Exception as e:
+            logger.warning(f'could not get redis cache key {namespace}:{key}: {str(e)}')
+            return None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        # redis SET is atomic. expiry is set in milliseconds (sub second ttl would be truncated to an invalid 0 seconds)
+        px = max(1, int(ttl_seconds * 1000)) if ttl_seconds else None
+        try:
+            self.client.set(self._key(namespace, key), value, px=px)
+        except Exception as e:
+            logger.warning(f'could not set redis cache key {namespace}:{key}: {str(e)}')
+
+    def delete(self, namespace: str, key: str):
+        try:
+            self.client.delete(self._key(namespace, key))
+        except Exception as e:
+            logger.warning(f'could not delete redis cache key {namespace}:{key}: {str(e)}')
+
+
+_backends: Dict[Tuple, CacheBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_cache_backend(cache_config: CacheConfig) -> CacheBackend:
+    """
+    returns cache backend of configuration. backends are created once per process and shared
+    """
+    max_size_bytes = int(cache_config.max_size_mb * 1024 * 1024) if cache_config.max_size_mb else None
+    backend_key = (cache_config.backend, cache_config.directory, cache_config.url, max_size_bytes)
+
+    with _backends_lock:
+        if backend_key not in _backends:
+            if cache_config.backend == CacheBackendType.SQLITE.value:
+                backend = SqliteCacheBackend(os.path.join(cache_config.directory, 'cache.sqlite'), max_size_bytes)
+            elif cache_config.backend == CacheBackendType.REDIS.value:
+                backend = RedisCacheBackend.from_url(cache_config.url)
+            else:
+                backend = DiskCacheBackend(cache_config.directory, max_size_bytes)
+
+            logger.info(f'using {cache_config.backend} cache backend')
+            _backends[backend_key] = backend
+
+        return _backends[backend_key]
@@ -1,33 +1,146 @@
+import gzip
+import io
 import logging
-import os
+import struct
+import zlib
+from typing import Optional
 
-from costreport.app_config import AppConfig
-from costreport.utils.consts import CACHE_RESULTS_DIR
+from costreport.app_config import AppConfig, CacheCompression, ConfigurationException
+from costreport.utils.cache_backends import CacheBackend, get_cache_backend
 
 logger = logging.getLogger(__name__)
 
+# entry header: magic, entry format version, payload schema version, codec, checksum (crc32 of the value)
+_ENTRY_HEADER = struct.Struct('>4sBHBI')
+_ENTRY_MAGIC = b'CRCE'
+ENTRY_FORMAT_VERSION = 1
+# bump when cached values structure changes. entries of other schema versions are ignored
+CACHE_SCHEMA_VERSION = 1
+
+_CODECS = {CacheCompression.NONE.value: 0, CacheCompression.GZIP.value: 1, CacheCompression.ZSTD.value: 2}
+_ZSTD_LEVEL = 3
+
+
+class CacheEntryException(Exception):
+    pass
+
+
+def _get_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ConfigurationException('zstd cache compression requires zstandard package (pip install zstandard)')
+
+    return zstandard
+
+
+def _compress(codec: int, data: bytes) -> bytes:
+    if codec == _CODECS[CacheCompression.GZIP.value]:
+        # fixed header mtime, so entries of same value are identical (gzip.compress mtime requires python 3.8)
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as f:
+            f.write(data)
+        return buffer.getvalue()
+    if codec == _CODECS[CacheCompression.ZSTD.value]:
+        return _get_zstandard().ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+
+    return data
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == _CODECS[CacheCompression.GZIP.value]:
+        return gzip.decompress(data)
+    if codec == _CODECS[CacheCompression.ZSTD.value]:
+        return _get_zstandard().ZstdDecompressor().decompress(data)
+    if codec == _CODECS[CacheCompression.NONE.value]:
+        return data
+
+    raise CacheEntryException(f'unknown codec {codec}')
+
+
+def encode_entry(value: str, compression: str = CacheCompression.GZIP.value) -> bytes:
+    """
+    returns cache entry (header and compressed value) of value
+    :param value:
+    :param compression: none, gzip or zstd
+    :return:
+    """
+    data = value.encode('utf-8')
+    codec = _CODECS[compression]
+    header = _ENTRY_HEADER.pack(_ENTRY_MAGIC, ENTRY_FORMAT_VERSION, CACHE_SCHEMA_VERSION, codec, zlib.crc32(data))
+    return header + _compress(codec, data)
+
+
+def decode_entry(entry: bytes) -> str:
+    """
+    returns value of cache entry. raises CacheEntryException if entry is invalid, of another
+    format or schema version, or corrupted (checksum mismatch)
+    :param entry:
+    :return:
+    """
+    if len(entry) < _ENTRY_HEADER.size:
+        raise CacheEntryException('entry is too short')
+
+    magic, format_version, schema_version, codec, checksum = _ENTRY_HEADER.unpack_from(entry)
+    if magic != _ENTRY_MAGIC or format_version != ENTRY_FORMAT_VERSION:
+        raise CacheEntryException('unknown entry format')
+
+    if schema_version != CACHE_SCHEMA_VERSION:
+        raise CacheEntryException(f'entry schema version {schema_version} is outdated')
+
+    try:
+        data = _decompress(codec, entry[_ENTRY_HEADER.size:])
+    except (ConfigurationException, CacheEntryException):
+        raise
+    except Exception as e:
+        raise CacheEntryException(f'could not decompress entry: {str(e)}')
+
+    if zlib.crc32(data) != checksum:
+        raise CacheEntryException('entry checksum mismatch')
+
+    return data.decode('utf-8')
+
 
 class RawDateCacheManager:
-    def __init__(self, config: AppConfig, collector_name):
-        self.enabled = config.use_cache
-        self.collector_cache_dir = f'{CACHE_RESULTS_DIR}_{collector_name}'
+    def __init__(self, config: AppConfig, collector_name, enabled: bool = None, ttl_seconds: Optional[int] = None,
+                 backend: CacheBackend = None):
+        """
+        :param config:
+        :param collector_name: cache name (key class) entries are stored under
+        :param enabled: defaults to 'use_cache' configuration
+        :param ttl_seconds: default entries time to live (overridden by cache ttl_seconds configuration).
+        entries do not expire by default
+        :param backend: optional cache backend (e.g. a stand in). defaults to configured cache backend
+        """
+        self.enabled = config.use_cache if enabled is None else enabled
+        self.collector_name = collector_name
+        self.ttl_seconds = config.cache.ttl_seconds.get(collector_name, ttl_seconds)
+        self.compression = config.cache.compression
+        self.backend = backend or get_cache_backend(config.cache)
+
+        if self.compression == CacheCompression.ZSTD.value:
+            _get_zstandard()
 
         if self.enabled:
-            logger.info("cost client will use cached results")
-            if not os.path.exists(self.collector_cache_dir):
-                os.makedirs(self.collector_cache_dir)
+            logger.info(f"cost client will use cached results from {config.cache.backend} cache '{collector_name}'")
 
     def save(self, key: str, value: str):
         if self.enabled:
-            with open(f'{self.collector_cache_dir}/{key}', 'w') as f:
-                f.write(value)
+            self.backend.set(self.collector_name, key, encode_entry(value, self.compression), self.ttl_seconds)
 
     def get(self, key):
         cached_content = None
         try:
-            with open(f'{self.collector_cache_dir}/{key}', 'r') as f:
-                cached_content = f.read()
+            entry = self.backend.get(self.collector_name, key)
+            if entry is not None:
+                cached_content = decode_entry(entry)
+        except CacheEntryException as e:
+            logger.warning(f'discarding invalid cached key:{key}: {str(e)}')
+            self.delete(key)
         except Exception as e:
             logger.debug(f'could not load cached key:{key}: {str(e)}')
 
         return cached_content
+
+    def delete(self, key):
+        self.backend.delete(self.collector_name, key)
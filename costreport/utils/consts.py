@@ -7,10 +7,16 @@ AWS_SECRET_ACCESS_KEY = environ.get('AWS_SECRET_ACCESS_KEY', None)
 REGION_NAME = environ.get('REGION_NAME', None)
 
 LOGGING_LEVEL = environ.get("LOGGING_LEVEL", 'INFO')
+# profiling mode - cProfile stats, sampled stacks (flamegraph) and tracemalloc snapshots are written per run
+PROFILING = environ.get("PROFILING", 'false').lower() in ['true', '1', 'yes']
+PROFILING_DIR = environ.get("PROFILING_DIR", 'profiles')
+PROFILING_SAMPLE_INTERVAL = float(environ.get("PROFILING_SAMPLE_INTERVAL", '0.005'))
 CONFIGURATION_FILE = environ.get("CONFIGURATION_FILE", 'configuration.json')
 
 # TODO: should make configurable
 CACHE_RESULTS_DIR = '.cache'
+# should be set to a writable location in read only file systems (e.g. /tmp in serverless functions)
+RUN_LOCK_FILE = environ.get("RUN_LOCK_FILE", '.cost_report.lock')
 
 
 @unique
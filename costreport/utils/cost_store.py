@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import date
+from typing import Optional, Tuple, List
+
+import pandas as pd
+
+from costreport.utils.date_utils import split_time_period
+
+logger = logging.getLogger(__name__)
+
+LONG_FORMAT_COLUMNS = ['date', 'dimension', 'key', 'amount']
+
+_schema = None
+
+COVERAGE_FILE = 'coverage.json'
+
+
+def _get_schema():
+    """
+    returns stored rows arrow schema. pyarrow is imported on first store access (not on module import)
+    """
+    global _schema
+    if _schema is None:
+        import pyarrow as pa
+        _schema = pa.schema([('date', pa.string()),
+                             ('dimension', pa.string()),
+                             ('key', pa.string()),
+                             ('amount', pa.float64())])
+
+    return _schema
+
+
+def empty_long_format() -> pd.DataFrame:
+    return pd.DataFrame({'date': pd.Series([], dtype=object),
+                         'dimension': pd.Series([], dtype=object),
+                         'key': pd.Series([], dtype=object),
+                         'amount': pd.Series([], dtype=float)})
+
+
+class ColumnarCostStore:
+    """
+    persists long format cost rows (date, dimension, key, amount) as parquet files.
+    files are partitioned by month and dimension (group by key) under a directory per granularity and costs filter:
+        <directory>/<granularity>_<filter hash>/<YYYY-MM>/<dimension hash>.parquet
+    reads select the month / dimension files of the requested range and push date and dimension predicates
+    down to the parquet reader (memory mapped).
+    the continuous date range stored per dimension is kept in a coverage file
+    """
+
+    def __init__(self, directory: str, granularity: str, filtered_costs: List[str]):
+        filter_hash = hashlib.sha1(json.dumps(sorted(filtered_costs or [])).encode('utf-8')).hexdigest()[:12]
+        self.granularity = granularity
+        self.directory = os.path.join(directory, f'{granularity.lower()}_{filter_hash}')
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def _dimension_file_name(dimension: str) -> str:
+        return f'{hashlib.sha1(dimension.encode("utf-8")).hexdigest()[:16]}.parquet'
+
+    def _get_files(self, dimension: str, start: date, end: date) -> List[str]:
+        file_name = self._dimension_file_name(dimension)
+        paths = [os.path.join(self.directory, period_start.strftime('%Y-%m'), file_name)
+                 for period_start, _ in split_time_period(start.replace(day=1), end, 'MONTHLY')]
+        return [p for p in paths if os.path.exists(p)]
+
+    def _load_coverage(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, COVERAGE_FILE), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_coverage(self, coverage: dict):
+        file_name = os.path.join(self.directory, COVERAGE_FILE)
+        with open(f'{file_name}.tmp', 'w') as f:
+            json.dump(coverage, f)
+        os.replace(f'{file_name}.tmp', file_name)
+
+    def get_coverage(self, dimension: str) -> Optional[Tuple[date, date]]:
+        """
+        returns [start, end) date range stored for dimension. None if nothing is stored
+        :param dimension:
+        :return:
+        """
+        dimension_coverage = self._load_coverage().get(dimension)
+        if not dimension_coverage:
+            return None
+
+        return date.fromisoformat(dimension_coverage[0]), date.fromisoformat(dimension_coverage[1])
+
+    def read(self, dimension: str, start: date, end: date) -> pd.DataFrame:
+        """
+        returns stored long format rows of dimension in [start, end) date range
+        :param dimension:
+        :param start:
+        :param end:
+        :return:
+        """
+        files = self._get_files(dimension, start, end)
+        if not files:
+            return empty_long_format()
+
+        import pyarrow.parquet as pq
+        table = pq.read_table(files,
+                              schema=_get_schema(),
+                              filters=[('dimension', '=', dimension),
+                                       ('date', '>=', start.isoformat()),
+                                       ('date', '<', end.isoformat())],
+                              memory_map=True)
+        return table.to_pandas()
+
+    def write(self, dimension: str, start: date, end: date, rows: pd.DataFrame):
+        """
+        stores long format rows of dimension in [start, end) date range, replacing previously stored rows
+        of the range. dimension coverage is extended with the range
+        :param dimension:
+        :param start:
+        :param end:
+        :param rows: long format rows (rows out of range are ignored)
+        :return:
+        """
+        if start >= end:
+            return
+
+        rows = rows[(rows['date'] >= start.isoformat()) & (rows['date'] < end.isoformat())]
+        file_name = self._dimension_file_name(dimension)
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        with self._lock:
+            for month_start, month_end in split_time_period(start.replace(day=1), end, 'MONTHLY'):
+                month_dir = os.path.join(self.directory, month_start.strftime('%Y-%m'))
+                path = os.path.join(month_dir, file_name)
+                month_rows = rows[(rows['date'] >= month_start.isoformat()) & (rows['date'] < month_end.isoformat())]
+
+                if os.path.exists(path):
+                    existing = pq.read_table(path, schema=_get_schema()).to_pandas()
+                    # keep stored rows out of written range
+                    existing = existing[(existing['date'] < start.isoformat()) | (existing['date'] >= end.isoformat())]
+                    month_rows = pd.concat([existing, month_rows]).sort_values('date', kind='mergesort')
+
+                if month_rows.empty and not os.path.exists(path):
+                    continue
+
+                if not os.path.exists(month_dir):
+                    os.makedirs(month_dir)
+
+                table = pa.Table.from_pandas(month_rows[LONG_FORMAT_COLUMNS], schema=_get_schema(),
+                                             preserve_index=False)
+                pq.write_table(table, f'{path}.tmp')
+                os.replace(f'{path}.tmp', path)
+
+            coverage = self._load_coverage()
+            current = coverage.get(dimension)
+            if current and start.isoformat() <= current[1] and end.isoformat() >= current[0]:
+                # written range overlaps or touches stored range
+                coverage[dimension] = [min(start.isoformat(), current[0]), max(end.isoformat(), current[1])]
+            else:
+                coverage[dimension] = [start.isoformat(), end.isoformat()]
+
+            self._save_coverage(coverage)
+            logger.debug(f'stored {len(rows)} {dimension} rows from {start} to {end}')
@@ -1,5 +1,6 @@
 import datetime
 from datetime import date
+from typing import List, Tuple
 
 from dateutil.relativedelta import relativedelta
 
@@ -39,3 +40,26 @@ def get_months_back(number_of_months):
 
 def get_days_back(number_of_days):
     return get_today() - relativedelta(days=+number_of_days)
+
+
+def split_time_period(start: date, end: date, granularity: str) -> List[Tuple[date, date]]:
+    """
+    splits [start, end) time period into consecutive day or month periods.
+    returned periods keep their natural (unclipped) end date so last period may exceed 'end'
+    :param start:
+    :param end:
+    :param granularity: DAILY or MONTHLY
+    :return: list of (period start, period end) tuples
+    """
+    periods = []
+    period_start = start
+    while period_start < end:
+        if granularity == 'DAILY':
+            period_end = period_start + relativedelta(days=+1)
+        else:
+            period_end = period_start.replace(day=1) + relativedelta(months=+1)
+
+        periods.append((period_start, period_end))
+        period_start = period_end
+
+    return periods
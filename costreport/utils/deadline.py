@@ -0,0 +1,38 @@
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """
+    raised when a run deadline is reached (e.g. by requests still executing at the deadline)
+    """
+    pass
+
+
+class Deadline:
+    """
+    point in time (monotonic clock) a run should complete by
+    """
+
+    def __init__(self, seconds: float):
+        """
+        :param seconds: time from now until deadline
+        """
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """
+        returns seconds until deadline (0 if deadline passed)
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() == 0
+
+    def timeout(self, timeout: Optional[float] = None) -> float:
+        """
+        returns timeout bounded by deadline
+        :param timeout: requested timeout. defaults to time remaining until deadline
+        :return:
+        """
+        return self.remaining() if timeout is None else min(timeout, self.remaining())
@@ -0,0 +1,197 @@
+import contextvars
+import functools
+import logging
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Dict, Callable, List
+
+logger = logging.getLogger(__name__)
+
+# ru_maxrss is reported in kilobytes on linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _get_peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+def _get_cpu_time() -> float:
+    """
+    returns cpu time of the process (all threads). cpu time of other processes (render workers) is reported
+    by the processes (see record_cpu_time)
+    """
+    return time.process_time()
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.rss_growth_bytes = 0
+        self.api_calls = 0
+        self.pages = 0
+        self.bytes_downloaded = 0
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'wall_seconds': round(self.wall_seconds, 3),
+                'cpu_seconds': round(self.cpu_seconds, 3),
+                'peak_rss_bytes': self.peak_rss_bytes,
+                'rss_growth_bytes': self.rss_growth_bytes,
+                'api_calls': self.api_calls,
+                'pages': self.pages,
+                'bytes_downloaded': self.bytes_downloaded}
+
+
+class RunInstrumentation:
+    """
+    per stage resources usage of a report run:
+    - wall and cpu time (cpu time is process wide, plus cpu time reported by render worker processes)
+    - peak rss (process high water mark at stage end) and its growth during the stage
+    - API calls, result pages and response bytes of requests issued while the stage is executing
+    stages executed more than once in a run (e.g. per report variant, possibly concurrently) are summed
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self._open_stages: Dict[str, int] = {}
+        self._listeners: List[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, str], None]):
+        """
+        :param listener: called with stage name and event ('start' or 'end') on stage boundaries
+        :return:
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, name: str, event: str):
+        for listener in self._listeners:
+            try:
+                listener(name, event)
+            except Exception:
+                logger.exception(f'stage {name} {event} listener failed')
+
+    @contextmanager
+    def stage(self, name: str):
+        with self._lock:
+            self._open_stages[name] = self._open_stages.get(name, 0) + 1
+            stats = self.stages.setdefault(name, StageStats())
+
+        self._notify(name, 'start')
+        start_wall = time.perf_counter()
+        start_cpu = _get_cpu_time()
+        start_rss = _get_peak_rss()
+        try:
+            yield stats
+        finally:
+            end_rss = _get_peak_rss()
+            with self._lock:
+                stats.calls += 1
+                stats.wall_seconds += time.perf_counter() - start_wall
+                stats.cpu_seconds += _get_cpu_time() - start_cpu
+                stats.peak_rss_bytes = max(stats.peak_rss_bytes, end_rss)
+                stats.rss_growth_bytes += end_rss - start_rss
+
+                self._open_stages[name] -= 1
+                if not self._open_stages[name]:
+                    del self._open_stages[name]
+
+            self._notify(name, 'end')
+
+    def record_api_call(self, pages: int = 0, bytes_downloaded: int = 0, api_calls: int = 1):
+        """
+        adds API usage to all executing stages
+        """
+        with self._lock:
+            for name in self._open_stages:
+                stats = self.stages[name]
+                stats.api_calls += api_calls
+                stats.pages += pages
+                stats.bytes_downloaded += bytes_downloaded
+
+    def record_cpu_time(self, cpu_seconds: float):
+        """
+        adds cpu time of other processes (e.g. render workers) to all executing stages
+        """
+        with self._lock:
+            for name in self._open_stages:
+                self.stages[name].cpu_seconds += cpu_seconds
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self.stages.items()}
+
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar('current_run', default=None)
+
+
+@contextmanager
+def instrument_run(run: RunInstrumentation):
+    """
+    sets run as the instrumented run of the current context. stages of threads started by the run are
+    recorded to it when their tasks are submitted with context (see submit)
+    """
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def submit(pool: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """
+    submits fn to pool thread executor. fn is executed in a copy of the current context,
+    so its stages are recorded to the current instrumented run
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    records stage to current instrumented run. no op if no run is instrumented
+    """
+    run = _current_run.get()
+    if run is None:
+        yield None
+        return
+
+    with run.stage(name) as stats:
+        yield stats
+
+
+def instrumented(stage_name: str):
+    """
+    decorator recording function execution as a run stage
+    :param stage_name:
+    :return:
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_api_call(pages: int = 0, bytes_downloaded: int = 0, api_calls: int = 1):
+    run = _current_run.get()
+    if run is not None:
+        run.record_api_call(pages, bytes_downloaded, api_calls)
+
+
+def record_cpu_time(cpu_seconds: float):
+    run = _current_run.get()
+    if run is not None:
+        run.record_cpu_time(cpu_seconds)
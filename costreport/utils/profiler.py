@@ -0,0 +1,184 @@
+import argparse
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import List
+
+from costreport.utils.instrumentation import RunInstrumentation
+
+logger = logging.getLogger(__name__)
+
+# number of stack frames kept per traced memory allocation
+TRACEMALLOC_FRAMES = 10
+# number of top allocation differences printed by snapshots comparison
+TRACEMALLOC_TOP_STATS = 25
+
+
+class _ThreadProfiles:
+    """
+    cProfile profiles only the thread it is enabled on. a profile is enabled on every thread started
+    while profiling (fetch and report variant threads) and profiles are merged
+    """
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def start_thread_profile(self, frame, event, arg):
+        # called by the first profiling event of a new thread. the thread profile replaces this hook
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active (single profiler per process in newer python versions)
+            return
+
+        with self._lock:
+            self.profiles.append(profile)
+
+    def stats(self, main_profile: cProfile.Profile) -> pstats.Stats:
+        stats = pstats.Stats(main_profile)
+        with self._lock:
+            for profile in self.profiles:
+                try:
+                    stats.add(profile)
+                except (TypeError, ValueError):
+                    # profile of a thread which did not record any call
+                    pass
+
+        return stats
+
+
+class _StackSampler(threading.Thread):
+    """
+    samples stacks of all threads at a fixed interval. stacks are counted in collapsed format
+    (root first frames separated by ';'), which is the input of flamegraph tools (flamegraph.pl, speedscope)
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != self.ident:
+                    self.stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class RunProfiler:
+    """
+    profiles a report run. written files (<directory>/<run name>.*):
+    - .pstats - cProfile stats of all run threads (load with pstats or snakeviz)
+    - .collapsed - sampled stacks of all threads in collapsed format (render with flamegraph.pl or speedscope)
+    - _<n>_<stage>_<event>.tracemalloc - tracemalloc snapshot on every pipeline stage boundary
+      (load with tracemalloc.Snapshot.load, compare with compare_snapshots)
+    - .tracemalloc.txt - traced memory and its peak on every pipeline stage boundary
+    """
+
+    def __init__(self, directory: str, run_name: str, sample_interval: float):
+        self.directory = directory
+        self.run_name = run_name
+        self.sample_interval = sample_interval
+        self._profile = cProfile.Profile()
+        self._thread_profiles = _ThreadProfiles()
+        self._sampler = None
+        self._snapshot_lock = threading.Lock()
+        self._snapshots = 0
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f'{self.run_name}{suffix}')
+
+    def attach(self, instrumentation: RunInstrumentation):
+        """
+        takes tracemalloc snapshots on instrumented run stage boundaries
+        """
+        instrumentation.add_listener(self.on_stage)
+
+    def on_stage(self, stage_name: str, event: str):
+        # snapshots are only dumped. grouping traces (filter, statistics, comparison) takes seconds
+        # per snapshot and is left to compare_snapshots
+        with self._snapshot_lock:
+            self._snapshots += 1
+            tracemalloc.take_snapshot().dump(self._path(f'_{self._snapshots:02d}_{stage_name}_{event}.tracemalloc'))
+
+            with open(self._path('.tracemalloc.txt'), 'a') as f:
+                traced, peak = tracemalloc.get_traced_memory()
+                f.write(f'{self._snapshots:02d} {stage_name} {event} - '
+                        f'traced: {traced / 2 ** 20:.1f}MB peak: {peak / 2 ** 20:.1f}MB\n')
+
+    def __enter__(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        logger.info(f'profiling run {self.run_name} to {self.directory}')
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._sampler = _StackSampler(self.sample_interval)
+        self._sampler.start()
+        threading.setprofile(self._thread_profiles.start_thread_profile)
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._profile.disable()
+        threading.setprofile(None)
+        self._sampler.stop()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        self._thread_profiles.stats(self._profile).dump_stats(self._path('.pstats'))
+        with open(self._path('.collapsed'), 'w') as f:
+            for stack, count in self._sampler.stacks.items():
+                f.write(f'{stack} {count}\n')
+
+        logger.info(f'profiling results written to {self._path(".*")} in {time.perf_counter() - start:.1f} seconds')
+        return False
+
+
+def compare_snapshots(old_file: str, new_file: str, top: int = TRACEMALLOC_TOP_STATS) -> List[str]:
+    """
+    returns top allocation differences (by source line) between dumped tracemalloc snapshots.
+    allocations of profiling itself are excluded
+    :param old_file:
+    :param new_file:
+    :param top: number of differences
+    :return:
+    """
+    filters = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    old = tracemalloc.Snapshot.load(old_file).filter_traces(filters)
+    new = tracemalloc.Snapshot.load(new_file).filter_traces(filters)
+    return [str(stat) for stat in new.compare_to(old, 'lineno')[:top]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares tracemalloc snapshots of a profiled run')
+    parser.add_argument('old', help='older snapshot file')
+    parser.add_argument('new', help='newer snapshot file')
+    parser.add_argument('--top', type=int, default=TRACEMALLOC_TOP_STATS)
+    args = parser.parse_args()
+    print('\n'.join(compare_snapshots(args.old, args.new, args.top)))
@@ -0,0 +1,42 @@
+import fcntl
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RunLock:
+    """
+    non blocking lock guarding against concurrent report runs,
+    both within the process (threads) and between processes sharing the working directory (lock file)
+    """
+
+    def __init__(self, lock_file: str):
+        self.lock_file = lock_file
+        self._thread_lock = threading.Lock()
+        self._f = None
+
+    def acquire(self) -> bool:
+        """
+        returns True if lock was acquired, False if it is held by another run
+        :return:
+        """
+        if not self._thread_lock.acquire(blocking=False):
+            return False
+
+        f = open(self.lock_file, 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            self._thread_lock.release()
+            return False
+
+        self._f = f
+        return True
+
+    def release(self):
+        fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+        self._f = None
+        self._thread_lock.release()
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# number of latest runs kept in run history
+RUN_HISTORY_SIZE = 100
+
+PROMETHEUS_PREFIX = 'costreport'
+# (stage stats field, metric type, help)
+STAGE_METRICS = [('wall_seconds', 'gauge', 'wall time'),
+                 ('cpu_seconds', 'gauge', 'cpu time'),
+                 ('peak_rss_bytes', 'gauge', 'process peak rss at stage end'),
+                 ('api_calls', 'gauge', 'API calls'),
+                 ('pages', 'gauge', 'API result pages'),
+                 ('bytes_downloaded', 'gauge', 'API response bytes')]
+
+
+class RunMetrics:
+    """
+    report runs metrics of an executor
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.skipped_runs = 0
+        self.missed_ticks = 0
+        self.history = deque(maxlen=RUN_HISTORY_SIZE)
+
+    def add_run(self, start_time: datetime, duration_seconds: float, success: bool, stages: Dict[str, Dict] = None):
+        """
+        :param start_time:
+        :param duration_seconds:
+        :param success:
+        :param stages: run stages resources usage (see RunInstrumentation)
+        :return:
+        """
+        self.runs += 1
+        if not success:
+            self.failures += 1
+
+        self.history.append({'start_time': start_time.isoformat(),
+                             'duration_seconds': round(duration_seconds, 3),
+                             'success': success,
+                             'stages': stages or {}})
+
+    def to_dict(self):
+        return {'runs': self.runs,
+                'failures': self.failures,
+                'skipped_runs': self.skipped_runs,
+                'missed_ticks': self.missed_ticks,
+                'last_run': self.history[-1] if self.history else None,
+                'history': list(self.history)}
+
+    def export(self, file_name: str):
+        """
+        writes metrics as json file
+        :param file_name:
+        :return:
+        """
+        try:
+            with open(file_name, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2)
+        except OSError as e:
+            logger.error(f'error writing run metrics file {file_name}: {str(e)}')
+
+    def to_prometheus(self) -> str:
+        """
+        returns metrics in prometheus text exposition format
+        """
+        lines = []
+
+        def add(name, metric_type, help_text, samples):
+            lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}')
+            for labels, value in samples:
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{labels} {value}')
+
+        add('runs_total', 'counter', 'report runs', [('', self.runs)])
+        add('run_failures_total', 'counter', 'failed report runs', [('', self.failures)])
+        add('skipped_runs_total', 'counter', 'runs skipped while another run was in progress',
+            [('', self.skipped_runs)])
+        add('missed_ticks_total', 'counter', 'scheduled times passed while a run was executing',
+            [('', self.missed_ticks)])
+
+        last_run = self.history[-1] if self.history else None
+        if last_run:
+            add('last_run_timestamp_seconds', 'gauge', 'last run start time',
+                [('', datetime.fromisoformat(last_run['start_time']).timestamp())])
+            add('last_run_duration_seconds', 'gauge', 'last run duration', [('', last_run['duration_seconds'])])
+            add('last_run_success', 'gauge', 'whether last run succeeded', [('', int(last_run['success']))])
+
+            stages = last_run['stages']
+            for field, metric_type, help_text in STAGE_METRICS:
+                add(f'stage_{field}', metric_type, f'last run stage {help_text}',
+                    [(f'{{stage="{name}"}}', stats[field]) for name, stats in stages.items()])
+
+        return '\n'.join(lines) + '\n'
+
+    def export_prometheus(self, file_name: str):
+        """
+        writes metrics as prometheus text file (e.g. for node exporter textfile collector).
+        file is replaced atomically
+        :param file_name:
+        :return:
+        """
+        try:
+            with open(f'{file_name}.tmp', 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(f'{file_name}.tmp', file_name)
+        except OSError as e:
+            logger.error(f'error writing prometheus metrics file {file_name}: {str(e)}')
@@ -1,8 +1,8 @@
+import argparse
 import logging
 
-from costreport.app_config import AppConfig
+from costreport.app_config import AppConfig, ConfigurationException
 from costreport.utils.consts import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, REGION_NAME
-from costreport.executors import ScheduledExecutor, SingleExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -29,11 +29,57 @@ def validate_env_variables():
     return valid
 
 
+def validate_schedule(schedule: str) -> bool:
+    # imported here so executions without schedule do not load croniter
+    import croniter
+
+    if not croniter.croniter.is_valid(schedule):
+        logger.error(f'invalid schedule cron expression: {schedule}')
+        return False
+
+    return True
+
+
+def load_config():
+    """
+    returns loaded application configuration or None if configuration is invalid
+    :return:
+    """
+    try:
+        config = AppConfig()
+    except ConfigurationException as e:
+        logger.error(f'invalid configuration: {str(e)}')
+        return None
+
+    if config.schedule and not validate_schedule(config.schedule):
+        return None
+
+    return config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='AWS cost report')
+    parser.add_argument('--validate', action='store_true',
+                        help='validate environment variables and configuration and exit (reports are not generated)')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
+    args = parse_args()
+
     if not validate_env_variables():
         exit(1)
 
-    config = AppConfig()
+    config = load_config()
+    if not config:
+        exit(1)
+
+    if args.validate:
+        print('configuration is valid')
+        exit(0)
+
+    # executors (and report pipeline dependencies: boto3, pandas...) are imported after validation
+    from costreport.executors import ScheduledExecutor, SingleExecutor
 
     if config.schedule:
         executor = ScheduledExecutor(config)